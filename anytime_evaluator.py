@@ -0,0 +1,211 @@
+# anytime_evaluator.py
+
+"""
+限时开奖决策模块（anytime evaluation）：
+按保真度由低到高逐级计算结构指标，任何时刻都持有一个可用的“当前最优”开奖结构，
+在给定时延预算内返回，并记录实际达到的保真度。
+
+保真度等级：
+0. aggregate：仅用区域总额的结构派奖表（O(结构数)），选全场 RTP 最接近水池目标 RTP 的结构
+1. std：加权 RTP 标准差 + 置信区间，按 select_structure 规则选择（不含记忆态势）
+2. memory：再叠加记忆态势效果，与常规 finalize_outcome 的决策完全一致
+
+预算作用在开奖前的延迟敏感路径上：本局下注全部落定后的最后一次结构评估
+（下注阶段最后一拍 / 无界面一次性落定后）按预算逐级评估，开奖时在其缓存基础上补算并选择；
+下注阶段中间各拍仍做完整评估（页面展示），同时为各等级提供预算外的实测耗时。
+
+每一级开始前判断剩余时间是否足够：平滑估计与最近一次实测都不超过剩余时间才启动，
+未实测的等级视为来不及。单个等级一旦开始不会被中断，因此预算保证依赖实测耗时；
+从未实测或长期被跳过的等级在开奖结构确定后补测（calibrate），不占决策预算。
+"""
+
+import math
+import time
+from typing import Dict, List, Optional
+from config import WINNING_STRUCTURES
+from strategy import select_structure
+from score_engine import merge_memory_effects
+
+FIDELITY_LEVELS = ("aggregate", "std", "memory")
+
+# 平台最多亏一倍的限制（与 select_structure 一致）
+MAX_STRUCTURE_RTP = 2
+
+
+def select_by_aggregate_rtp(payout_table: Dict, rtp_target: float) -> Dict:
+    """
+    第 0 级决策：在全场 RTP 不超过上限的结构中选最接近 rtp_target 的；
+    若全部超限，则选全场 RTP 最小的结构。
+    """
+    rtps = payout_table["rtp"]
+    candidates = [s for s in range(len(WINNING_STRUCTURES)) if rtps[s] <= MAX_STRUCTURE_RTP]
+    if candidates:
+        best = min(candidates, key=lambda s: abs(rtps[s] - rtp_target))
+    else:
+        best = min(range(len(WINNING_STRUCTURES)), key=lambda s: rtps[s])
+    return aggregate_results(payout_table)[best]
+
+
+def aggregate_results(payout_table: Dict) -> List[Dict]:
+    """第 0 级结构指标：尚无 STD，std 记为 NaN"""
+    return [
+        {
+            "winning_areas": list(structure["areas"]),
+            "std": math.nan,
+            "weight": structure["weight"],
+            "within_confidence": False,
+            "aggregate_rtp": float(payout_table["rtp"][s])
+        }
+        for s, structure in enumerate(WINNING_STRUCTURES)
+    ]
+
+
+class AnytimeEvaluator:
+    """
+    持有各保真度等级的耗时估计（跨局保留），按预算逐级评估。
+    - 未实测的等级估计为无穷大：不会在预算内贸然启动
+    - 某等级只有在平滑估计与最近一次实测都不超过剩余时间时才启动；被跳过不会调低估计
+    - 实测来源：预算外的完整评估（下注阶段中间各拍，见 GameRoundController.evaluate_structures）、
+      预算内实际执行的等级，以及 calibrate()（开奖结构已确定后补测未实测 / 长期跳过的等级）
+    """
+
+    def __init__(self, smoothing: float = 0.3, recalibrate_every: int = 50):
+        self.smoothing = smoothing
+        self.recalibrate_every = recalibrate_every
+        self.cost_estimates_ms: Dict[str, float] = {level: math.inf for level in FIDELITY_LEVELS[1:]}
+        self.last_cost_ms: Dict[str, float] = {level: math.inf for level in FIDELITY_LEVELS[1:]}
+        self.skips: Dict[str, int] = {level: 0 for level in FIDELITY_LEVELS[1:]}
+
+    def __setstate__(self, state):
+        # 兼容旧检查点：旧版只有平滑估计，未实测的等级估计为 0
+        self.__dict__.update(state)
+        self.__dict__.setdefault("recalibrate_every", 50)
+        self.__dict__.setdefault("last_cost_ms", {level: math.inf for level in FIDELITY_LEVELS[1:]})
+        self.__dict__.setdefault("skips", {level: 0 for level in FIDELITY_LEVELS[1:]})
+        self.cost_estimates_ms = {
+            level: estimate if estimate > 0 else math.inf for level, estimate in self.cost_estimates_ms.items()
+        }
+        self.__dict__.pop("skip_decay", None)
+
+    def observe(self, level: str, elapsed_ms: float):
+        """记录一次实测耗时（预算内外均可）"""
+        previous = self.cost_estimates_ms[level]
+        self.cost_estimates_ms[level] = elapsed_ms if math.isinf(previous) else (
+            self.smoothing * elapsed_ms + (1 - self.smoothing) * previous
+        )
+        self.last_cost_ms[level] = elapsed_ms
+        self.skips[level] = 0
+
+    def _can_afford(self, level: str, start: float, budget_ms: float) -> bool:
+        remaining_ms = budget_ms - (time.perf_counter() - start) * 1000
+        if max(self.cost_estimates_ms[level], self.last_cost_ms[level]) <= remaining_ms:
+            return True
+        self.skips[level] += 1
+        return False
+
+    def _fresh_cache(self, controller) -> Optional[Dict]:
+        """
+        已按当前下注簿算好的结构指标：与当前下注簿版本一致时可直接作为起点，
+        否则（有新下注落定、无下注簿）返回 None。
+        """
+        cache = controller.state.get("structure_result_cache")
+        version = controller.bet_book_version()
+        if cache is None or version is None or cache.get("bet_version") != version:
+            return None
+        return dict(cache, fidelity=cache.get("fidelity", FIDELITY_LEVELS[-1]))
+
+    def evaluate(self, controller, budget_ms: float) -> Dict:
+        """
+        在预算内把 state["structure_result_cache"] 推进到尽可能高的保真度。
+        缓存与当前下注簿一致时从缓存的保真度起步，只补算更高的等级，且缓存上已记录的限时评估耗时
+        （elapsed_ms，最后一拍的评估）计入本次预算；否则从第 0 级算起。
+        返回 {"fidelity", "elapsed_ms", "levels": [{"level", "elapsed_ms", "cached"}]}
+        """
+        levels = []
+
+        def mark(level: str, level_start: float) -> float:
+            elapsed_ms = (time.perf_counter() - level_start) * 1000
+            levels.append({"level": level, "elapsed_ms": elapsed_ms, "cached": False})
+            return elapsed_ms
+
+        cache = self._fresh_cache(controller)
+        start = time.perf_counter() - (cache.get("elapsed_ms", 0.0) if cache is not None else 0.0) / 1000
+        if cache is not None:
+            levels.append({"level": cache["fidelity"], "elapsed_ms": 0.0, "cached": True})
+        else:
+            # --- 第 0 级：区域总额 → 结构派奖表 ---
+            level_start = time.perf_counter()
+            payout_table = controller.compute_payout_table()
+            cache = {
+                "all_structures": aggregate_results(payout_table),
+                "std_analysis": [],
+                "std_bounds": (0.0, 0.0),
+                "sample_size": 0,
+                "payout_table": payout_table,
+                "bet_version": controller.bet_book_version(),
+                "fidelity": "aggregate"
+            }
+            mark("aggregate", level_start)
+
+        # --- 第 1 级：加权 STD + 置信区间 ---
+        if cache["fidelity"] == "aggregate" and self._can_afford("std", start, budget_ms):
+            level_start = time.perf_counter()
+            _, results, std_analysis_data, std_bounds, sample_size = controller.compute_structure_metrics(cache["payout_table"])
+            cache.update(all_structures=results, std_analysis=std_analysis_data, std_bounds=std_bounds, sample_size=sample_size, fidelity="std")
+            self.observe("std", mark("std", level_start))
+
+        # --- 第 2 级：记忆态势 ---
+        if cache["fidelity"] == "std" and self._can_afford("memory", start, budget_ms):
+            level_start = time.perf_counter()
+            merge_memory_effects(cache["all_structures"], controller.compute_memory_effects())
+            cache["fidelity"] = "memory"
+            self.observe("memory", mark("memory", level_start))
+
+        cache["elapsed_ms"] = (time.perf_counter() - start) * 1000
+        controller.state["structure_result_cache"] = cache
+        return {"fidelity": cache["fidelity"], "elapsed_ms": cache["elapsed_ms"], "levels": levels}
+
+    def decide(self, controller, rtp_target: float, budget_ms: float) -> Dict:
+        """
+        在 budget_ms 内给出开奖结构：先按 evaluate() 补算缓存，再按达到的保真度选择。
+        返回决策信息：{"outcome", "fidelity", "elapsed_ms", "budget_ms", "levels"}，
+        elapsed_ms 含最后一拍限时评估已用的时间与选择耗时
+        """
+        info = self.evaluate(controller, budget_ms)
+        start = time.perf_counter()
+        cache = controller.state["structure_result_cache"]
+        if cache["fidelity"] == "aggregate":
+            outcome = select_by_aggregate_rtp(cache["payout_table"], rtp_target)
+        else:
+            outcome = select_structure(
+                cache["all_structures"],
+                controller.state["current_bets"],
+                std_bounds=cache["std_bounds"],
+                base_std=rtp_target,
+                payout_table=cache["payout_table"]
+            )
+        return {
+            "outcome": outcome,
+            "fidelity": info["fidelity"],
+            "elapsed_ms": info["elapsed_ms"] + (time.perf_counter() - start) * 1000,
+            "budget_ms": budget_ms,
+            "levels": info["levels"]
+        }
+
+    def calibrate(self, controller):
+        """
+        开奖结构确定后（不计入决策预算）补测从未实测、或已连续跳过 recalibrate_every 次的等级耗时，
+        使估计能跟上下注规模的变化。只计时，不改动结构指标缓存。
+        """
+        stale = [
+            level for level in FIDELITY_LEVELS[1:]
+            if math.isinf(self.last_cost_ms[level]) or self.skips[level] >= self.recalibrate_every
+        ]
+        if not stale:
+            return
+        level_start = time.perf_counter()
+        _, results, _, _, _ = controller.compute_structure_metrics()
+        self.observe("std", (time.perf_counter() - level_start) * 1000)
+        level_start = time.perf_counter()
+        merge_memory_effects(results, controller.compute_memory_effects())
+        self.observe("memory", (time.perf_counter() - level_start) * 1000)
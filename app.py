@@ -2,46 +2,74 @@ import streamlit as st
 import pandas as pd
 import time
 from state_manager import initialize_session_state, ensure_param_defaults
-from game_round_controller import GameRoundController
+from game_round_controller import GameRoundController, build_visual_context
 from ui_components import (
     render_sidebar, render_bet_bar_chart, render_recommended_structures,
-    render_final_structure, render_structure_table, render_player_detail_table, render_final_outcome_reason
+    render_final_structure, render_structure_table, render_player_detail_table, render_final_outcome_reason,
+    render_profiler_panel, render_table_server_panel
 )
-from ui_actions import handle_new_round
-from player_profiles import initialize_players, PlayerStats
+from ui_actions import handle_new_round, handle_import_next, restart_import, sync_background_engine, sync_engine_params, get_table_manager
 from config import ROUND_TOTAL_DURATION
 
 # 初始化 session 状态（含玩家、数据结构等）
 initialize_session_state()
 ensure_param_defaults()
 
-if "sim_players" not in st.session_state:
-    st.session_state.sim_players = initialize_players()
-if "stat_players" not in st.session_state:
-    st.session_state.stat_players = {pid: PlayerStats() for pid in st.session_state.sim_players.keys()}
+# ✅ 后台引擎模式：对局状态由工作线程独占推进，页面只读取最新快照（view）渲染
+background_mode = st.sidebar.checkbox("🧵 后台引擎模式", key="background_engine")
+engine = sync_background_engine(background_mode)
+
+# ✅ 多桌服务：选择桌号后以观战者身份接入该桌引擎（参数以服务端为准）
+attached_table = render_table_server_panel(get_table_manager())
+if attached_table is not None:
+    engine = get_table_manager().table(attached_table).engine
+view = engine.latest_snapshot() if engine is not None else st.session_state
 
 # 下注玩家数量统计
-betting_players = len([b for b in st.session_state.current_bets.values() if b])
+betting_players = len([b for b in view["current_bets"].values() if b])
 
 # 渲染侧边栏 + 参数设置与控制按钮
 simulate, import_next, uploaded_file, confidence, debug_speed = render_sidebar(
-    round_id=st.session_state.round_id,
+    round_id=view["round_id"],
     online_count=st.session_state.online_base,
     betting_players=betting_players,
-    countdown_bet=st.session_state.countdown_bet,
-    countdown_result=st.session_state.countdown_result,
-    time_to_next_round=st.session_state.time_to_next_round,
+    countdown_bet=view["countdown_bet"],
+    countdown_result=view["countdown_result"],
+    time_to_next_round=view["time_to_next_round"],
     debug_speed=st.session_state.debug_speed,
-    std_bounds=st.session_state.structure_result_cache["std_bounds"] if st.session_state.structure_result_cache else None
+    std_bounds=view["structure_result_cache"]["std_bounds"] if view["structure_result_cache"] else None,
+    pool_info=(view["pool_value"], view["rtp_target"]) if engine is not None else None,
+    read_only=attached_table is not None,
+    on_import_restart=restart_import
 )
 
-if simulate:
-    st.session_state.final_outcome = None
-    st.session_state.structure_result_cache = None
-    st.session_state.current_bets = {}
-    handle_new_round()
-    st.session_state._trigger_manual = True
-    st.session_state._trigger_manual = True
+render_profiler_panel(st.session_state.profiler)
+if st.session_state.get("snapshot_notice"):
+    st.sidebar.info(st.session_state.snapshot_notice)
+
+if engine is not None:
+    if attached_table is None:
+        sync_engine_params(engine, view)
+    if engine.error is not None:
+        st.sidebar.error(f"后台引擎异常：{engine.error!r}")
+    elif not background_mode and attached_table is None:
+        st.sidebar.warning("后台引擎正在停止，本拍结束后交还对局状态")
+
+if simulate and attached_table is None:
+    # ✅ 观战桌只读：开新局会中断服务端正在进行的对局
+    if engine is not None:
+        engine.new_round()
+    else:
+        st.session_state.final_outcome = None
+        st.session_state.structure_result_cache = None
+        st.session_state.current_bets = {}
+        handle_new_round()
+        st.session_state._trigger_manual = True
+        st.session_state._trigger_manual = True
+elif import_next and uploaded_file is not None and attached_table is None:
+    # ✅ 回放导入的生产局：逐局读取，下一局已由后台线程预读
+    if handle_import_next(uploaded_file, engine) and engine is None:
+        st.session_state._trigger_manual = True
 
 # 页面主体布局
 st.markdown("""
@@ -55,14 +83,13 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 left_col, right_col = st.columns([3, 4])
-controller = GameRoundController(st.session_state)
-visual = controller.get_visual_context() if st.session_state.structure_result_cache else {}
+visual = build_visual_context(view) if view["structure_result_cache"] else {}
 
 with left_col:
     total_bet_amt = sum(
-        sum(bets.values()) for bets in st.session_state.current_bets.values()
+        sum(bets.values()) for bets in view["current_bets"].values()
     )
-    if st.session_state.time_to_next_round < ROUND_TOTAL_DURATION and total_bet_amt > 0:
+    if view["time_to_next_round"] < ROUND_TOTAL_DURATION and total_bet_amt > 0:
         render_bet_bar_chart(
             visual["structure_sums"],
             visual["highlight_areas"],
@@ -70,41 +97,55 @@ with left_col:
         )
 
     with st.container():
-        if st.session_state.final_outcome:
+        if view["final_outcome"]:
             render_final_structure(
-                st.session_state.final_outcome,
-                st.session_state.forced_outcome is not None
+                view["final_outcome"],
+                view["forced_outcome"] is not None
             )
-        elif st.session_state.structure_result_cache:
-            recommended = [r["winning_areas"] for r in st.session_state.structure_result_cache["all_structures"] if r.get("within_confidence")]
+        elif view["structure_result_cache"]:
+            recommended = [r["winning_areas"] for r in view["structure_result_cache"]["all_structures"] if r.get("within_confidence")]
             render_recommended_structures(recommended)
 
-        if st.session_state.structure_result_cache:
+        if view["structure_result_cache"]:
             render_final_outcome_reason(
-                st.session_state.final_outcome,
-                st.session_state.structure_result_cache["all_structures"],
-                st.session_state.structure_result_cache["std_bounds"]
+                view["final_outcome"],
+                view["structure_result_cache"]["all_structures"],
+                view["structure_result_cache"]["std_bounds"]
             )
 
-    structure_data = st.session_state.structure_result_cache or {}
+    structure_data = view["structure_result_cache"] or {}
     table_df = pd.DataFrame(structure_data.get("all_structures", []))
     if not table_df.empty:
         render_structure_table(
             table_df,
-            st.session_state.current_bets,
-            st.session_state.forced_outcome,
-            st.session_state.time_to_next_round
+            view["current_bets"],
+            view["forced_outcome"],
+            view["time_to_next_round"],
+            payout_table=structure_data.get("payout_table"),
+            # ✅ 观战桌只读：不下发强控（与 sync_engine_params 一致）
+            on_force=engine.set_forced_outcome if engine is not None and attached_table is None else None,
+            allow_force=attached_table is None
         )
 
 with right_col:
-    if st.session_state.time_to_next_round < ROUND_TOTAL_DURATION:
-        if st.session_state.current_bets:
-            render_player_detail_table(
-                st.session_state.current_bets,
-                st.session_state.stat_players
-            )
+    if view["time_to_next_round"] < ROUND_TOTAL_DURATION:
+        if view["current_bets"]:
+            with st.session_state.profiler.stage("render_player_detail_table", view):
+                render_player_detail_table(
+                    view["current_bets"],
+                    view["stat_players"],
+                    player_recharges=view["player_recharges"] if engine is not None else None
+                )
+
+# ✅ 后台引擎模式：页面只按倍速节奏刷新快照，不推进对局
+if engine is not None:
+    if view["running"] or view["auto_simulate"]:
+        time.sleep(1.0 / st.session_state.debug_speed)
+        st.rerun()
+    st.stop()
 
 # ✅ 自动推进控制器
+controller = GameRoundController(st.session_state)
 manual_triggered = st.session_state.pop("_trigger_manual", False)
 
 # ✅ 1. 当前是运行中，继续推进
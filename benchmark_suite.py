@@ -0,0 +1,394 @@
+# benchmark_suite.py
+
+"""
+控奖策略热路径基准测试：
+- 用 initialize_players 构建 200 / 2k / 20k / 200k 人的合成玩家群
+- 通过 log_player_detail 预填不同深度的历史记录（影响记忆态势计算）
+- 分别计时 initialize_players、simulate_structure_metrics、simulate_structure_memory_effect、select_structure、
+  generate_bets（逐玩家版 / 向量化版 / 稀疏参与状态版）、log_player_detail，以及完整的 evaluate_structures 一次 tick
+- 输出 ops/sec、p50 / p99 延迟与峰值内存，结果保存为 JSON，可与历史结果对比发现回归
+- 冷启动导入预算：在全新解释器中逐个导入核心模块计时，并检查未加载 scipy / pandas / streamlit 等重型依赖
+- 快照续跑一致性：命令行“先跑 N 局写快照 → 新状态从快照恢复续跑”与同种子一次跑完的终局状态逐项相同
+
+命令行用法：
+    python benchmark_suite.py --output bench.json
+    python benchmark_suite.py --sizes 200 2000 --depths 0 30 --compare bench.json
+    python benchmark_suite.py --imports
+    python benchmark_suite.py --snapshot-resume
+"""
+
+import argparse
+import contextlib
+import copy
+import gc
+import io
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from config import PAYOUT_RATES, STD_THRESHOLD
+from betting_input import ActivityTracker, generate_bets, generate_bets_vectorized
+from player_profiles import initialize_players
+from score_engine import simulate_structure_metrics, simulate_structure_memory_effect
+from strategy import select_structure
+from game_round_controller import GameRoundController
+from headless_runner import create_headless_state
+import headless_runner
+import db_logger
+import metrics_engine
+from metrics_engine import reset_memory_attitude_cache, update_memory_attitude
+
+DEFAULT_SIZES = [200, 2_000, 20_000, 200_000]
+DEFAULT_DEPTHS = [0, 10, 30]
+
+# 冷启动导入预算：模块 → 全新解释器中单独导入的耗时上限（毫秒，含 numpy 自身约 100ms）
+IMPORT_BUDGET_MS = {
+    "metrics_engine": 300,
+    "score_engine": 300,
+    "strategy": 300,
+    "platform_pool": 300,
+    "game_round_controller": 400,
+    "headless_runner": 400,
+    "round_engine": 400,
+    "table_manager": 500,
+}
+# 核心引擎与无界面运行不应加载的重型依赖（仅页面 / 导入导出在使用时加载）
+HEAVY_MODULES = ("scipy", "pandas", "streamlit", "altair", "pyarrow")
+
+_IMPORT_PROBE = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "import {module}\n"
+    "elapsed = (time.perf_counter() - start) * 1000\n"
+    "print(elapsed, ','.join(m for m in {heavy!r} if m in sys.modules))"
+)
+
+
+def time_stage(fn: Callable[[], object], repeat: int, *, setup: Optional[Callable[[], None]] = None) -> Dict[str, float]:
+    """
+    计时一个阶段：先热身一次，再计时 repeat 次；最后单独在 tracemalloc 下运行一次取峰值内存。
+    setup 在每次调用前执行且不计时（用于恢复被修改的状态）。
+    """
+    if setup:
+        setup()
+    fn()
+
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        gc.disable()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+        gc.enable()
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples_ms = np.array(samples) * 1000
+    mean_ms = float(samples_ms.mean())
+    return {
+        "repeat": repeat,
+        "ops_per_sec": 1000 / mean_ms if mean_ms > 0 else float("inf"),
+        "mean_ms": mean_ms,
+        "p50_ms": float(np.percentile(samples_ms, 50)),
+        "p99_ms": float(np.percentile(samples_ms, 99)),
+        "peak_memory_kb": peak / 1024,
+    }
+
+
+def measure_import(module: str, repeat: int = 3) -> Dict:
+    """在全新解释器中导入 module，取 repeat 次中的最短耗时，并记录被加载的重型依赖"""
+    samples, heavy = [], []
+    for _ in range(repeat):
+        output = subprocess.check_output(
+            [sys.executable, "-c", _IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)], text=True
+        ).split()
+        samples.append(float(output[0]))
+        heavy = output[1].split(",") if len(output) > 1 else []
+    return {"module": module, "import_ms": min(samples), "heavy_modules": heavy}
+
+
+def check_import_budget(budget: Optional[Dict[str, float]] = None, repeat: int = 3) -> List[Dict]:
+    rows = []
+    for module, limit_ms in (budget or IMPORT_BUDGET_MS).items():
+        row = measure_import(module, repeat)
+        row["budget_ms"] = limit_ms
+        row["ok"] = row["import_ms"] <= limit_ms and not row["heavy_modules"]
+        rows.append(row)
+    return rows
+
+
+def _final_state_summary(state: Dict) -> Dict:
+    db_logger.expand_player_index()
+    metrics_engine.expand_memory_attitude()
+    stat_players, sim_players = state["stat_players"], state["sim_players"]
+    size = len(stat_players)
+    return {
+        "round_id": state["round_id"],
+        "pool_value": state["platform_pool"].get_pool_value(),
+        "pool_history": float(state["platform_pool"].get_round_history()["pool_value"].sum()),
+        "players": size,
+        "total_bet": float(stat_players.total_bet[:size].sum()),
+        "total_return": float(stat_players.total_return[:size].sum()),
+        "active": int(sim_players.is_active.sum()),
+        "missed": int(sim_players.consecutive_missed.sum()),
+        "memory_attitude": round(sum(m["attitude"] for m in metrics_engine.memory_attitude_cache.values()), 9),
+        "player_index": sum(len(records) for records in db_logger.player_recent_log.values()),
+    }
+
+
+def check_snapshot_resume(rounds: int = 60, split: int = 33, players: int = 300, seed: int = 7) -> List[Dict]:
+    """
+    走 headless_runner 命令行：一次跑完 rounds 局，与“跑 split 局写快照 → 恢复后续跑其余局”比较终局状态。
+    同时比较带 / 不带 --snapshot-dir 的同种子运行（快照不得改变随机序列）。返回逐项比较结果。
+    """
+    def run(*extra):
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = headless_runner.main(["--players", str(players), *extra])
+        return _final_state_summary(report["state"])
+
+    with tempfile.TemporaryDirectory() as directory:
+        plain = run("--rounds", str(rounds), "--seed", str(seed))
+        uninterrupted = run("--rounds", str(rounds), "--seed", str(seed), "--snapshot-dir", f"{directory}/full")
+        run("--rounds", str(split), "--seed", str(seed), "--snapshot-dir", f"{directory}/split")
+        resumed = run("--rounds", str(rounds - split), "--snapshot-dir", f"{directory}/split", "--resume")
+    return [
+        {"field": field, "expected": plain[field], "snapshot": uninterrupted[field], "resumed": resumed[field],
+         "ok": plain[field] == uninterrupted[field] == resumed[field]}
+        for field in plain
+    ]
+
+
+def prefill_history(state: Dict, depth: int):
+    """以真实结算流程为玩家预填 depth 局历史（仅维护玩家索引与记忆缓存，不保留完整日志）"""
+    controller = GameRoundController(state)
+    for round_id in range(1, depth + 1):
+        state["round_id"] = round_id
+        controller.round_id = round_id
+        bets = generate_bets_vectorized(state["sim_players"], round_id, state["bet_rng"])
+        winning_areas = random.choice([[a] for a in PAYOUT_RATES] + [[1, 2, 3, 4]])
+        payouts = []
+        for pid, area_bets in bets.items():
+            bet_sum = sum(area_bets.values())
+            payout = sum(v * PAYOUT_RATES[a] for a, v in area_bets.items() if a in winning_areas)
+            payouts.append(payout)
+            db_logger.log_player_detail(round_id, pid, area_bets, bet_sum, payout)
+            update_memory_attitude(pid)
+        state["stat_players"].bulk_update(list(bets), [sum(b.values()) for b in bets.values()], payouts)
+    state["round_id"] = depth + 1
+
+
+def benchmark_population(num_players: int, depth: int, repeat: int, seed: int) -> List[Dict]:
+    random.seed(seed)
+    np.random.seed(seed)
+    db_logger.reset_logs()
+    reset_memory_attitude_cache()
+    with db_logger.log_retention(False):
+        state = create_headless_state(num_players, bet_seed=seed)
+        prefill_history(state, depth)
+        round_id = state["round_id"]
+        sim_players = state["sim_players"]
+        stat_players = state["stat_players"]
+        player_recharges = {pid: p.recharge_amount for pid, p in sim_players.items()}
+
+        # 固定一份本局下注，供各阶段复用
+        player_snapshot = copy.deepcopy(sim_players)
+        bets = generate_bets_vectorized(copy.deepcopy(sim_players), round_id, np.random.default_rng(seed))
+        state["current_bets"] = bets
+        state["partial_bets"] = bets
+
+        results, _, std_bounds, _ = simulate_structure_metrics(stat_players, bets)
+        memory = simulate_structure_memory_effect(stat_players, bets, player_recharges, round_id)
+        for r, m in zip(results, memory):
+            r["memory_effect"] = m["memory_effect"]
+        no_confidence = [dict(r, within_confidence=False) for r in results]
+
+        tracker = ActivityTracker()
+        tracker_rng = np.random.default_rng(seed)
+
+        def restore_players():
+            sim_players.is_active[:] = player_snapshot.is_active
+            sim_players.consecutive_missed[:] = player_snapshot.consecutive_missed
+
+        controller = GameRoundController(state)
+        controller.round_id = round_id
+
+        def full_tick():
+            state["bet_book"] = None
+            controller.evaluate_structures()
+
+        third = dict(list(bets.items())[: max(1, len(bets) // 3)])
+
+        def book_tick():
+            controller.place_bets(third)
+            controller.evaluate_structures()
+
+        def reset_book():
+            state["current_bets"] = {}
+            state["bet_book"] = None
+            controller.start_bet_book()
+
+        log_items = list(bets.items())
+
+        def log_details():
+            for pid, area_bets in log_items:
+                db_logger.log_player_detail(round_id, pid, area_bets, sum(area_bets.values()), 0)
+
+        def restore_logs():
+            for pid, _ in log_items:
+                recent = db_logger.player_recent_log.get(pid)
+                if recent and recent[-1]["round_id"] == round_id:
+                    recent.pop()
+
+        stages = {
+            "initialize_players": (lambda: initialize_players(num_players), None),
+            "simulate_structure_metrics": (lambda: simulate_structure_metrics(stat_players, bets), None),
+            "simulate_structure_memory_effect": (
+                lambda: simulate_structure_memory_effect(stat_players, bets, player_recharges, round_id), None
+            ),
+            "select_structure": (
+                lambda: select_structure(no_confidence, bets, std_bounds=std_bounds, base_std=STD_THRESHOLD), None
+            ),
+            "generate_bets": (lambda: generate_bets(sim_players, round_id), restore_players),
+            "generate_bets_vectorized": (
+                lambda: generate_bets_vectorized(sim_players, round_id, np.random.default_rng(seed)), restore_players
+            ),
+            # 稀疏参与状态：tracker 跨重复持续推进（稳态成本），不回滚玩家状态
+            "generate_bets_sparse": (
+                lambda: generate_bets_vectorized(sim_players, round_id, tracker_rng, tracker=tracker), None
+            ),
+            "log_player_detail": (log_details, restore_logs),
+            "evaluate_structures_full": (full_tick, None),
+            "evaluate_structures_book_tick": (book_tick, reset_book),
+        }
+
+        rows = []
+        for stage, (fn, setup) in stages.items():
+            row = {"stage": stage, "players": num_players, "history_depth": depth, "bettors": len(bets)}
+            row.update(time_stage(fn, repeat, setup=setup))
+            rows.append(row)
+            print(f"  {stage:<34} {row['ops_per_sec']:>10.1f} ops/s  p50 {row['p50_ms']:>9.3f} ms  "
+                  f"p99 {row['p99_ms']:>9.3f} ms  peak {row['peak_memory_kb']:>10.1f} KB")
+        return rows
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes: List[int], depths: List[int], *, repeat: int = 20, seed: int = 0) -> Dict:
+    results = []
+    for num_players in sizes:
+        # 大人群减少重复次数，控制总耗时
+        n_repeat = max(3, repeat * 2_000 // max(num_players, 2_000))
+        for depth in depths:
+            print(f"[players={num_players:,} depth={depth}]")
+            results.extend(benchmark_population(num_players, depth, n_repeat, seed))
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "sizes": sizes,
+            "depths": depths,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare_results(current: Dict, baseline: Dict, threshold: float = 0.2) -> List[Dict]:
+    """
+    与历史结果对比：按 (stage, players, history_depth) 匹配，p50 变慢超过 threshold 视为回归。
+    """
+    base_index = {(r["stage"], r["players"], r["history_depth"]): r for r in baseline["results"]}
+    rows = []
+    for r in current["results"]:
+        base = base_index.get((r["stage"], r["players"], r["history_depth"]))
+        if base is None or base["p50_ms"] <= 0:
+            continue
+        ratio = r["p50_ms"] / base["p50_ms"]
+        rows.append({
+            "stage": r["stage"],
+            "players": r["players"],
+            "history_depth": r["history_depth"],
+            "baseline_p50_ms": base["p50_ms"],
+            "current_p50_ms": r["p50_ms"],
+            "ratio": ratio,
+            "regression": ratio > 1 + threshold,
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="控奖策略热路径基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="玩家人数")
+    parser.add_argument("--depths", type=int, nargs="+", default=DEFAULT_DEPTHS, help="预填历史局数")
+    parser.add_argument("--repeat", type=int, default=20, help="每阶段计时次数（2k 人基准，人数越多自动减少）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--output", type=str, default=None, help="结果 JSON 输出路径")
+    parser.add_argument("--compare", type=str, default=None, help="对比的历史结果 JSON")
+    parser.add_argument("--threshold", type=float, default=0.2, help="回归判定阈值（p50 变慢比例）")
+    parser.add_argument("--imports", action="store_true", help="只检查冷启动导入预算（超预算或加载重型依赖时退出码为 1）")
+    parser.add_argument("--snapshot-resume", action="store_true", help="只检查快照续跑与一次跑完结果一致（不一致时退出码为 1）")
+    args = parser.parse_args(argv)
+
+    if args.snapshot_resume:
+        failures = 0
+        for row in check_snapshot_resume():
+            flag = "" if row["ok"] else "⚠️ 不一致"
+            failures += not row["ok"]
+            print(f"  {row['field']:<16} {row['expected']!s:>16} {row['snapshot']!s:>16} {row['resumed']!s:>16} {flag}")
+        if failures:
+            raise SystemExit(1)
+        return
+
+    if args.imports:
+        failures = 0
+        for row in check_import_budget():
+            flag = "" if row["ok"] else "⚠️ 超预算"
+            failures += not row["ok"]
+            heavy = f" 加载了 {', '.join(row['heavy_modules'])}" if row["heavy_modules"] else ""
+            print(f"  {row['module']:<24} {row['import_ms']:>8.1f} ms / 预算 {row['budget_ms']:>5.0f} ms{heavy} {flag}")
+        if failures:
+            raise SystemExit(1)
+        return
+
+    report = run_benchmarks(args.sizes, args.depths, repeat=args.repeat, seed=args.seed)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\n对比基线 {baseline['meta'].get('commit')} → 当前 {report['meta'].get('commit')}")
+        regressions = 0
+        for row in compare_results(report, baseline, args.threshold):
+            flag = "⚠️ 回归" if row["regression"] else ""
+            regressions += row["regression"]
+            print(f"  {row['stage']:<34} players={row['players']:<7} depth={row['history_depth']:<3} "
+                  f"{row['baseline_p50_ms']:>9.3f} → {row['current_p50_ms']:>9.3f} ms (x{row['ratio']:.2f}) {flag}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
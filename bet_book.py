@@ -0,0 +1,207 @@
+# bet_book.py
+
+"""
+本局下注簿（增量维护）：
+- 区域总额、每位玩家的下注向量、达标玩家集合（MINIMUM_BET_THRESHOLD）
+- 玩家下注落定时只按增量更新，不重扫全场
+- 同时维护结构级累加量（加权 RTP 方差、记忆态势的加权一/二阶矩），
+  每次评估只需 O(结构数) 即可得到全部结构指标
+
+结算前玩家累计 RTP、记忆态势均不变，因此每位玩家的贡献只取决于其本局下注，
+玩家下注变化时“减去旧贡献、加上新贡献”即可。
+"""
+
+from typing import Dict, List, Mapping, Optional, Set
+import numpy as np
+from config import MINIMUM_BET_THRESHOLD, TARGET_RTP
+from player_profiles import PlayerStats
+from metrics_engine import get_memory_state, MEMORY_DECAY_WEIGHTS
+from structure_matrix import (
+    AREA_INDEX, NUM_AREAS, NUM_STRUCTURES, STRUCTURE_PAYOUT_MATRIX, build_structure_payout_table
+)
+
+
+class BetBook:
+    """
+    单局下注簿。生命周期为一局：下注阶段开始时创建，结算后丢弃。
+    """
+
+    def __init__(
+        self,
+        stat_players: Dict[str, PlayerStats],
+        player_recharges: Optional[Mapping[str, float]] = None,
+        round_id: int = 0,
+        *,
+        target_rtp: float = TARGET_RTP,
+        capacity: int = 256
+    ):
+        self.stat_players = stat_players
+        self.player_recharges = player_recharges or {}
+        self.round_id = round_id
+        self.target_rtp = target_rtp
+
+        self.version = 0  # 每次写入下注后加一，供结构指标缓存判断是否过期
+        self.player_ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self.eligible_players: Set[str] = set()
+        self.area_totals = np.zeros(NUM_AREAS, dtype=np.float64)
+
+        # 按玩家行存储的数组（容量不足时倍增）
+        self.bet_matrix = np.zeros((capacity, NUM_AREAS), dtype=np.float64)
+        self.bet_totals = np.zeros(capacity, dtype=np.float64)
+        self.prior_bets = np.zeros(capacity, dtype=np.float64)
+        self.prior_returns = np.zeros(capacity, dtype=np.float64)
+        self.avg_bets = np.zeros(capacity, dtype=np.float64)
+        self.shifted_attitudes = np.zeros(capacity, dtype=np.float64)
+        self.recharges = np.zeros(capacity, dtype=np.float64)
+        self.eligible = np.zeros(capacity, dtype=bool)
+        self.memory_active = np.zeros(capacity, dtype=bool)
+
+        # 结构级累加量
+        self.std_weight = 0.0
+        self.std_sq_sum = np.zeros(NUM_STRUCTURES, dtype=np.float64)
+        self.memory_weight = 0.0
+        self.memory_sum = np.zeros(NUM_STRUCTURES, dtype=np.float64)
+        self.memory_sq_sum = np.zeros(NUM_STRUCTURES, dtype=np.float64)
+
+    # --- 行管理 ---
+    def _grow(self):
+        capacity = len(self.bet_totals) * 2
+        for name in ("bet_matrix", "bet_totals", "prior_bets", "prior_returns",
+                     "avg_bets", "shifted_attitudes", "recharges", "eligible", "memory_active"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _ensure_row(self, player_id: str) -> int:
+        row = self._rows.get(player_id)
+        if row is not None:
+            return row
+
+        row = len(self.player_ids)
+        if row >= len(self.bet_totals):
+            self._grow()
+        self._rows[player_id] = row
+        self.player_ids.append(player_id)
+
+        stats = self.stat_players.get(player_id)
+        if stats is not None:  # 未登记玩家（导入局新 UID）按零起点计
+            self.prior_bets[row] = stats.total_bet
+            self.prior_returns[row] = stats.total_return
+        self.recharges[row] = self.player_recharges.get(player_id, 0.0)
+        if self.recharges[row] > 0:
+            memory_state = get_memory_state(player_id, self.round_id)
+            self.avg_bets[row] = memory_state["avg_bet"]
+            self.shifted_attitudes[row] = memory_state["shifted_attitude"]
+        return row
+
+    # --- 增量更新 ---
+    def _accumulate(self, rows: np.ndarray, sign: float):
+        """将指定玩家行的当前贡献加入（sign=1）或移出（sign=-1）结构累加量"""
+        payouts = self.bet_matrix[rows] @ STRUCTURE_PAYOUT_MATRIX
+
+        eligible = self.eligible[rows]
+        if eligible.any():
+            r = rows[eligible]
+            weights = self.prior_bets[r] + self.bet_totals[r]
+            rtp = (self.prior_returns[r][:, None] + payouts[eligible]) / weights[:, None]
+            self.std_weight += sign * weights.sum()
+            self.std_sq_sum += sign * (weights[:, None] * (rtp - self.target_rtp) ** 2).sum(axis=0)
+
+        active = self.memory_active[rows]
+        if active.any():
+            r = rows[active]
+            avg = self.avg_bets[r]
+            net_profit = payouts[active] - self.bet_totals[r][:, None]
+            memory_profit = np.where((avg > 0)[:, None], net_profit / np.where(avg > 0, avg, 1.0)[:, None], 0.0)
+            attitudes = memory_profit * MEMORY_DECAY_WEIGHTS[0] + self.shifted_attitudes[r][:, None]
+            weights = self.recharges[r]
+            self.memory_weight += sign * weights.sum()
+            self.memory_sum += sign * (weights[:, None] * attitudes).sum(axis=0)
+            self.memory_sq_sum += sign * (weights[:, None] * attitudes ** 2).sum(axis=0)
+
+    def apply_bets(self, bets_by_player: Dict[str, Dict[int, float]]):
+        """
+        写入一批玩家的最新下注（每位玩家的完整区域下注，覆盖旧值），按增量更新全部统计。
+        成本与本批玩家数成正比。
+        """
+        if not bets_by_player:
+            return
+        self.version += 1
+        rows = np.array([self._ensure_row(pid) for pid in bets_by_player], dtype=np.int64)
+        new_matrix = np.zeros((len(rows), NUM_AREAS), dtype=np.float64)
+        new_totals = np.zeros(len(rows), dtype=np.float64)
+        for i, bets in enumerate(bets_by_player.values()):
+            for area, amount in bets.items():
+                new_matrix[i, AREA_INDEX[area]] = amount
+            new_totals[i] = sum(bets.values())
+
+        self._accumulate(rows, -1.0)
+
+        self.area_totals += (new_matrix - self.bet_matrix[rows]).sum(axis=0)
+        self.bet_matrix[rows] = new_matrix
+        self.bet_totals[rows] = new_totals
+        self.eligible[rows] = (new_totals >= MINIMUM_BET_THRESHOLD) & (self.prior_bets[rows] + new_totals >= MINIMUM_BET_THRESHOLD)
+        self.memory_active[rows] = (new_totals != 0) & (self.recharges[rows] > 0)
+        for pid, ok in zip(bets_by_player, self.eligible[rows]):
+            if ok:
+                self.eligible_players.add(pid)
+            else:
+                self.eligible_players.discard(pid)
+
+        self._accumulate(rows, 1.0)
+
+        # ✅ 集合清空时归零，避免浮点残差累积
+        if not self.eligible_players:
+            self.std_weight = 0.0
+            self.std_sq_sum[:] = 0.0
+        if not self.memory_active[:len(self.player_ids)].any():
+            self.memory_weight = 0.0
+            self.memory_sum[:] = 0.0
+            self.memory_sq_sum[:] = 0.0
+
+    # --- 查询 ---
+    @property
+    def sample_size(self) -> int:
+        return len(self.eligible_players)
+
+    def structure_stds(self):
+        """各结构的加权 RTP 标准差与方差"""
+        if self.std_weight <= 0:
+            zeros = np.zeros(NUM_STRUCTURES)
+            return zeros, zeros
+        variances = np.maximum(self.std_sq_sum / self.std_weight, 0.0)
+        return np.sqrt(variances), variances
+
+    def memory_effects(self) -> np.ndarray:
+        """各结构的记忆态势加权标准差"""
+        if self.memory_weight <= 0:
+            return np.zeros(NUM_STRUCTURES)
+        mean = self.memory_sum / self.memory_weight
+        variances = np.maximum(self.memory_sq_sum / self.memory_weight - mean ** 2, 0.0)
+        return np.sqrt(variances)
+
+    def memory_players(self) -> List[str]:
+        """参与记忆态势计算的玩家（当前局有下注且有充值）"""
+        return [pid for pid in self.player_ids if self.memory_active[self._rows[pid]]]
+
+    def payout_table(self) -> Dict[str, np.ndarray]:
+        return build_structure_payout_table(self.area_totals)
+
+    def std_details(self, structure: int) -> Dict:
+        """按需生成某个结构的逐玩家 STD 明细（与 calculate_weighted_std 的 details 同结构）"""
+        rows = np.array([self._rows[pid] for pid in self.player_ids if self.eligible[self._rows[pid]]], dtype=np.int64)
+        variances = self.structure_stds()[1]
+        if rows.size == 0:
+            return {"players": [], "target_rtp": self.target_rtp, "weighted_variance": 0}
+        bets = self.prior_bets[rows] + self.bet_totals[rows]
+        returns = self.prior_returns[rows] + (self.bet_matrix[rows] @ STRUCTURE_PAYOUT_MATRIX)[:, structure]
+        return {
+            "players": [
+                {"id": self.player_ids[r], "bet": b, "return": ret, "rtp": ret / b, "weight": b / self.std_weight}
+                for r, b, ret in zip(rows.tolist(), bets.tolist(), returns.tolist())
+            ],
+            "target_rtp": self.target_rtp,
+            "weighted_variance": float(variances[structure])
+        }
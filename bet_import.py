@@ -0,0 +1,318 @@
+# bet_import.py
+
+"""
+下注文件流式导入模块：
+- 支持 Excel（.xlsx，openpyxl 只读模式逐行迭代）、CSV、Parquet（pyarrow 按批读取），不整表载入内存
+- 文件需按局号排序（同一局的行连续），逐局产出 (round_id, {player_id: {area: amount}})
+- 两种表格布局自动识别：
+  · 长表：局号、玩家ID、区域、金额 各一列，每行一笔下注
+  · 宽表：局号、玩家ID、area_1 ~ area_8（与日志后端的列式存储一致），每行一位玩家
+- 可选开奖列（winning_areas / 开奖区域，如 "1|3|5"）：with_outcome=True 时一并产出生产环境实际开出的区域，供历史回放对比
+- PrefetchingRoundReader：后台线程预读后续若干局，当前局结算前下一局已就绪
+
+可选依赖：Excel 需安装 openpyxl，Parquet 需安装 pyarrow（均在使用时才导入）。
+
+命令行用法（逐局读取并统计，检查文件格式与读取吞吐）：
+    python bet_import.py rounds.csv
+"""
+
+import argparse
+import csv
+import io
+import os
+import queue
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from config import WINNING_STRUCTURES
+from structure_matrix import AREAS
+
+RoundBets = Dict[str, Dict[int, float]]
+
+# 表头别名（统一转小写后匹配）
+ROUND_COLUMNS = ("round_id", "round", "局号", "对局id")
+PLAYER_COLUMNS = ("player_id", "uid", "玩家id", "玩家")
+AREA_COLUMNS = ("area", "区域")
+AMOUNT_COLUMNS = ("amount", "bet", "金额", "下注金额")
+OUTCOME_COLUMNS = ("winning_areas", "开奖区域", "开奖结构")
+WIDE_AREA_COLUMNS = [f"area_{a}" for a in AREAS]
+# 合法开奖结构（排序后的区域元组）
+STRUCTURE_AREAS = {tuple(sorted(s["areas"])) for s in WINNING_STRUCTURES}
+# 开奖列无法识别（非法区域组合 / 无法解析）的局：winning_areas 为空元组，与未填写（None）区分，由调用方计数跳过
+INVALID_WINNING_AREAS: Tuple[int, ...] = ()
+
+
+class BetFileFormatError(ValueError):
+    """下注文件表头或内容不符合约定"""
+
+
+def find_column(header: List[str], aliases: Sequence[str]) -> Optional[int]:
+    for i, name in enumerate(header):
+        if name in aliases:
+            return i
+    return None
+
+
+def normalize_player_id(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = str(value).strip()
+    return text if text.startswith("player_") else f"player_{text}"
+
+
+def parse_winning_areas(value) -> Optional[List[int]]:
+    """
+    开奖区域单元格 → 区域列表：支持 "1|3|5"、"1,3,5"、"[1, 3, 5]" 与列表值；空值返回 None。
+    无法解析或不是 WINNING_STRUCTURES 中的结构时抛出 BetFileFormatError。
+    """
+    if value is None or value == "":
+        return None
+    try:
+        if isinstance(value, (list, tuple)):
+            areas = sorted(int(v) for v in value)
+        else:
+            text = str(value).strip("[]() ")
+            for sep in "|,;/ ":
+                text = text.replace(sep, " ")
+            areas = sorted(int(float(v)) for v in text.split())
+    except (TypeError, ValueError) as e:
+        raise BetFileFormatError(f"无法解析开奖区域：{value!r}") from e
+    if tuple(areas) not in STRUCTURE_AREAS:
+        raise BetFileFormatError(f"开奖区域不是合法结构：{value!r}")
+    return areas
+
+
+def _drop_empty(bets: RoundBets) -> RoundBets:
+    return {pid: player_bets for pid, player_bets in bets.items() if player_bets}
+
+
+def iter_rounds_from_rows(rows: Iterable[Sequence], with_outcome: bool = False) -> Iterator[Tuple]:
+    """
+    由“首行为表头”的行迭代器逐局产出 (round_id, bets)。金额为 0 或空的单元格忽略。
+    with_outcome=True 时产出 (round_id, bets, winning_areas)，无开奖列或该局未填写时 winning_areas 为 None，
+    开奖列无法识别时为 INVALID_WINNING_AREAS（不中断读取）。
+    """
+    rows = iter(rows)
+    try:
+        header = [str(h).strip().lower() if h is not None else "" for h in next(rows)]
+    except StopIteration:
+        return
+
+    round_col = find_column(header, ROUND_COLUMNS)
+    player_col = find_column(header, PLAYER_COLUMNS)
+    if round_col is None or player_col is None:
+        raise BetFileFormatError(f"缺少局号或玩家ID列，表头：{header}")
+
+    outcome_col = find_column(header, OUTCOME_COLUMNS) if with_outcome else None
+    area_col = find_column(header, AREA_COLUMNS)
+    amount_col = find_column(header, AMOUNT_COLUMNS)
+    wide_cols = [(area, header.index(name)) for area, name in zip(AREAS, WIDE_AREA_COLUMNS) if name in header]
+    if area_col is None or amount_col is None:
+        if not wide_cols:
+            raise BetFileFormatError(f"既不是长表（区域 + 金额）也不是宽表（area_1 ~ area_8），表头：{header}")
+        area_col = amount_col = None
+
+    def finish():
+        if with_outcome:
+            return current_round, _drop_empty(bets), winning_areas
+        return current_round, _drop_empty(bets)
+
+    current_round = winning_areas = None
+    bets: RoundBets = {}
+    for row in rows:
+        if row is None or row[round_col] in (None, ""):
+            continue
+        round_id = int(float(row[round_col]))
+        if current_round is not None and round_id != current_round:
+            yield finish()
+            bets, winning_areas = {}, None
+        current_round = round_id
+        if outcome_col is not None and winning_areas is None:
+            try:
+                winning_areas = parse_winning_areas(row[outcome_col])
+            except BetFileFormatError:
+                winning_areas = INVALID_WINNING_AREAS
+
+        player_bets = bets.setdefault(normalize_player_id(row[player_col]), {})
+        if area_col is not None:
+            amount = float(row[amount_col] or 0)
+            if amount:
+                area = int(float(row[area_col]))
+                if area not in AREAS:
+                    raise BetFileFormatError(f"第 {round_id} 局出现未知区域：{area}")
+                player_bets[area] = player_bets.get(area, 0) + amount
+        else:
+            for area, col in wide_cols:
+                amount = float(row[col] or 0)
+                if amount:
+                    player_bets[area] = player_bets.get(area, 0) + amount
+
+    if current_round is not None:
+        yield finish()
+
+
+# --- 各格式的逐行读取 ---
+def _iter_excel_rows(source) -> Iterator[Sequence]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError as exc:
+        raise ImportError("读取 Excel 下注文件需要安装 openpyxl") from exc
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _iter_csv_rows(source) -> Iterator[Sequence]:
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, newline="", encoding="utf-8-sig") as f:
+            yield from csv.reader(f)
+    else:
+        text = io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+        try:
+            yield from csv.reader(text)
+        finally:
+            # 文件对象归调用方所有（如上传文件）：解除包装，避免包装器被回收时关闭它（之后无法从头重读）
+            text.detach()
+
+
+def _iter_parquet_rows(source, batch_size: int = 50_000) -> Iterator[Sequence]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise ImportError("读取 Parquet 下注文件需要安装 pyarrow") from exc
+    parquet_file = pq.ParquetFile(source)
+    yield parquet_file.schema_arrow.names
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        yield from zip(*(column.to_pylist() for column in batch.columns))
+
+
+def detect_format(filename: str) -> str:
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in (".xlsx", ".xlsm"):
+        return "excel"
+    if ext == ".csv":
+        return "csv"
+    if ext in (".parquet", ".pq"):
+        return "parquet"
+    if ext == ".xls":
+        raise BetFileFormatError("不支持旧版 .xls（无法流式读取），请另存为 .xlsx 或 .csv")
+    raise BetFileFormatError(f"无法识别的下注文件类型：{filename}")
+
+
+def iter_bet_rounds(
+    source,
+    filename: Optional[str] = None,
+    fmt: Optional[str] = None,
+    *,
+    with_outcome: bool = False
+) -> Iterator[Tuple]:
+    """
+    逐局读取下注文件。source 为路径或二进制文件对象（如 Streamlit 上传文件）；
+    fmt 缺省时按 filename（或 source 路径）的扩展名识别。with_outcome 见 iter_rounds_from_rows。
+    """
+    fmt = fmt or detect_format(filename or str(source))
+    readers = {"excel": _iter_excel_rows, "csv": _iter_csv_rows, "parquet": _iter_parquet_rows}
+    return iter_rounds_from_rows(readers[fmt](source), with_outcome)
+
+
+class PrefetchingRoundReader:
+    """
+    后台线程预读的逐局读取器：队列中始终保持至多 buffer_size 局已解析的下注。
+    next_round() 返回 rounds 中的下一项（(round_id, bets) 或带开奖的三元组），读完返回 None；读取异常在 next_round() 中重新抛出。
+    """
+
+    _END = object()
+
+    def __init__(self, rounds: Iterator[Tuple], buffer_size: int = 2):
+        self.rounds_read = 0
+        self.exhausted = False
+        self._queue: "queue.Queue" = queue.Queue(maxsize=buffer_size)
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._produce, args=(rounds,), name="bet-import", daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        """队列满时等待消费；读取器已关闭（无人再取）时放弃并返回 False，避免预读线程永久阻塞"""
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, rounds):
+        try:
+            for item in rounds:
+                if not self._put(item):
+                    return
+            self._put(self._END)
+        except BaseException as exc:
+            self._put(exc)
+        finally:
+            close = getattr(rounds, "close", None)
+            if close is not None:
+                close()  # 提前结束时也立即释放底层读取（CSV 包装器在此解除）
+
+    def next_round(self, timeout: Optional[float] = None) -> Optional[Tuple]:
+        if self.exhausted:
+            return None
+        item = self._queue.get(timeout=timeout)
+        if item is self._END:
+            self.exhausted = True
+            return None
+        if isinstance(item, BaseException):
+            self.exhausted = True
+            raise item
+        self.rounds_read += 1
+        return item
+
+    def __iter__(self):
+        while True:
+            item = self.next_round()
+            if item is None:
+                return
+            yield item
+
+    def close(self, timeout: Optional[float] = None):
+        """停止预读；timeout 不为 None 时等待预读线程退出（之后可安全地从头重读同一文件对象）"""
+        self._closed.set()
+        self.exhausted = True
+        if timeout is not None:
+            self._thread.join(timeout)
+
+
+def open_bet_stream(
+    source,
+    filename: Optional[str] = None,
+    *,
+    buffer_size: int = 2,
+    with_outcome: bool = False
+) -> PrefetchingRoundReader:
+    return PrefetchingRoundReader(iter_bet_rounds(source, filename, with_outcome=with_outcome), buffer_size=buffer_size)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="下注文件逐局读取检查")
+    parser.add_argument("path", help="下注文件（.xlsx / .csv / .parquet）")
+    parser.add_argument("--show", type=int, default=5, help="打印前 N 局摘要")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    rounds = players = 0
+    total = 0.0
+    for round_id, bets in open_bet_stream(args.path):
+        round_total = sum(sum(b.values()) for b in bets.values())
+        if rounds < args.show:
+            print(f"第 {round_id} 局：{len(bets)} 名玩家，总下注 {round_total:,.0f}")
+        rounds += 1
+        players += len(bets)
+        total += round_total
+    elapsed = time.perf_counter() - start
+    print(f"共 {rounds:,} 局，{players:,} 人次，总下注 {total:,.0f}；耗时 {elapsed:.2f}s（{rounds / max(elapsed, 1e-9):,.0f} 局/秒）")
+
+
+if __name__ == "__main__":
+    main()
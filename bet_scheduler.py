@@ -0,0 +1,135 @@
+# bet_scheduler.py
+
+"""
+下注落定事件队列：
+- 按时间分桶的事件表：桶号 → [player_id]（下注取自本局下注计划），另以小顶堆维护待弹出的桶号
+- 每个 tick 只弹出已到期的桶，耗时与本拍落定的下注数成正比，与全场人数无关
+- 落定时间一次向量化抽样生成（替代逐玩家 random.gauss 拒绝采样循环）
+- resolution 为时间分辨率（秒），须与调用方推进 pop_due 的步长一致：对局下注阶段按整秒推进，取默认值 1
+
+落定时间的分布与原逐玩家实现一致：
+- 每位玩家下注次数 k ~ 均匀整数 [1, duration]
+- 各次时间为 N(0.75·duration, max(1, duration/6)) 向下取整到分辨率格点、落在 [resolution, duration] 内且互不重复
+- 每次落定都写入同一份完整下注，重复落定不改变状态，因此只需调度最早的一次；
+  对“不重复的 k 次抽样”取最小值等价于 Gumbel-top-k 抽样后取最小格点
+"""
+
+import heapq
+import math
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+_default_rng = np.random.default_rng()
+
+# 向量化抽样的分块行数（控制 (玩家数 × 格点数) 临时矩阵的内存）
+CHUNK_SIZE = 100_000
+
+
+def landing_slots(duration: float, resolution: float = 1.0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    返回 (格点时间, 各格点概率)：格点为 resolution, 2·resolution, …, duration，
+    概率为高斯分布落入 [t, t + resolution) 的质量（截断到格点范围后归一化）。
+    """
+    n = max(1, int(round(duration / resolution)))
+    slots = np.arange(1, n + 1) * resolution
+    mu = duration * 0.75
+    sigma = max(1.0, duration / 6)
+    cdf = np.array([0.5 * (1 + math.erf((t - mu) / (sigma * math.sqrt(2)))) for t in np.append(slots, slots[-1] + resolution)])
+    mass = np.diff(cdf)
+    return slots, mass / mass.sum()
+
+
+def draw_landing_times(
+    num_players: int,
+    duration: float,
+    rng: Optional[np.random.Generator] = None,
+    resolution: float = 1.0
+) -> np.ndarray:
+    """为 num_players 位玩家一次抽出各自最早的落定时间（秒）"""
+    if rng is None:
+        rng = _default_rng
+    slots, probs = landing_slots(duration, resolution)
+    log_probs = np.log(probs)
+    max_times = min(int(duration), len(slots))
+    landing = np.empty(num_players, dtype=np.int64)
+    for start in range(0, num_players, CHUNK_SIZE):
+        rows = min(CHUNK_SIZE, num_players - start)
+        bet_times = rng.integers(1, max_times, size=rows, endpoint=True)
+        # ✅ Gumbel-top-k：按扰动后的对数概率降序即为一次不放回抽样的顺序
+        order = np.argsort(-(log_probs + rng.gumbel(size=(rows, len(slots)))), axis=1)
+        chosen = np.where(np.arange(len(slots)) < bet_times[:, None], order, len(slots))
+        landing[start:start + rows] = chosen.min(axis=1)
+    return slots[landing]
+
+
+class BetScheduler:
+    """
+    单局下注落定事件队列。bets 为本局下注计划 {player_id: 下注}，事件只记录玩家 ID，
+    弹出时再取下注（百万级事件不额外创建元组，避免 GC 反复扫描）。
+    """
+
+    def __init__(self, bets: Dict[str, Dict[int, float]], resolution: float = 1.0):
+        self.bets = bets
+        self.resolution = resolution
+        self.buckets: Dict[int, List[str]] = {}
+        self._heap: List[int] = []
+        self.pending = 0
+
+    @classmethod
+    def build(
+        cls,
+        partial_bets: Dict[str, Dict[int, float]],
+        duration: float,
+        rng: Optional[np.random.Generator] = None,
+        resolution: float = 1.0
+    ) -> "BetScheduler":
+        """由本局下注计划一次性生成全部落定事件"""
+        scheduler = cls(partial_bets, resolution)
+        player_ids = list(partial_bets)
+        if player_ids:
+            scheduler.add_many(player_ids, draw_landing_times(len(player_ids), duration, rng, resolution))
+        return scheduler
+
+    def _bucket(self, time: float) -> int:
+        return int(math.floor(time / self.resolution + 1e-9))
+
+    def add(self, player_id: str, time: float):
+        bucket = self._bucket(time)
+        if bucket not in self.buckets:
+            self.buckets[bucket] = []
+            heapq.heappush(self._heap, bucket)
+        self.buckets[bucket].append(player_id)
+        self.pending += 1
+
+    def add_many(self, player_ids: List[str], times: np.ndarray):
+        """批量加入事件：按桶号排序后分组，一次写入每个桶"""
+        buckets = np.floor(np.asarray(times) / self.resolution + 1e-9).astype(np.int64)
+        order = np.argsort(buckets, kind="stable")
+        sorted_ids = np.array(player_ids, dtype=object)[order]
+        keys, starts = np.unique(buckets[order], return_index=True)
+        bounds = np.append(starts, len(order))
+        for key, lo, hi in zip(keys.tolist(), bounds[:-1].tolist(), bounds[1:].tolist()):
+            events = sorted_ids[lo:hi].tolist()
+            if key in self.buckets:
+                self.buckets[key].extend(events)
+            else:
+                self.buckets[key] = events
+                heapq.heappush(self._heap, key)
+        self.pending += len(player_ids)
+
+    def pop_due(self, until: float) -> Dict[str, Dict[int, float]]:
+        """弹出时间 ≤ until 的全部事件，返回 {player_id: 下注}"""
+        landed = {}
+        limit = self._bucket(until)
+        while self._heap and self._heap[0] <= limit:
+            for player_id in self.buckets.pop(heapq.heappop(self._heap)):
+                landed[player_id] = self.bets[player_id]
+        self.pending -= len(landed)
+        return landed
+
+    def next_due(self) -> Optional[float]:
+        """下一批事件的时间（秒），无待落定事件时为 None"""
+        return self._heap[0] * self.resolution if self._heap else None
+
+    def __len__(self):
+        return self.pending
@@ -1,5 +1,9 @@
 import random
+from itertools import compress, islice
+from typing import Dict, List, Optional
+import numpy as np
 from config import PAYOUT_RATES
+from player_profiles import PlayerPopulation, PlayerView
 
 def generate_bets(players: dict, round_index: int) -> dict:
     """
@@ -64,3 +68,319 @@ def generate_bets(players: dict, round_index: int) -> dict:
         bets[pid] = final_bets
 
     return bets
+
+
+# --- 向量化批量下注生成 ---
+BET_UNIT = 500
+AREA_IDS = np.array(sorted(PAYOUT_RATES.keys()), dtype=np.int64)
+# 按赔率倒数计算的基础权重（按区域编号排序）
+INVERSE_PAYOUT_WEIGHTS = np.array([1 / PAYOUT_RATES[a] for a in AREA_IDS.tolist()], dtype=np.float64)
+
+# 未显式传入随机数生成器时使用的模块级生成器
+_default_rng = np.random.default_rng()
+
+
+def make_bet_rng(seed=None) -> np.random.Generator:
+    """由种子构建下注用随机数生成器（seed 为 None 时不可复现）"""
+    return np.random.default_rng(seed)
+
+
+# --- 参与状态转移（与 generate_bets 一致） ---
+INITIAL_ACTIVE_PROB = 0.3  # 首局参与概率
+DROP_PROB = 0.15  # 参与中的玩家每局退出概率
+
+
+def restore_probability(missed):
+    """连续缺席 missed 局的玩家本局回归概率"""
+    return np.minimum(1.0, 0.1 + 0.05 * np.asarray(missed))
+
+
+def _build_wake_delay_cdf() -> np.ndarray:
+    """
+    回归等待局数的分布表：第 m 行为“本局将以 consecutive_missed = m 掷回归”时，
+    D = 1, 2, … 局后回归的累积概率（回归概率随缺席局数增至 1，支撑有限）。
+    """
+    max_missed = int(np.ceil((1.0 - 0.1) / 0.05))  # 回归概率达到 1 的缺席局数
+    rows = []
+    for m0 in range(max_missed + 1):
+        p = restore_probability(np.arange(m0, max_missed + 1))
+        survive = np.concatenate(([1.0], np.cumprod(1 - p)[:-1]))
+        cdf = np.cumsum(p * survive)
+        rows.append(np.pad(cdf, (0, max_missed + 1 - len(cdf)), constant_values=1.0))
+    return np.array(rows)
+
+
+WAKE_DELAY_CDF = _build_wake_delay_cdf()
+
+
+def draw_wake_delays(missed: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """按回归概率律一次抽出每位缺席玩家的回归等待局数（≥ 1）"""
+    rows = np.minimum(np.asarray(missed, dtype=np.int64), len(WAKE_DELAY_CDF) - 1)
+    u = rng.random(len(rows))
+    return (WAKE_DELAY_CDF[rows] <= u[:, None]).sum(axis=1) + 1
+
+
+class ActivityTracker:
+    """
+    稀疏参与状态：参与中的玩家集合 + 缺席玩家的回归唤醒队列（按回归局分桶）。
+    - 玩家退出时按回归概率律一次抽出回归局，之后直到回归前都不再逐局掷骰
+    - 每局工作量 = 参与中玩家数 + 本局回归人数，与注册总人数无关
+    - 参与状态的统计规律与逐局全量转移完全一致（首局 30% 参与，每局 15% 退出，
+      缺席 m 局后以 min(1, 0.1 + 0.05·m) 回归）
+
+    玩家对象的 is_active 在状态变化时同步；缺席期间的 consecutive_missed 不逐局递增
+    （以退出时的 1 为准，回归时归零），回归时刻已由唤醒队列决定。
+    与全量版本一样每次调用推进一步（不按局号间隔推进），唤醒队列以内部步数为键。
+    集合与队列直接持有玩家对象（以 player.uid 为 ID），每步不再回查百万级玩家字典。
+
+    列式人群另按行维护两列（状态快照直接拷贝数组，不遍历集合与队列）：
+    - wake_at：回归步；参与中为 ACTIVE，尚未登记为 UNTRACKED
+    - order：进入参与集合 / 唤醒桶的先后序号，用于还原集合与桶内顺序
+    """
+
+    ACTIVE = -1
+    UNTRACKED = -2
+
+    def __init__(self):
+        self.active: Dict[str, object] = {}  # player_id → 玩家（有序：同一种子下的下注顺序可复现）
+        self.wakeups: Dict[int, List] = {}  # 回归步 → 玩家
+        self.steps = 0
+        self.known_players = 0
+        self.wake_at: Optional[np.ndarray] = None  # 仅列式人群
+        self.order: Optional[np.ndarray] = None
+        self.sequence = 0
+
+    def _mark(self, players: List, wake_at):
+        """按入队顺序记录行状态（wake_at 为标量或逐人数组）"""
+        if self.wake_at is None or not players:
+            return
+        rows = np.fromiter((p.row for p in players), dtype=np.int64, count=len(players))
+        if rows.max() >= len(self.wake_at):
+            grow = max(rows.max() + 1, 2 * len(self.wake_at)) - len(self.wake_at)
+            self.wake_at = np.concatenate([self.wake_at, np.full(grow, self.UNTRACKED, dtype=np.int64)])
+            self.order = np.concatenate([self.order, np.zeros(grow, dtype=np.int64)])
+        self.wake_at[rows] = wake_at
+        self.order[rows] = np.arange(self.sequence, self.sequence + len(rows))
+        self.sequence += len(rows)
+
+    def _schedule_wakeups(self, sleeping: List, missed: np.ndarray, rng: np.random.Generator):
+        """缺席玩家从下一步起按 missed 掷回归，抽出回归步入队"""
+        if not sleeping:
+            return
+        wake_steps = self.steps + draw_wake_delays(missed, rng)
+        for player, wake_step in zip(sleeping, wake_steps.tolist()):
+            self.wakeups.setdefault(wake_step, []).append(player)
+        self._mark(sleeping, wake_steps)
+
+    def _register(self, players: dict, rng: np.random.Generator):
+        """登记新玩家（或中途接管已有人群）：按其当前 is_active / consecutive_missed 视为上一局结束时的状态"""
+        new_players = list(islice(players.items(), self.known_players, None))
+        self.known_players = len(players)
+        sleeping, missed, activated = [], [], []
+        for pid, player in new_players:
+            if player.is_active:
+                self.active[pid] = player
+                activated.append(player)
+            else:
+                sleeping.append(player)
+                missed.append(player.consecutive_missed)
+        self._mark(activated, self.ACTIVE)
+        self._schedule_wakeups(sleeping, np.array(missed, dtype=np.int64), rng)
+
+    def _initialize(self, players: dict, rng: np.random.Generator):
+        """首局：每位玩家以 30% 概率参与，缺席者 consecutive_missed = 1"""
+        self.active.clear()
+        self.wakeups.clear()
+        self.wake_at = self.order = None
+        self.sequence = 0
+        is_active = rng.random(len(players)) < INITIAL_ACTIVE_PROB
+        if isinstance(players, PlayerPopulation):
+            # ✅ 列式人群：状态整列写入，只为参与 / 缺席玩家创建视图
+            players.is_active[:] = is_active
+            players.consecutive_missed[~is_active] = 1
+            active_rows = np.flatnonzero(is_active)
+            self.active.update(zip(players.uid_list(active_rows.tolist()), players.views(active_rows.tolist())))
+            sleeping = players.views(np.flatnonzero(~is_active).tolist())
+            self.wake_at = np.full(len(players), self.UNTRACKED, dtype=np.int64)
+            self.order = np.zeros(len(players), dtype=np.int64)
+            self.wake_at[active_rows] = self.ACTIVE
+            self.order[active_rows] = np.arange(len(active_rows))
+            self.sequence = len(active_rows)
+        else:
+            sleeping = []
+            for pid, player, active in zip(list(players.keys()), players.values(), is_active.tolist()):
+                player.is_active = active
+                if active:
+                    self.active[pid] = player
+                else:
+                    player.consecutive_missed = 1
+                    sleeping.append(player)
+        self._schedule_wakeups(sleeping, np.ones(len(sleeping), dtype=np.int64), rng)
+        self.known_players = len(players)
+
+    def step(self, players: dict, round_index: int, rng: np.random.Generator) -> Dict[str, object]:
+        """推进一局参与状态，返回本局参与的 {player_id: 玩家}（内部集合，调用方只读）"""
+        if round_index == 1:
+            self.steps = 0
+            self._initialize(players, rng)
+            return self.active
+        if len(players) != self.known_players:
+            self._register(players, rng)
+        self.steps += 1
+
+        # ✅ 仅对参与中的玩家掷退出
+        dropped_mask = rng.random(len(self.active)) < DROP_PROB
+        dropped = list(compress(self.active.values(), dropped_mask.tolist()))
+        for player in dropped:
+            del self.active[player.uid]
+            player.is_active = False
+            player.consecutive_missed = 1
+        self._schedule_wakeups(dropped, np.ones(len(dropped), dtype=np.int64), rng)
+
+        # ✅ 本步回归的玩家
+        woken = self.wakeups.pop(self.steps, [])
+        for player in woken:
+            self.active[player.uid] = player
+            player.is_active = True
+            player.consecutive_missed = 0
+        self._mark(woken, self.ACTIVE)
+        return self.active
+
+    @classmethod
+    def from_rows(cls, players: PlayerPopulation, wake_at: np.ndarray, order: np.ndarray, steps: int, known_players: int, sequence: int) -> "ActivityTracker":
+        """由行状态列还原参与集合与唤醒队列（状态快照恢复）"""
+        tracker = cls()
+        tracker.steps, tracker.known_players, tracker.sequence = steps, known_players, sequence
+        tracker.wake_at, tracker.order = wake_at, order
+        active_rows = np.flatnonzero(wake_at == cls.ACTIVE)
+        active_rows = active_rows[np.argsort(order[active_rows], kind="stable")].tolist()
+        tracker.active = dict(zip(players.uid_list(active_rows), players.views(active_rows)))
+        sleeping = np.flatnonzero(wake_at >= 0)
+        sleeping = sleeping[np.lexsort((order[sleeping], wake_at[sleeping]))]
+        steps_sorted = wake_at[sleeping]
+        keys, starts = np.unique(steps_sorted, return_index=True)
+        views = players.views(sleeping.tolist())
+        for key, lo, hi in zip(keys.tolist(), starts.tolist(), np.append(starts[1:], len(sleeping)).tolist()):
+            tracker.wakeups[key] = views[lo:hi]
+        return tracker
+
+
+def generate_bets_vectorized(
+    players: dict,
+    round_index: int,
+    rng: np.random.Generator = None,
+    tracker: Optional[ActivityTracker] = None
+) -> dict:
+    """
+    generate_bets 的批量向量化版本，统计上与逐玩家版本等价：
+    - 参与状态转移（含 0.1 + 0.05 * consecutive_missed 回归概率）一次向量运算完成
+    - 区域选择：每位玩家对 8 个区域随机排序取前 k 个（等价于 random.sample）
+    - 500 单元分配：按所选区域赔率倒数权重做多项分布抽样
+    - players 为 PlayerPopulation 时参与状态直接在列数组上转移，标签按行号查表，不逐玩家读写对象
+    rng：numpy.random.Generator 或种子；显式传入即可复现
+    tracker：传入 ActivityTracker 时参与状态改为稀疏维护（每局只处理参与中与回归的玩家），
+    同一人群应始终使用同一个 tracker
+    返回格式与 generate_bets 相同。
+    """
+    if rng is None:
+        rng = _default_rng
+    elif not isinstance(rng, np.random.Generator):
+        rng = np.random.default_rng(rng)
+
+    if tracker is not None:
+        active = tracker.step(players, round_index, rng)
+        return _generate_active_bets(list(active), list(active.values()), rng)
+
+    n = len(players)
+    if n == 0:
+        return {}
+
+    # ✅ 列式人群：状态转移直接写回列数组
+    if isinstance(players, PlayerPopulation):
+        is_active, missed = _transition_activity(
+            players.is_active, players.consecutive_missed, rng.random(n), round_index
+        )
+        players.is_active[:] = is_active
+        players.consecutive_missed[:] = missed
+        rows = np.flatnonzero(is_active)
+        return _generate_active_bets(players.uid_list(rows.tolist()), rows, rng, population=players)
+
+    player_ids = list(players.keys())
+    player_list = list(players.values())
+    is_active = np.fromiter((p.is_active for p in player_list), dtype=bool, count=n)
+    missed = np.fromiter((p.consecutive_missed for p in player_list), dtype=np.int64, count=n)
+    is_active, missed = _transition_activity(is_active, missed, rng.random(n), round_index)
+
+    for p, active, m in zip(player_list, is_active.tolist(), missed.tolist()):
+        p.is_active = active
+        p.consecutive_missed = m
+
+    active_idx = np.flatnonzero(is_active).tolist()
+    return _generate_active_bets(
+        [player_ids[i] for i in active_idx],
+        [player_list[i] for i in active_idx],
+        rng
+    )
+
+
+def _transition_activity(is_active: np.ndarray, missed: np.ndarray, u: np.ndarray, round_index: int):
+    """全量参与状态转移（与 generate_bets 一致），返回新的 (is_active, consecutive_missed)"""
+    if round_index == 1:
+        is_active = u < INITIAL_ACTIVE_PROB
+        return is_active, np.where(is_active, missed, 1)
+    dropped = is_active & (u > 1 - DROP_PROB)
+    restored = ~is_active & (u < restore_probability(missed))
+    still_missed = ~is_active & ~restored
+    missed = np.where(dropped, 1, np.where(restored, 0, np.where(still_missed, missed + 1, missed)))
+    return (is_active & ~dropped) | restored, missed
+
+
+def _gather_tags(active_players, population: Optional[PlayerPopulation]):
+    """取参与玩家的 (金额基数, 选区数下限, 选区数上限)：列式人群按行号查表，其余逐对象读取"""
+    if population is None and active_players and isinstance(active_players[0], PlayerView):
+        population = active_players[0].population
+        active_players = np.fromiter((p.row for p in active_players), dtype=np.int64, count=len(active_players))
+    if population is not None:
+        area_range = population.area_ranges(active_players)
+        return population.amount_scales(active_players), area_range[:, 0], area_range[:, 1]
+    k = len(active_players)
+    scale = np.fromiter((p.amount_scale for p in active_players), dtype=np.float64, count=k)
+    area_low = np.fromiter((p.area_range[0] for p in active_players), dtype=np.int64, count=k)
+    area_high = np.fromiter((p.area_range[1] for p in active_players), dtype=np.int64, count=k)
+    return scale, area_low, area_high
+
+
+def _generate_active_bets(
+    active_ids: List[str],
+    active_players,
+    rng: np.random.Generator,
+    population: Optional[PlayerPopulation] = None
+) -> dict:
+    """
+    为本局参与的玩家批量生成下注。
+    active_players：玩家对象列表；传入 population 时为该人群中的行号数组
+    """
+    k = len(active_ids)
+    if k == 0:
+        return {}
+
+    # 投注总额与区域数
+    scale, area_low, area_high = _gather_tags(active_players, population)
+    total_amount = rng.integers((scale * 0.8).astype(np.int64), (scale * 1.2).astype(np.int64), endpoint=True)
+    chosen_num = rng.integers(area_low, area_high, endpoint=True)
+
+    # 随机选区：随机排序后取前 chosen_num 个
+    ranks = rng.random((k, len(AREA_IDS))).argsort(axis=1).argsort(axis=1)
+    chosen = ranks < chosen_num[:, None]
+
+    # 按赔率倒数权重做多项分布分配 500 单元
+    weights = np.where(chosen, INVERSE_PAYOUT_WEIGHTS, 0.0)
+    weights /= weights.sum(axis=1, keepdims=True)
+    units = rng.multinomial(total_amount // BET_UNIT, weights)
+
+    bets = {}
+    amounts = (units * BET_UNIT).tolist()
+    area_ids = AREA_IDS.tolist()
+    for pid, row in zip(active_ids, amounts):
+        bets[pid] = {area: amount for area, amount in zip(area_ids, row) if amount > 0}
+    return bets
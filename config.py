@@ -41,4 +41,11 @@ TARGET_RTP = 0.995  # 目标 RTP
 
 # 盈利态势
 MEMORY_WINDOW = 30  # N 局窗口长度
-MEMORY_DECAY_ALPHA = 0.1   # 衰减函数参数，控制遗忘速度
\ No newline at end of file
+MEMORY_DECAY_ALPHA = 0.1   # 衰减函数参数，控制遗忘速度
+
+# 页面会话日志
+APP_LOG_MAX_ROUNDS = 200  # 内存日志只保留最近多少局（None 为不限）；玩家记忆由玩家索引维护，不依赖完整日志
+
+# 状态快照（崩溃恢复）
+SNAPSHOT_DIR = None  # 页面会话的快照根目录（按页面地址中的键分子目录）；设置后进程内唯一在线的会话每局结算写快照，刷新页面 / 重启进程时自动恢复
+SNAPSHOT_FULL_EVERY = 10  # 每隔多少次快照写一次全量（其余为增量）
\ No newline at end of file
@@ -6,17 +6,170 @@
 包括两张表：
 1. round_log：以对局为主视角，记录平台维度的投注与盈利信息
 2. player_log：以玩家为主视角，记录每个玩家的下注与返奖信息
+
+日志写入可插拔的存储后端（见 log_storage）：默认为内存列表，也可切换为 SQLite / Parquet 持久化。
 """
 
 from config import MEMORY_WINDOW  # N 局窗口长度
-from typing import Dict, List
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from collections import deque
+from contextlib import contextmanager
+from log_storage import MemoryLogBackend
 
 # 对局日志（平台视角）
 round_log: List[Dict] = []
 
-# 玩家日志（个人视角）
+# 玩家日志（个人视角，完整记录，供导出使用）
 player_log: List[Dict] = []
 
+# 玩家近期投注索引：每个玩家最近的有投注记录（环形缓冲，O(1) 追加）
+# ✅ 多保留 1 条，保证当前局已记录后仍能取满 MEMORY_WINDOW 条历史局
+player_recent_log: Dict[str, Deque[Dict]] = {}
+
+# 玩家最新一条日志（含零投注局），用于按局查询当前记录
+player_latest_log: Dict[str, Dict] = {}
+
+# 延迟展开的玩家索引（状态快照恢复后）：player_id → 尚未解码的记录段，首次访问该玩家时展开到上面两个索引
+pending_player_index: Dict[str, Any] = {}
+_expand_pending: Optional[Callable[[str, Any], Tuple[Optional[Deque[Dict]], Optional[Dict]]]] = None
+
+# 是否保留完整 player_log（无界面长时间模拟时可关闭，仅维护玩家索引）
+keep_full_log: bool = True
+
+# 日志存储后端（默认写入上面的内存列表）
+log_backend = MemoryLogBackend(round_log, player_log)
+
+
+def set_log_backend(backend, *, warm_index: bool = True):
+    """
+    切换日志存储后端（如 SQLiteLogBackend / ParquetLogBackend），旧后端会被刷出并关闭。
+    - warm_index：从新后端加载各玩家最近的投注记录，重建玩家索引（进程重启后恢复记忆）
+    """
+    global log_backend
+    if backend is log_backend:
+        return
+    log_backend.close()
+    log_backend = backend
+    if warm_index:
+        warm_player_index()
+
+
+def warm_player_index():
+    """从存储后端重建玩家近期索引"""
+    player_recent_log.clear()
+    player_latest_log.clear()
+    pending_player_index.clear()
+    for player_id, records in log_backend.load_recent_by_player(MEMORY_WINDOW + 1).items():
+        player_recent_log[player_id] = deque(records, maxlen=MEMORY_WINDOW + 1)
+        player_latest_log[player_id] = records[-1]
+
+
+def set_pending_player_index(pending: Dict[str, Any], expand: Callable[[str, Any], Tuple[Optional[Deque[Dict]], Optional[Dict]]]):
+    """
+    登记延迟展开的玩家索引（恢复时不逐条解码记录）。expand(player_id, 记录段) 返回 (近期投注环形缓冲, 最新记录)。
+    """
+    global _expand_pending
+    pending_player_index.clear()
+    pending_player_index.update(pending)
+    _expand_pending = expand
+
+
+def expand_player_index(player_id: Optional[str] = None):
+    """展开延迟载入的玩家索引：指定玩家；player_id 为 None 时全部展开（遍历索引前调用）"""
+    player_ids = list(pending_player_index) if player_id is None else [player_id]
+    for pid in player_ids:
+        segments = pending_player_index.pop(pid, None)
+        if segments is None:
+            continue
+        recent, latest = _expand_pending(pid, segments)
+        if recent:
+            player_recent_log[pid] = recent
+        if latest is not None:
+            player_latest_log[pid] = latest
+
+
+def flush_logs():
+    """将后端写缓冲落盘"""
+    log_backend.flush()
+
+
+def iter_player_log() -> Iterator[Dict]:
+    """按写入顺序遍历完整玩家日志（导出使用）"""
+    return log_backend.iter_player_records()
+
+
+def set_memory_log_window(max_rounds: Optional[int]):
+    """内存后端只保留最近 max_rounds 局的日志（None 为不限）；持久化后端不受影响"""
+    if isinstance(log_backend, MemoryLogBackend):
+        log_backend.max_rounds = max_rounds
+
+
+@contextmanager
+def log_retention(enabled: bool):
+    """
+    在 with 块内临时设置全局日志保留，退出时恢复原设置（批量模拟 / 基准等独占进程的入口使用）。
+    对局状态各自的设置见 log_player_detail / log_round_summary 的 retain 参数。
+    """
+    previous = keep_full_log
+    set_log_retention(enabled)
+    try:
+        yield
+    finally:
+        set_log_retention(previous)
+
+
+def set_log_retention(enabled: bool):
+    """
+    设置是否写入完整日志（存储后端）；关闭后只维护玩家索引，记忆计算不受影响。
+    """
+    global keep_full_log
+    keep_full_log = enabled
+
+
+def reset_logs(keep_backend: bool = False):
+    """
+    清空全部日志与玩家索引（开始新的独立模拟时使用）。
+    持久化后端不删除已落盘记录，而是开始新的运行（run_id），之后的查询只涉及新运行。
+    - keep_backend：不重置存储后端，只清空玩家索引（从快照续跑时继续写入同一次运行）
+    """
+    if not keep_backend:
+        log_backend.reset()
+    player_recent_log.clear()
+    player_latest_log.clear()
+    pending_player_index.clear()
+
+
+def get_recent_player_logs(player_id: str, before_round: Optional[int] = None) -> List[Dict]:
+    """
+    读取玩家最近 MEMORY_WINDOW 条有投注记录（按时间顺序，最旧在前）。
+    - before_round：仅保留 round_id < before_round 的记录；为 None 时不过滤
+    """
+    if pending_player_index:
+        expand_player_index(player_id)
+    recent = player_recent_log.get(player_id)
+    if not recent:
+        return []
+    if before_round is None:
+        records = list(recent)
+    else:
+        records = [log for log in recent if log["round_id"] < before_round]
+        if len(records) < MEMORY_WINDOW and len(recent) == recent.maxlen:
+            # 查询较早的局，索引窗口已不覆盖，回退查询存储后端
+            records = log_backend.recent_player_records(player_id, before_round, MEMORY_WINDOW)
+    return records[-MEMORY_WINDOW:]
+
+
+def get_player_round_log(player_id: str, round_id: int) -> Optional[Dict]:
+    """
+    查询玩家在指定局的日志记录；最新局直接命中索引，否则回退查询存储后端。
+    """
+    if pending_player_index:
+        expand_player_index(player_id)
+    latest = player_latest_log.get(player_id)
+    if latest is not None and latest["round_id"] == round_id:
+        return latest
+    return log_backend.find_player_round(player_id, round_id)
+
 
 def log_round_summary(
     round_id: int,
@@ -24,12 +177,16 @@ def log_round_summary(
     area_totals: Dict[int, float],
     winning_areas: List[int],
     total_bet: float,
-    total_payout: float
+    total_payout: float,
+    retain: Optional[bool] = None
 ):
     """
     记录单局平台级别数据：投注分布、开奖结果、盈利情况
+    - retain：是否写入存储后端；None 时取全局 keep_full_log（对局状态可各自设置，见 state["keep_full_log"]）
     """
-    round_log.append({
+    if not (keep_full_log if retain is None else retain):
+        return
+    log_backend.append_round({
         "round_id": round_id,
         "player_bets": player_bets,
         "area_total_bets": area_totals,
@@ -45,15 +202,14 @@ def log_player_detail(
     player_id: str,
     area_bets: Dict[int, float],
     total_bet: float,
-    payout: float
+    payout: float,
+    retain: Optional[bool] = None
 ):
+    """retain：是否写入存储后端；None 时取全局 keep_full_log。玩家索引总是更新"""
     net_profit = payout - total_bet
 
     # 获取该玩家近 MEMORY_WINDOW 局投注额
-    recent_bets = [
-        log["total_bet"] for log in player_log
-        if log["player_id"] == player_id and log["total_bet"] > 0
-    ][-MEMORY_WINDOW:]
+    recent_bets = [log["total_bet"] for log in get_recent_player_logs(player_id)]
 
     if recent_bets:
         avg_bet_recent = sum(recent_bets) / len(recent_bets)
@@ -61,7 +217,7 @@ def log_player_detail(
     else:
         memory_profit = 0.0
 
-    player_log.append({
+    record = {
         "round_id": round_id,
         "player_id": player_id,
         "area_bets": area_bets,
@@ -69,4 +225,13 @@ def log_player_detail(
         "payout": payout,
         "net_profit": net_profit,
         "memory_profit": memory_profit
-    })
+    }
+    if keep_full_log if retain is None else retain:
+        log_backend.append_player(record)
+
+    # ✅ 同步更新玩家索引
+    player_latest_log[player_id] = record
+    if total_bet > 0:
+        if player_id not in player_recent_log:
+            player_recent_log[player_id] = deque(maxlen=MEMORY_WINDOW + 1)
+        player_recent_log[player_id].append(record)
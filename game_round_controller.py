@@ -1,12 +1,21 @@
-from betting_input import generate_bets
-from config import PAYOUT_RATES, ROUND_TOTAL_DURATION, BETTING_DURATION, STD_THRESHOLD, ANIMATION_DURATION
-from score_engine import simulate_structure_metrics, simulate_structure_memory_effect  
+from betting_input import ActivityTracker, generate_bets_vectorized
+from config import (
+    ROUND_TOTAL_DURATION, BETTING_DURATION, WAITING_DURATION, STD_THRESHOLD, ANIMATION_DURATION, TARGET_RTP
+)
+from score_engine import (
+    simulate_structure_metrics, simulate_structure_memory_effect,
+    simulate_structure_metrics_from_book, simulate_structure_memory_effect_from_book, merge_memory_effects
+)
+from anytime_evaluator import AnytimeEvaluator
+from bet_book import BetBook
+from bet_scheduler import BetScheduler
+from player_profiles import PlayerStatsStore, register_players
 from strategy import select_structure
-import random
-import pandas as pd
 from enum import Enum, auto
-import streamlit as st
-from db_logger import log_player_detail
+import time
+from db_logger import log_player_detail, log_round_summary
+from metrics_engine import update_memory_attitude
+from structure_matrix import AREAS, areas_to_mask, calculate_payout, compute_area_totals, build_structure_payout_table
 
 # ✅ 游戏阶段枚举，用于结构化替代 time_to_next_round 魔法判断
 class GamePhase(Enum):
@@ -15,6 +24,52 @@ class GamePhase(Enum):
     ANIMATION = auto()
     SETTLED = auto()
 
+def begin_round(state, current_bets=None):
+    """
+    重置单局状态并开始新一局（st.session_state 与普通 dict 通用）。
+    current_bets：导入局的既有下注，缺省为空。导入局不再生成模拟下注（回放生产局），
+    其中未登记的玩家以零起点统计补登记。
+    """
+    state["time_to_next_round"] = ROUND_TOTAL_DURATION
+    state["countdown_bet"] = BETTING_DURATION
+    state["countdown_result"] = WAITING_DURATION
+    state["current_bets"] = current_bets if current_bets is not None else {}
+    state["imported_round"] = current_bets is not None
+    if current_bets is not None:
+        register_players(state["stat_players"], current_bets)
+    state["final_outcome"] = None
+    state["forced_outcome"] = None
+    state["structure_result_cache"] = None
+    state["bet_book"] = None
+    state["running"] = True
+
+def build_visual_context(state):
+    """UI 展示：构建结构柱状图、推荐结构表格、高亮区域等上下文（state 可为 session_state 或引擎快照）"""
+    cache = state.get("structure_result_cache") or {}
+    payout_table = cache.get("payout_table")
+    area_totals = payout_table["area_totals"] if payout_table else compute_area_totals(state["current_bets"])
+    structure_sums = {area: float(total) for area, total in zip(AREAS, area_totals)}
+
+    highlight_areas = set()
+    if state.get("final_outcome"):
+        highlight_areas = set(state["final_outcome"].get("winning_areas", []))
+    elif cache:
+        for r in cache.get("all_structures", []):
+            if r.get("within_confidence"):
+                highlight_areas.update(r.get("winning_areas", []))
+
+    forced_areas = set(state["forced_outcome"]["winning_areas"]) if state.get("forced_outcome") else None
+
+    import pandas as pd  # 仅页面渲染使用，无界面运行不加载 pandas
+    table_df = pd.DataFrame(cache.get("all_structures", []))
+
+    return {
+        "structure_sums": structure_sums,
+        "highlight_areas": highlight_areas,
+        "forced_areas": forced_areas,
+        "table_df": table_df
+    }
+
 class GameRoundController:
     """
     控制单轮对局的控制器类，封装下注生成、结构模拟、开奖与结算。
@@ -31,6 +86,12 @@ class GameRoundController:
         self.stat_players = state["stat_players"]
         self.target_rtp = state.get("target_rtp", 0.98)
         self.confidence_level = state.get("confidence_level", 0.95)
+        # ✅ 策略参数覆盖（参数扫描用）：std_threshold / target_rtp，缺省取 config
+        self.strategy_params = state.get("strategy_params") or {}
+        # ✅ 阶段剖析：仅在启用时包装阶段方法，关闭时无任何额外开销
+        profiler = state.get("profiler")
+        if profiler is not None and profiler.enabled:
+            profiler.instrument(self)
 
     def get_current_phase(self) -> GamePhase:
         t = self.state["time_to_next_round"]
@@ -45,114 +106,267 @@ class GameRoundController:
 
     def initialize_bets(self):
         """下注阶段初始化下注节奏与计划"""
-        self.state["partial_bets"] = generate_bets(self.sim_players, self.round_id)
+        self.state["partial_bets"] = self.generate_round_bets()
 
-        for pid, bets in self.state["partial_bets"].items():
-            scheduled_seconds = []
-            bet_times = random.randint(1, BETTING_DURATION)
+        # ✅ 一次向量化生成全部落定事件（按时间分桶），tick 时只弹出到期事件
+        self.state["bet_schedule"] = BetScheduler.build(
+            self.state["partial_bets"],
+            BETTING_DURATION,
+            rng=self.state.get("bet_rng")
+        )
 
-            # ✅ 用 set 去重，避免重复下注时间
-            while len(scheduled_seconds) < bet_times:
-                sec = int(random.gauss(mu=BETTING_DURATION * 0.75, sigma=max(1, BETTING_DURATION / 6)))
-                if 1 <= sec <= BETTING_DURATION and sec not in scheduled_seconds:
-                    scheduled_seconds.append(sec)
+        self.start_bet_book()
+        self.evaluate_structures()
 
-            scheduled_seconds.sort()
-            self.state.setdefault("bet_schedule", {})
-            self.state["bet_schedule"][pid] = scheduled_seconds
+    def generate_round_bets(self):
+        """
+        批量生成本局下注计划；state["bet_rng"] 为可复现的随机数生成器（缺省为模块级生成器），
+        参与状态由 state["activity_tracker"] 稀疏维护（每局只处理参与中与回归的玩家）
+        """
+        if self.state.get("imported_round"):
+            return {}
+        if self.state.get("activity_tracker") is None:
+            self.state["activity_tracker"] = ActivityTracker()
+        return generate_bets_vectorized(
+            self.sim_players,
+            self.round_id,
+            self.state.get("bet_rng"),
+            tracker=self.state["activity_tracker"]
+        )
 
-        self.evaluate_structures()
+    def start_bet_book(self):
+        """创建本局下注簿，并载入已存在的下注（如导入局）"""
+        bettors = set(self.state["partial_bets"]) | set(self.state["current_bets"])
+        player_recharges = {
+            pid: self.sim_players[pid].recharge_amount
+            for pid in bettors if pid in self.sim_players
+        }
+        self.state["bet_book"] = BetBook(
+            self.stat_players,
+            player_recharges,
+            self.round_id,
+            target_rtp=self.strategy_params.get("target_rtp", TARGET_RTP)
+        )
+        self.state["bet_book"].apply_bets(self.state["current_bets"])
+
+    def place_bets(self, landed_bets):
+        """
+        写入本次落定的下注（逐区域覆盖），并按增量同步下注簿。
+        landed_bets: dict[str, dict[int, float]]
+        """
+        for pid, full_bet in landed_bets.items():
+            self.state["current_bets"].setdefault(pid, {})
+            for area, total_amount in full_bet.items():
+                self.state["current_bets"][pid][area] = total_amount
+
+        bet_book = self.state.get("bet_book")
+        if bet_book is not None and bet_book.round_id == self.round_id:
+            bet_book.apply_bets({pid: self.state["current_bets"][pid] for pid in landed_bets})
 
     def tick_betting_phase(self):
         """下注阶段每秒推进节奏（支持倍速）"""
         second_passed = BETTING_DURATION - self.state["countdown_bet"]
-        for pid, full_bet in self.state["partial_bets"].items():
-            scheduled_times = self.state.get("bet_schedule", {}).get(pid, [])
-            if second_passed in scheduled_times:
-                self.state["current_bets"].setdefault(pid, {})
-                for area, total_amount in full_bet.items():
-                    self.state["current_bets"][pid][area] = total_amount
+        landed_bets = self.state["bet_schedule"].pop_due(second_passed)
 
-        self.evaluate_structures()
+        # ✅ 只对本秒落定下注的玩家做增量更新
+        self.place_bets(landed_bets)
+        # ✅ 最后一拍之后下注已全部落定，这次评估处在开奖前的延迟敏感路径上
+        self.evaluate_structures(final=self.state["countdown_bet"] <= 1)
         self.state["countdown_bet"] -= 1
 
-    def evaluate_structures(self):
-        results, std_analysis_data, std_bounds, sample_size = simulate_structure_metrics(
-            self.stat_players,
-            self.state["current_bets"],
-            confidence_level=self.confidence_level,
-            base_std=STD_THRESHOLD
-        )
+    def evaluate_structures(self, final: bool = False):
+        """
+        计算结构指标并写入 state["structure_result_cache"]。
+        - final：本局下注已全部落定（最后一拍 / 无界面一次性落定）。设置了 state["decision_budget_ms"] 时
+          这次评估按预算逐级进行（见 AnytimeEvaluator.evaluate），其余情况做完整评估；
+          完整评估的各级耗时作为限时决策的实测值
+        """
+        budget_ms = self.state.get("decision_budget_ms")
+        if budget_ms:
+            evaluator = self.anytime_evaluator()
+            if final:
+                evaluator.evaluate(self, budget_ms)
+                return
 
-        # ✅ 新增：提取玩家充值额度（传给 memory_effect 模块）
-        player_recharges = {
-            pid: p.recharge_amount
-            for pid, p in st.session_state.sim_players.items()
+        level_start = time.perf_counter()
+        payout_table, results, std_analysis_data, std_bounds, sample_size = self.compute_structure_metrics()
+        std_ms = (time.perf_counter() - level_start) * 1000
+        level_start = time.perf_counter()
+        memory_effects = self.compute_memory_effects()
+
+        # 合并 memory_effect 到结构指标中
+        merge_memory_effects(results, memory_effects)
+        if budget_ms:
+            evaluator.observe("std", std_ms)
+            evaluator.observe("memory", (time.perf_counter() - level_start) * 1000)
+
+        self.state["structure_result_cache"] = {
+            "all_structures": results,
+            "std_analysis": std_analysis_data,
+            "std_bounds": std_bounds,
+            "sample_size": sample_size,
+            "payout_table": payout_table,
+            "bet_version": self.bet_book_version(),
+            "fidelity": "memory"
         }
 
+    def anytime_evaluator(self) -> AnytimeEvaluator:
+        """限时决策评估器（跨局保留各等级耗时估计），首次使用时创建"""
+        if self.state.get("anytime_evaluator") is None:
+            self.state["anytime_evaluator"] = AnytimeEvaluator()
+        return self.state["anytime_evaluator"]
+
+    def active_bet_book(self):
+        """本局有效的下注簿（不存在或不属于本局时返回 None）"""
+        bet_book = self.state.get("bet_book")
+        if bet_book is not None and bet_book.round_id == self.round_id:
+            return bet_book
+        return None
+
+    def bet_book_version(self):
+        """本局下注簿版本 (局号, 写入次数)；无有效下注簿时为 None（此时结构指标缓存无法判断是否过期）"""
+        bet_book = self.active_bet_book()
+        if bet_book is None:
+            return None
+        return bet_book.round_id, bet_book.version
+
+    def compute_payout_table(self):
+        """本局结构派奖表：由区域总额一次算出，供开奖策略、结算统计与 UI 共用"""
+        bet_book = self.active_bet_book()
+        if bet_book is not None:
+            return bet_book.payout_table()
+        return build_structure_payout_table(compute_area_totals(self.state["current_bets"]))
+
+    def compute_structure_metrics(self, payout_table=None):
+        """结构级 STD 指标，返回 (payout_table, results, std_analysis_data, std_bounds, sample_size)"""
+        base_std = self.strategy_params.get("std_threshold", STD_THRESHOLD)
+        bet_book = self.active_bet_book()
+        if payout_table is None:
+            payout_table = self.compute_payout_table()
+
+        if bet_book is not None:
+            # ✅ 下注簿已增量维护各项累加量，评估成本与全场人数无关
+            results, std_analysis_data, std_bounds, sample_size = simulate_structure_metrics_from_book(
+                bet_book,
+                confidence_level=self.confidence_level,
+                base_std=base_std
+            )
+        else:
+            results, std_analysis_data, std_bounds, sample_size = simulate_structure_metrics(
+                self.stat_players,
+                self.state["current_bets"],
+                confidence_level=self.confidence_level,
+                base_std=base_std,
+                target_rtp=self.strategy_params.get("target_rtp", TARGET_RTP)
+            )
+        return payout_table, results, std_analysis_data, std_bounds, sample_size
+
+    def compute_memory_effects(self):
+        """各结构的记忆态势效果"""
+        bet_book = self.active_bet_book()
+        if bet_book is not None:
+            return simulate_structure_memory_effect_from_book(bet_book)
+
+        # ✅ 新增：提取玩家充值额度（传给 memory_effect 模块）
         player_recharges = {
             pid: p.recharge_amount
-            for pid, p in st.session_state.sim_players.items()
+            for pid, p in self.sim_players.items()
         }
 
-        memory_effects = simulate_structure_memory_effect(
+        return simulate_structure_memory_effect(
             self.stat_players,
             self.state["current_bets"],
             player_recharges,
             round_id=self.round_id
         )
 
-
-        # 合并 memory_effect 到结构指标中
-        for struct in results:
-            match = next((m for m in memory_effects if m["winning_areas"] == struct["winning_areas"]), None)
-            if match:
-                struct["memory_effect"] = match["memory_effect"]
-
-        self.state["structure_result_cache"] = {
-            "all_structures": results,
-            "std_analysis": std_analysis_data,
-            "std_bounds": std_bounds,
-            "sample_size": sample_size
-        }
-
     def finalize_outcome(self):
-        """开奖：优先强控，否则使用策略选择结构"""
+        """
+        开奖：优先强控，否则使用策略选择结构。
+        state["decision_budget_ms"] 设置时启用限时决策：在最后一次结构评估的缓存基础上按预算补算，
+        返回当前最优结构，决策信息（达到的保真度、耗时）写入 state["decision_info"]；
+        开奖结构确定后再补测未实测的等级耗时（不计入预算）。
+        """
+        self.state["decision_info"] = None
         if self.state["forced_outcome"]:
             self.state["final_outcome"] = self.state["forced_outcome"]
+        elif self.state.get("decision_budget_ms"):
+            rtp_target = self.state["platform_pool"].get_current_rtp_target()
+            evaluator = self.anytime_evaluator()
+            decision = evaluator.decide(self, rtp_target, self.state["decision_budget_ms"])
+            self.state["decision_info"] = decision
+            self.state["final_outcome"] = decision["outcome"]
+            evaluator.calibrate(self)
         else:
             rtp_target = self.state["platform_pool"].get_current_rtp_target()
             outcome = select_structure(
                 self.state["structure_result_cache"]["all_structures"],
                 self.state["current_bets"],
                 std_bounds=self.state["structure_result_cache"]["std_bounds"],
-                base_std=rtp_target  # ✅ 由水池决定的动态 RTP 目标
+                base_std=rtp_target,  # ✅ 由水池决定的动态 RTP 目标
+                payout_table=self.state["structure_result_cache"].get("payout_table")
             )
             self.state["final_outcome"] = outcome
 
     def settle(self):
         """结算：计算玩家 RTP 与回收，并同步水池入出账"""
-        winning_areas = self.state["final_outcome"]["winning_areas"]
+        winning_mask = areas_to_mask(self.state["final_outcome"]["winning_areas"])
+        retain = self.state.get("keep_full_log")  # 本桌的日志保留设置，None 为跟随全局
+        player_ids, bet_sums, payouts = [], [], []
         for pid, bets in self.state["current_bets"].items():
             bet_sum = sum(bets.values())
-            payout = sum(v * PAYOUT_RATES[a] for a, v in bets.items() if a in winning_areas)
+            payout = calculate_payout(bets, winning_mask)
 
-            # ✅ 统一在结算阶段计入水池
-            self.state["platform_pool"].inflow(bet_sum)
-            self.state["platform_pool"].outflow(payout)
-
-            self.stat_players[pid].update(bet_sum, payout)
-            rtp = self.stat_players[pid].rtp()
-            self.state["rtp_history"].setdefault(pid, []).append(rtp)
+            player_ids.append(pid)
+            bet_sums.append(bet_sum)
+            payouts.append(payout)
 
             log_player_detail(
             round_id=self.round_id,
             player_id=pid,
             area_bets=bets,
             total_bet=bet_sum,
-            payout=payout
+            payout=payout,
+            retain=retain
+        )
+            # ✅ 结算后刷新该玩家的记忆态势缓存，下局评估直接读取
+            update_memory_attitude(pid)
+
+        # ✅ 统一在结算阶段计入水池：整局一次入出账
+        self.state["platform_pool"].settle_round(sum(bet_sums), sum(payouts), self.round_id)
+
+        # ✅ 列式仓库一次性批量累加，普通字典逐个更新
+        if isinstance(self.stat_players, PlayerStatsStore):
+            self.stat_players.bulk_update(player_ids, bet_sums, payouts)
+        else:
+            for pid, bet_sum, payout in zip(player_ids, bet_sums, payouts):
+                self.stat_players[pid].update(bet_sum, payout)
+
+        # ✅ 记录对局级汇总（平台视角）
+        cache = self.state.get("structure_result_cache") or {}
+        payout_table = cache.get("payout_table")
+        area_totals = payout_table["area_totals"] if payout_table else compute_area_totals(self.state["current_bets"])
+        log_round_summary(
+            round_id=self.round_id,
+            player_bets=self.state["current_bets"],
+            area_totals={area: float(total) for area, total in zip(AREAS, area_totals)},
+            winning_areas=self.state["final_outcome"]["winning_areas"],
+            total_bet=sum(bet_sums),
+            total_payout=sum(payouts),
+            retain=retain
         )
 
+        # ✅ rtp_history 为 None 时不记录逐局 RTP（无界面批量模拟）
+        rtp_history = self.state.get("rtp_history")
+        if rtp_history is not None:
+            for pid in player_ids:
+                rtp_history.setdefault(pid, []).append(self.stat_players[pid].rtp())
+
+        # ✅ 局边界快照（state["snapshot_manager"] 为 state_snapshot.SnapshotManager 时启用）：本线程只抓取，写盘在后台
+        snapshots = self.state.get("snapshot_manager")
+        if snapshots is not None:
+            snapshots.on_round_settled(self.state)
+
     def tick(self):
         if self.state["time_to_next_round"] > (ROUND_TOTAL_DURATION - BETTING_DURATION):
             if self.state["countdown_bet"] == BETTING_DURATION:
@@ -170,27 +384,4 @@ class GameRoundController:
 
     def get_visual_context(self):
         """UI 展示：构建结构柱状图、推荐结构表格、高亮区域等上下文"""
-        structure_sums = {i: 0 for i in range(1, 9)}
-        for bets in self.state["current_bets"].values():
-            for area, amt in bets.items():
-                if area in structure_sums:
-                    structure_sums[area] += amt
-
-        highlight_areas = set()
-        if self.state.get("final_outcome"):
-            highlight_areas = set(self.state["final_outcome"].get("winning_areas", []))
-        elif self.state.get("structure_result_cache"):
-            for r in self.state["structure_result_cache"].get("all_structures", []):
-                if r.get("within_confidence"):
-                    highlight_areas.update(r.get("winning_areas", []))
-
-        forced_areas = set(self.state["forced_outcome"]["winning_areas"]) if self.state.get("forced_outcome") else None
-
-        table_df = pd.DataFrame(self.state.get("structure_result_cache", {}).get("all_structures", []))
-
-        return {
-            "structure_sums": structure_sums,
-            "highlight_areas": highlight_areas,
-            "forced_areas": forced_areas,
-            "table_df": table_df
-        }
+        return build_visual_context(self.state)
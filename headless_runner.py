@@ -0,0 +1,325 @@
+# headless_runner.py
+
+"""
+无界面批量模拟模块：
+- 不依赖 Streamlit，以普通 dict 作为对局状态（键与 session_state 保持一致）
+- 紧凑循环驱动 generate_bets → evaluate_structures → finalize_outcome → settle，无倒计时与 sleep
+- 统计吞吐量、最终水池与 RTP 指标
+
+命令行用法：
+    python headless_runner.py --rounds 100000 --players 200 --seed 42
+"""
+
+import argparse
+import os
+import random
+import time
+from typing import Any, Callable, Dict, Optional
+import numpy as np
+from config import ROUND_TOTAL_DURATION, BETTING_DURATION, WAITING_DURATION, WINNING_STRUCTURES
+from player_profiles import initialize_players, PlayerPopulation, PlayerStats, PlayerStatsStore
+from platform_pool import PlatformPool
+from betting_input import make_bet_rng
+from game_round_controller import GameRoundController
+import db_logger
+from log_storage import SQLiteLogBackend, ParquetLogBackend
+from metrics_engine import reset_memory_attitude_cache
+from structure_matrix import structure_index
+from stage_profiler import StageProfiler
+from anytime_evaluator import FIDELITY_LEVELS
+from state_snapshot import SnapshotManager, has_snapshot, restore_snapshot
+
+
+def create_headless_state(
+    num_players: int = 200,
+    *,
+    platform_pool: Optional[PlatformPool] = None,
+    track_rtp_history: bool = False,
+    confidence_level: float = 0.95,
+    strategy_params: Optional[Dict[str, float]] = None,
+    bet_seed: Optional[int] = None,
+    profile: bool = False,
+    decision_budget_ms: Optional[float] = None,
+    player_prefix: str = "player_",
+    population_file: Optional[str] = None,
+    keep_full_log: Optional[bool] = None
+) -> Dict[str, Any]:
+    """
+    构建与 state_manager.initialize_session_state 同结构的普通状态字典。
+    - track_rtp_history=False 时不记录逐局 RTP，避免长时间模拟内存持续增长
+    - strategy_params：覆盖 std_threshold / target_rtp（见 GameRoundController）
+    - bet_seed：下注生成器种子
+    - profile：启用控制器阶段剖析（state["profiler"]）
+    - decision_budget_ms：开奖限时决策预算（毫秒），None 为常规决策
+    - player_prefix：玩家 ID 前缀（多桌时各桌不同）
+    - population_file：人群文件（.npz）；文件存在时直接载入（忽略 num_players / player_prefix），否则生成后保存
+    - keep_full_log：本状态结算时是否写入完整日志；None 为跟随 db_logger 全局设置
+    """
+    if population_file and os.path.exists(population_file):
+        sim_players = PlayerPopulation.load(population_file)
+    else:
+        sim_players = initialize_players(num_players, prefix=player_prefix)
+        if population_file:
+            sim_players.save(population_file)
+    return {
+        "sim_players": sim_players,
+        "stat_players": PlayerStatsStore(sim_players.keys()),
+        "rtp_history": {} if track_rtp_history else None,
+        "round_id": 1,
+        "time_to_next_round": ROUND_TOTAL_DURATION,
+        "countdown_bet": BETTING_DURATION,
+        "countdown_result": WAITING_DURATION,
+        "current_bets": {},
+        "running": False,
+        "final_outcome": None,
+        "forced_outcome": None,
+        "structure_result_cache": None,
+        "partial_bets": {},
+        "bet_book": None,
+        "imported_round": False,
+        "activity_tracker": None,
+        "platform_pool": platform_pool if platform_pool is not None else PlatformPool(),
+        "target_rtp": 0.98,
+        "confidence_level": confidence_level,
+        "bet_rng": make_bet_rng(bet_seed),
+        "strategy_params": dict(strategy_params or {}),
+        "profiler": StageProfiler(enabled=profile),
+        "decision_budget_ms": decision_budget_ms,
+        "anytime_evaluator": None,
+        "decision_info": None,
+        "snapshot_manager": None,
+        "keep_full_log": keep_full_log,
+    }
+
+
+def play_round(state: Dict[str, Any]) -> Dict:
+    """
+    无倒计时地完成一整局：下注一次性全部落定 → 结构评估 → 开奖 → 结算。
+    返回本局开奖结构。
+    """
+    state["current_bets"] = {}
+    state["final_outcome"] = None
+    state["structure_result_cache"] = None
+
+    controller = GameRoundController(state)
+    state["partial_bets"] = controller.generate_round_bets()
+    controller.start_bet_book()
+    controller.place_bets(state["partial_bets"])
+    controller.evaluate_structures(final=True)
+    controller.finalize_outcome()
+    controller.settle()
+    return state["final_outcome"]
+
+
+def summarize_player_rtp(stat_players) -> Dict[str, float]:
+    """汇总有投注玩家的累计 RTP 分布（stat_players 为 PlayerStatsStore 或 Dict[str, PlayerStats]）"""
+    if isinstance(stat_players, PlayerStatsStore):
+        size = len(stat_players)
+        rtps = stat_players.rtp()[stat_players.total_bet[:size] > 0]
+    else:
+        rtps = np.array([p.rtp() for p in stat_players.values() if p.total_bet > 0], dtype=np.float64)
+    if rtps.size == 0:
+        return {"players": 0, "mean": 0.0, "std": 0.0, "p5": 0.0, "p50": 0.0, "p95": 0.0}
+    return {
+        "players": int(rtps.size),
+        "mean": float(rtps.mean()),
+        "std": float(rtps.std()),
+        "p5": float(np.percentile(rtps, 5)),
+        "p50": float(np.percentile(rtps, 50)),
+        "p95": float(np.percentile(rtps, 95)),
+    }
+
+
+def run_simulation(
+    rounds: int,
+    num_players: int = 200,
+    seed: Optional[int] = None,
+    *,
+    state: Optional[Dict[str, Any]] = None,
+    state_options: Optional[Dict[str, Any]] = None,
+    keep_full_log: bool = False,
+    on_round: Optional[Callable[[Dict[str, Any], Dict], None]] = None
+) -> Dict[str, Any]:
+    """
+    连续模拟 rounds 局并返回统计报告。
+    - seed：同时设置 random 与 numpy 全局随机种子，并作为下注生成器种子，保证可复现
+    - state：传入已有状态则在其基础上继续；否则新建（会清空全局日志与记忆缓存）
+    - state_options：新建状态时传给 create_headless_state 的参数
+    - keep_full_log：是否保留完整 player_log（默认关闭，仅维护玩家索引）
+    - on_round(state, outcome)：每局结算后的回调，可用于自定义采样
+    """
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+
+    if state is None:
+        db_logger.reset_logs()
+        reset_memory_attitude_cache()
+        state = create_headless_state(num_players, **{"bet_seed": seed, **(state_options or {})})
+
+    pool = state["platform_pool"]
+    pool_trajectory = []
+    structure_hits = {tuple(s["areas"]): 0 for s in WINNING_STRUCTURES}
+    confidence_hits = 0
+    fidelity_counts = {level: 0 for level in FIDELITY_LEVELS}
+    decision_ms = []
+    total_bet = 0.0
+    total_payout = 0.0
+
+    start = time.perf_counter()
+    with db_logger.log_retention(keep_full_log):
+        try:
+            for _ in range(rounds):
+                outcome = play_round(state)
+                winning_areas = outcome["winning_areas"]
+
+                payout_table = state["structure_result_cache"]["payout_table"]
+                total_bet += payout_table["total_bet"]
+                total_payout += float(payout_table["payout"][structure_index(winning_areas)])
+
+                structure_hits[tuple(winning_areas)] = structure_hits.get(tuple(winning_areas), 0) + 1
+                if outcome.get("within_confidence"):
+                    confidence_hits += 1
+                pool_trajectory.append(pool.get_pool_value())
+
+                decision_info = state.get("decision_info")
+                if decision_info:
+                    fidelity_counts[decision_info["fidelity"]] += 1
+                    decision_ms.append(decision_info["elapsed_ms"])
+
+                if on_round is not None:
+                    on_round(state, outcome)
+                state["round_id"] += 1
+        finally:
+            db_logger.flush_logs()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "rounds": rounds,
+        "players": len(state["sim_players"]),
+        "seed": seed,
+        "elapsed_sec": elapsed,
+        "rounds_per_sec": rounds / elapsed if elapsed > 0 else float("inf"),
+        "final_pool_value": pool.get_pool_value(),
+        "final_rtp_target": pool.get_current_rtp_target(),
+        "total_bet": total_bet,
+        "total_payout": total_payout,
+        "platform_rtp": total_payout / total_bet if total_bet > 0 else 0.0,
+        "confidence_hit_rate": confidence_hits / rounds if rounds > 0 else 0.0,
+        "structure_hits": structure_hits,
+        "fidelity_counts": fidelity_counts,
+        "decision_p99_ms": float(np.percentile(decision_ms, 99)) if decision_ms else None,
+        "player_rtp": summarize_player_rtp(state["stat_players"]),
+        "pool_trajectory": pool_trajectory,
+        "state": state,
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    rtp = report["player_rtp"]
+    lines = [
+        f"模拟局数：{report['rounds']:,}（玩家 {report['players']:,} 人，种子 {report['seed']}）",
+        f"耗时：{report['elapsed_sec']:.2f}s，吞吐：{report['rounds_per_sec']:,.1f} 局/秒",
+        f"最终水池值：{report['final_pool_value']:,.0f}，当前目标RTP：{report['final_rtp_target'] * 100:.1f}%",
+        f"平台总投注：{report['total_bet']:,.0f}，总派奖：{report['total_payout']:,.0f}，平台RTP：{report['platform_rtp'] * 100:.2f}%",
+        f"置信区间命中率：{report['confidence_hit_rate'] * 100:.1f}%",
+        f"玩家RTP（{rtp['players']} 人）：均值 {rtp['mean']:.4f}，STD {rtp['std']:.4f}，"
+        f"P5 {rtp['p5']:.4f}，P50 {rtp['p50']:.4f}，P95 {rtp['p95']:.4f}",
+        "结构开出次数：" + "，".join(
+            f"{list(areas)}={count}" for areas, count in report["structure_hits"].items()
+        ),
+    ]
+    if report.get("decision_p99_ms") is not None:
+        lines.append(
+            "限时决策保真度：" + "，".join(f"{level}={count}" for level, count in report["fidelity_counts"].items())
+            + f"，决策耗时 P99 {report['decision_p99_ms']:.3f}ms"
+        )
+    return "\n".join(lines)
+
+
+def format_profile(profiler: StageProfiler) -> str:
+    lines = ["阶段耗时（最近窗口）："]
+    for row in profiler.summary():
+        lines.append(
+            f"  {row['stage']:<20} 调用 {row['count']:>8,}  均值 {row['wall_mean_ms']:.3f}ms  "
+            f"P50 {row['wall_p50_ms']:.3f}ms  P99 {row['wall_p99_ms']:.3f}ms  CPU {row['cpu_mean_ms']:.3f}ms  "
+            f"净存活块 {row['alloc_blocks_mean']:+.0f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="无界面批量模拟控奖对局")
+    parser.add_argument("--rounds", type=int, default=100_000, help="模拟局数")
+    parser.add_argument("--players", type=int, default=200, help="玩家人数")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    parser.add_argument("--population", type=str, default=None, help="人群文件（.npz）：存在则载入，否则生成后保存")
+    parser.add_argument("--keep-log", action="store_true", help="保留完整玩家日志")
+    parser.add_argument("--log-db", type=str, default=None, help="将日志写入 SQLite 数据库文件（隐含 --keep-log）")
+    parser.add_argument("--log-parquet", type=str, default=None, help="将日志写入 Parquet 目录（隐含 --keep-log）")
+    parser.add_argument("--decision-budget-ms", type=float, default=None, help="开奖限时决策预算（毫秒）")
+    parser.add_argument("--profile", action="store_true", help="启用控制器阶段剖析并输出各阶段耗时")
+    parser.add_argument("--snapshot-dir", type=str, default=None, help="每局结算后写状态快照到该目录")
+    parser.add_argument("--snapshot-full-every", type=int, default=10, help="每隔多少次快照写一次全量（其余为增量）")
+    parser.add_argument("--snapshot-compress", action="store_true", help="压缩快照文件（写入变慢，磁盘占用减少）")
+    parser.add_argument("--resume", action="store_true", help="从 --snapshot-dir 的最近快照恢复后继续模拟")
+    parser.add_argument("--metrics-out", type=str, default=None, help="阶段剖析导出文件（.json 或 Prometheus 文本，隐含 --profile）")
+    args = parser.parse_args(argv)
+
+    keep_full_log = args.keep_log
+    if args.log_db:
+        db_logger.set_log_backend(SQLiteLogBackend(args.log_db), warm_index=False)
+        keep_full_log = True
+    elif args.log_parquet:
+        db_logger.set_log_backend(ParquetLogBackend(args.log_parquet), warm_index=False)
+        keep_full_log = True
+
+    state_options = {
+        "profile": args.profile or bool(args.metrics_out),
+        "decision_budget_ms": args.decision_budget_ms,
+        "population_file": args.population
+    }
+    state = None
+    seed = args.seed
+    if args.snapshot_dir:
+        # ✅ 与 run_simulation 新建状态的顺序一致：先设种再生成人群，同一 --seed 有无快照结果相同
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+        resume = args.resume and has_snapshot(args.snapshot_dir)
+        db_logger.reset_logs(keep_backend=resume)  # 续跑时持久化日志沿用同一次运行
+        reset_memory_attitude_cache()
+        state = create_headless_state(args.players, **{"bet_seed": seed, **state_options})
+        if resume:
+            info = restore_snapshot(args.snapshot_dir, state)
+            state["round_id"] += 1
+            print(f"从快照恢复：第 {info['round_id']} 局结算后，耗时 {info['elapsed_ms']:.1f}ms")
+        state["snapshot_manager"] = SnapshotManager(
+            args.snapshot_dir, full_every=args.snapshot_full_every, compress=args.snapshot_compress
+        )
+
+    try:
+        report = run_simulation(
+            args.rounds, args.players,
+            None if state is not None else seed,  # 已设种（或随快照恢复随机状态）的状态不再重新设种
+            state=state,
+            keep_full_log=keep_full_log,
+            state_options=state_options
+        )
+    finally:
+        if state is not None:
+            state["snapshot_manager"].flush(state)
+        db_logger.log_backend.close()
+    report["seed"] = seed
+    print(format_report(report))
+
+    profiler = report["state"]["profiler"]
+    if profiler.enabled:
+        print(format_profile(profiler))
+        if args.metrics_out:
+            profiler.export(args.metrics_out)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+# log_storage.py
+
+"""
+日志存储后端模块（供 db_logger 使用）：
+- MemoryLogBackend：进程内列表（默认；对局记录只存区域总额，逐玩家下注见 player_log）
+- SQLiteLogBackend：SQLite 持久化，批量写入 + WAL 模式 + (player_id, round_id) 索引
+- ParquetLogBackend：追加写 Parquet，缓冲满一个行组即落盘为一个分片文件（需 pyarrow）
+
+后两者只在内存中保留一个写缓冲，长时间运行内存占用保持平稳；
+近 MEMORY_WINDOW 局的记忆查询仍由 db_logger 的玩家索引承担，后端只处理更早的历史查询与导出。
+
+持久化后端按运行编号（run_id）区分多次独立模拟：打开已有存储时续写最近一次运行，
+reset()（db_logger.reset_logs）开始新的运行；查询与导出只涉及当前运行，同一文件重复运行不会混入局号相同的旧记录。
+"""
+
+import json
+import os
+import sqlite3
+from typing import Dict, Iterator, List, Optional
+
+# 玩家日志中的区域列（列式存储，区域 1~8）
+AREA_COLUMNS = [f"area_{a}" for a in range(1, 9)]
+PLAYER_FIELDS = ["round_id", "player_id", *AREA_COLUMNS, "total_bet", "payout", "net_profit", "memory_profit"]
+ROUND_FIELDS = ["round_id", "player_bets", "area_total_bets", "winning_areas", "total_bet", "total_payout", "platform_profit"]
+
+
+def _player_record_to_row(record: Dict) -> tuple:
+    area_bets = record["area_bets"]
+    return (
+        record["round_id"],
+        record["player_id"],
+        *(float(area_bets.get(a, 0)) for a in range(1, 9)),
+        record["total_bet"],
+        record["payout"],
+        record["net_profit"],
+        record["memory_profit"],
+    )
+
+
+def _row_to_player_record(row) -> Dict:
+    values = dict(zip(PLAYER_FIELDS, row))
+    return {
+        "round_id": int(values["round_id"]),
+        "player_id": values["player_id"],
+        "area_bets": {a: values[f"area_{a}"] for a in range(1, 9) if values[f"area_{a}"]},
+        "total_bet": values["total_bet"],
+        "payout": values["payout"],
+        "net_profit": values["net_profit"],
+        "memory_profit": values["memory_profit"],
+    }
+
+
+def _round_record_to_row(record: Dict) -> tuple:
+    return (
+        record["round_id"],
+        json.dumps({pid: {str(a): v for a, v in bets.items()} for pid, bets in record["player_bets"].items()}),
+        json.dumps({str(a): v for a, v in record["area_total_bets"].items()}),
+        json.dumps(list(record["winning_areas"])),
+        record["total_bet"],
+        record["total_payout"],
+        record["platform_profit"],
+    )
+
+
+class MemoryLogBackend:
+    """
+    进程内列表存储（默认后端）。
+    - keep_player_bets：对局记录是否保留整局的 player_bets。默认不保留：
+      逐玩家下注已在 player_log 中，对局记录只存区域总额，避免每局再持有一份全场下注字典
+    - max_rounds：只保留最近 max_rounds 局的对局与玩家日志（None 为不限）；
+      页面会话长时间运行时内存占用保持平稳，更早的历史查询返回空
+    """
+
+    def __init__(
+        self,
+        round_log: Optional[List[Dict]] = None,
+        player_log: Optional[List[Dict]] = None,
+        *,
+        keep_player_bets: bool = False,
+        max_rounds: Optional[int] = None
+    ):
+        self.round_log = round_log if round_log is not None else []
+        self.player_log = player_log if player_log is not None else []
+        self.keep_player_bets = keep_player_bets
+        self.max_rounds = max_rounds
+
+    def append_round(self, record: Dict):
+        if not self.keep_player_bets:
+            record = {key: value for key, value in record.items() if key != "player_bets"}
+        self.round_log.append(record)
+        if self.max_rounds is not None:
+            self._trim(record["round_id"] - self.max_rounds + 1)
+
+    def _trim(self, oldest_round: int):
+        """丢弃 round_id < oldest_round 的记录（日志按局号递增写入，只需从头部截断）"""
+        for log in (self.round_log, self.player_log):
+            cut = 0
+            while cut < len(log) and log[cut]["round_id"] < oldest_round:
+                cut += 1
+            if cut:
+                del log[:cut]
+
+    def append_player(self, record: Dict):
+        self.player_log.append(record)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def reset(self):
+        self.round_log.clear()
+        self.player_log.clear()
+
+    def recent_player_records(self, player_id: str, before_round: int, limit: int) -> List[Dict]:
+        records = []
+        for log in reversed(self.player_log):
+            if log["player_id"] == player_id and log["round_id"] < before_round and log["total_bet"] > 0:
+                records.append(log)
+                if len(records) == limit:
+                    break
+        records.reverse()
+        return records
+
+    def find_player_round(self, player_id: str, round_id: int) -> Optional[Dict]:
+        return next((
+            log for log in self.player_log
+            if log["player_id"] == player_id and log["round_id"] == round_id
+        ), None)
+
+    def load_recent_by_player(self, limit: int) -> Dict[str, List[Dict]]:
+        recent: Dict[str, List[Dict]] = {}
+        for log in self.player_log:
+            if log["total_bet"] > 0:
+                recent.setdefault(log["player_id"], []).append(log)
+        return {pid: logs[-limit:] for pid, logs in recent.items()}
+
+    def iter_player_records(self) -> Iterator[Dict]:
+        return iter(list(self.player_log))
+
+
+class SQLiteLogBackend:
+    """
+    SQLite 存储：
+    - 写入先进缓冲，满 batch_size 条后 executemany 一次提交
+    - WAL 模式，读写互不阻塞；synchronous=NORMAL 兼顾吞吐与安全
+    - 查询前自动刷出缓冲，保证读到最新数据
+    - 两张表带 run_id 列（旧库迁移时已有记录记为运行 0），查询只读当前运行
+    """
+
+    def __init__(self, path: str, batch_size: int = 5000):
+        self.path = path
+        self.batch_size = batch_size
+        self._player_buffer: List[tuple] = []
+        self._round_buffer: List[tuple] = []
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        area_defs = ", ".join(f"{c} REAL NOT NULL DEFAULT 0" for c in AREA_COLUMNS)
+        self.conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS player_log (
+                round_id INTEGER NOT NULL,
+                player_id TEXT NOT NULL,
+                {area_defs},
+                total_bet REAL NOT NULL,
+                payout REAL NOT NULL,
+                net_profit REAL NOT NULL,
+                memory_profit REAL NOT NULL,
+                run_id INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS round_log (
+                round_id INTEGER NOT NULL,
+                player_bets TEXT NOT NULL,
+                area_total_bets TEXT NOT NULL,
+                winning_areas TEXT NOT NULL,
+                total_bet REAL NOT NULL,
+                total_payout REAL NOT NULL,
+                platform_profit REAL NOT NULL,
+                run_id INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+        for table in ("player_log", "round_log"):
+            if "run_id" not in {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN run_id INTEGER NOT NULL DEFAULT 0")
+        self.conn.executescript("""
+            CREATE INDEX IF NOT EXISTS idx_player_log_run_player_round ON player_log (run_id, player_id, round_id);
+            CREATE INDEX IF NOT EXISTS idx_round_log_run_round ON round_log (run_id, round_id);
+        """)
+        self.conn.commit()
+        latest = self._latest_run()
+        self.run_id = latest if latest is not None else 1
+
+    def _latest_run(self) -> Optional[int]:
+        return self.conn.execute(
+            "SELECT MAX(run_id) FROM (SELECT run_id FROM player_log UNION ALL SELECT run_id FROM round_log)"
+        ).fetchone()[0]
+
+    def append_round(self, record: Dict):
+        self._round_buffer.append((*_round_record_to_row(record), self.run_id))
+        if len(self._round_buffer) >= self.batch_size:
+            self.flush()
+
+    def append_player(self, record: Dict):
+        self._player_buffer.append((*_player_record_to_row(record), self.run_id))
+        if len(self._player_buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._player_buffer and not self._round_buffer:
+            return
+        with self.conn:
+            for table, fields, buffer in (
+                ("player_log", PLAYER_FIELDS, self._player_buffer),
+                ("round_log", ROUND_FIELDS, self._round_buffer)
+            ):
+                if buffer:
+                    columns = [*fields, "run_id"]
+                    self.conn.executemany(
+                        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                        buffer
+                    )
+        self._player_buffer = []
+        self._round_buffer = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def reset(self):
+        """开始新的运行（已落盘的记录保留，按 run_id 区分）；当前运行尚无记录时沿用当前编号"""
+        self.flush()
+        latest = self._latest_run()
+        if latest is not None and latest >= self.run_id:
+            self.run_id = latest + 1
+
+    def recent_player_records(self, player_id: str, before_round: int, limit: int) -> List[Dict]:
+        self.flush()
+        rows = self.conn.execute(
+            f"SELECT {', '.join(PLAYER_FIELDS)} FROM player_log "
+            "WHERE run_id = ? AND player_id = ? AND round_id < ? AND total_bet > 0 "
+            "ORDER BY round_id DESC, rowid DESC LIMIT ?",
+            (self.run_id, player_id, before_round, limit)
+        ).fetchall()
+        return [_row_to_player_record(row) for row in reversed(rows)]
+
+    def find_player_round(self, player_id: str, round_id: int) -> Optional[Dict]:
+        self.flush()
+        row = self.conn.execute(
+            f"SELECT {', '.join(PLAYER_FIELDS)} FROM player_log "
+            "WHERE run_id = ? AND player_id = ? AND round_id = ? ORDER BY rowid LIMIT 1",
+            (self.run_id, player_id, round_id)
+        ).fetchone()
+        return _row_to_player_record(row) if row else None
+
+    def load_recent_by_player(self, limit: int) -> Dict[str, List[Dict]]:
+        self.flush()
+        rows = self.conn.execute(
+            f"SELECT {', '.join(PLAYER_FIELDS)} FROM ("
+            f"  SELECT *, ROW_NUMBER() OVER (PARTITION BY player_id ORDER BY round_id DESC, rowid DESC) AS rn"
+            f"  FROM player_log WHERE run_id = ? AND total_bet > 0"
+            f") WHERE rn <= ? ORDER BY player_id, round_id",
+            (self.run_id, limit)
+        ).fetchall()
+        recent: Dict[str, List[Dict]] = {}
+        for row in rows:
+            record = _row_to_player_record(row)
+            recent.setdefault(record["player_id"], []).append(record)
+        return recent
+
+    def iter_player_records(self) -> Iterator[Dict]:
+        self.flush()
+        cursor = self.conn.execute(
+            f"SELECT {', '.join(PLAYER_FIELDS)} FROM player_log WHERE run_id = ? ORDER BY rowid",
+            (self.run_id,)
+        )
+        for row in cursor:
+            yield _row_to_player_record(row)
+
+
+class ParquetLogBackend:
+    """
+    Parquet 追加写存储（需安装 pyarrow）：
+    - 写入先进列式缓冲，满 row_group_size 行即写出一个分片文件（单行组）
+    - 目录结构：{directory}/run-000001/player_log/part-000000.parquet、{directory}/run-000001/round_log/...，
+      每次运行一个子目录（旧版直接写在 {directory}/player_log 下的分片视为运行 0）
+    - 已落盘分片不可变，可被 pandas / pyarrow.dataset 直接读取
+    """
+
+    def __init__(self, directory: str, row_group_size: int = 50_000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("ParquetLogBackend 需要安装 pyarrow：pip install pyarrow") from e
+        self._pa = pa
+        self._pq = pq
+        self.directory = directory
+        self.row_group_size = row_group_size
+        self._player_buffer: List[tuple] = []
+        self._round_buffer: List[tuple] = []
+        os.makedirs(directory, exist_ok=True)
+        latest = self._latest_run()
+        self._open_run(latest if latest is not None else 1)
+
+    def _run_directory(self, run_id: int) -> str:
+        return self.directory if run_id == 0 else os.path.join(self.directory, f"run-{run_id:06d}")
+
+    def _count_parts(self, run_id: int, table: str) -> int:
+        path = os.path.join(self._run_directory(run_id), table)
+        return len([f for f in os.listdir(path) if f.endswith(".parquet")]) if os.path.isdir(path) else 0
+
+    def _latest_run(self) -> Optional[int]:
+        runs = [int(name[4:]) for name in os.listdir(self.directory) if name.startswith("run-") and name[4:].isdigit()]
+        if runs:
+            return max(runs)
+        return 0 if self._count_parts(0, "player_log") or self._count_parts(0, "round_log") else None
+
+    def _open_run(self, run_id: int):
+        self.run_id = run_id
+        self._parts = {table: self._count_parts(run_id, table) for table in ("player_log", "round_log")}
+
+    def _write_part(self, table: str, fields: List[str], rows: List[tuple]):
+        columns = list(zip(*rows))
+        arrow_table = self._pa.table({name: list(col) for name, col in zip(fields, columns)})
+        os.makedirs(os.path.join(self._run_directory(self.run_id), table), exist_ok=True)
+        path = os.path.join(self._run_directory(self.run_id), table, f"part-{self._parts[table]:06d}.parquet")
+        self._pq.write_table(arrow_table, path, row_group_size=len(rows))
+        self._parts[table] += 1
+
+    def append_round(self, record: Dict):
+        self._round_buffer.append(_round_record_to_row(record))
+        if len(self._round_buffer) >= self.row_group_size:
+            self._write_part("round_log", ROUND_FIELDS, self._round_buffer)
+            self._round_buffer = []
+
+    def append_player(self, record: Dict):
+        self._player_buffer.append(_player_record_to_row(record))
+        if len(self._player_buffer) >= self.row_group_size:
+            self._write_part("player_log", PLAYER_FIELDS, self._player_buffer)
+            self._player_buffer = []
+
+    def flush(self):
+        if self._player_buffer:
+            self._write_part("player_log", PLAYER_FIELDS, self._player_buffer)
+            self._player_buffer = []
+        if self._round_buffer:
+            self._write_part("round_log", ROUND_FIELDS, self._round_buffer)
+            self._round_buffer = []
+
+    def close(self):
+        self.flush()
+
+    def reset(self):
+        """开始新的运行（新的 run-* 子目录，已落盘的分片保留）；当前运行尚无分片时沿用当前编号"""
+        self.flush()
+        if any(self._parts.values()):
+            self._open_run(max(self._latest_run() or 0, self.run_id) + 1)
+
+    def _read_players(self, filters=None) -> List[Dict]:
+        records = []
+        path = os.path.join(self._run_directory(self.run_id), "player_log")
+        if self._parts["player_log"]:
+            table = self._pq.read_table(path, filters=filters)
+            records.extend(_row_to_player_record(row) for row in zip(*(table.column(f).to_pylist() for f in PLAYER_FIELDS)))
+        records.extend(_row_to_player_record(row) for row in self._player_buffer)
+        return records
+
+    def recent_player_records(self, player_id: str, before_round: int, limit: int) -> List[Dict]:
+        records = [
+            log for log in self._read_players([("player_id", "=", player_id), ("round_id", "<", before_round)])
+            if log["player_id"] == player_id and log["round_id"] < before_round and log["total_bet"] > 0
+        ]
+        return records[-limit:]
+
+    def find_player_round(self, player_id: str, round_id: int) -> Optional[Dict]:
+        return next((
+            log for log in self._read_players([("player_id", "=", player_id), ("round_id", "=", round_id)])
+            if log["player_id"] == player_id and log["round_id"] == round_id
+        ), None)
+
+    def load_recent_by_player(self, limit: int) -> Dict[str, List[Dict]]:
+        recent: Dict[str, List[Dict]] = {}
+        for log in self._read_players([("total_bet", ">", 0)]):
+            if log["total_bet"] > 0:
+                recent.setdefault(log["player_id"], []).append(log)
+        return {pid: logs[-limit:] for pid, logs in recent.items()}
+
+    def iter_player_records(self) -> Iterator[Dict]:
+        return iter(self._read_players())
@@ -7,20 +7,49 @@
 - 输出每个结构的标准差、样本详情、权重、命中情况等分析指标
 """
 
-from typing import Dict
+from typing import Any, Callable, Dict, Optional
+import numpy as np
 from config import MINIMUM_BET_THRESHOLD, TARGET_RTP, MEMORY_WINDOW, MEMORY_DECAY_ALPHA
 from player_profiles import PlayerStats
-from scipy.stats import norm
-from db_logger import player_log  # 
+from db_logger import get_recent_player_logs, get_player_round_log, player_recent_log, pending_player_index, expand_player_index
 import math
 from math import isclose
+from statistics import NormalDist
+
+# ✅ 预计算指数衰减权重 exp(-α·i)，i = 0 ~ MEMORY_WINDOW-1
+MEMORY_DECAY_WEIGHTS = [math.exp(-MEMORY_DECAY_ALPHA * i) for i in range(MEMORY_WINDOW)]
+
+# 玩家记忆态势缓存：player_id -> {"attitude", "shifted_attitude", "avg_bet", "last_round"}
+# - attitude：当前记忆态势值
+# - shifted_attitude：历史记忆整体后移一位（为新一局让出 i=0）后的加权和，用于结构模拟的单项增量
+# - avg_bet：近 MEMORY_WINDOW 个投注局的平均投注额（无历史时为 0）
+# - last_round：缓存所基于的最新投注局，用于判断缓存是否过期
+memory_attitude_cache: Dict[str, Dict] = {}
+
+# 延迟展开的记忆态势（状态快照恢复后）：player_id → 尚未解码的快照行，首次访问该玩家时展开到上面的缓存
+pending_memory_attitude: Dict[str, Any] = {}
+_expand_pending_memory: Optional[Callable[[str, Any], Dict]] = None
+
+
+# ✅ 置信度 → 双侧 z 值：按 0.001 步长预计算（覆盖界面滑块 0.800 ~ 0.999），其余取值首次使用时计算并缓存
+_STANDARD_NORMAL = NormalDist()
+Z_TABLE: Dict[float, float] = {
+    c / 1000: _STANDARD_NORMAL.inv_cdf(1 - (1000 - c) / 2000) for c in range(800, 1000)
+}
+
+
+def confidence_z(confidence: float) -> float:
+    z = Z_TABLE.get(confidence)
+    if z is None:
+        z = Z_TABLE[confidence] = _STANDARD_NORMAL.inv_cdf(1 - (1 - confidence) / 2)
+    return z
 
 
 # --- 动态置信区间计算 ---
 def compute_dynamic_std_confidence_interval(base_std: float, confidence: float, sample_size: int):
     if sample_size <= 1:
         return 0.0, base_std
-    z = norm.ppf(1 - (1 - confidence) / 2)
+    z = confidence_z(confidence)
     margin = z * base_std / (sample_size ** 0.5)
     return 0.0, base_std + margin  # ✅ 左边固定为 0
 
@@ -58,6 +87,32 @@ def calculate_weighted_std(players: Dict[str, PlayerStats], return_details=False
 
     return std
 
+# --- 加权 RTP 标准差（矩阵版，所有结构一次算完） ---
+def calculate_weighted_std_matrix(total_bets: np.ndarray, total_returns: np.ndarray, target_rtp: float = TARGET_RTP):
+    """
+    calculate_weighted_std 的向量化版本，一次计算所有结构。
+
+    - total_bets: shape=(玩家数,) 的累计投注
+    - total_returns: shape=(玩家数, 结构数) 的各结构下累计返奖
+    返回：(std, weighted_variance, rtp, eligible, total_weight)
+    其中 std / weighted_variance 为 shape=(结构数,)，rtp 为 shape=(玩家数, 结构数)
+    """
+    total_bets = np.asarray(total_bets, dtype=np.float64)
+    total_returns = np.asarray(total_returns, dtype=np.float64)
+    eligible = total_bets >= MINIMUM_BET_THRESHOLD
+
+    safe_bets = np.where(total_bets == 0, 1.0, total_bets)
+    rtp = np.where((total_bets == 0)[:, None], 1.0, total_returns / safe_bets[:, None])
+
+    weights = total_bets[eligible]
+    total_weight = float(weights.sum())
+    if total_weight == 0:
+        zeros = np.zeros(total_returns.shape[1])
+        return zeros, zeros, rtp, eligible, 0.0
+
+    weighted_variance = (weights[:, None] * (rtp[eligible] - target_rtp) ** 2).sum(axis=0) / total_weight
+    return np.sqrt(weighted_variance), weighted_variance, rtp, eligible, total_weight
+
 # --- 记忆盈利计算 ---
 def generate_memory_profit(player_id: str, round_id: int) -> float:
     """
@@ -68,24 +123,15 @@ def generate_memory_profit(player_id: str, round_id: int) -> float:
     - 若历史投注均为 0，返回 0.0；
     """
     # 当前局的日志记录
-    current = next((
-        log for log in player_log
-        if log["player_id"] == player_id and log["round_id"] == round_id
-    ), None)
+    current = get_player_round_log(player_id, round_id)
 
     if current is None:
         return 0.0
 
     net_profit = current["net_profit"]
 
-    # ✅ 正确回溯逻辑：向前查找满足 MEMORY_WINDOW 个非零投注局
-    recent_bets = []
-    for log in reversed(player_log):
-        if log["player_id"] == player_id and log["round_id"] < round_id:
-            if log["total_bet"] > 0:
-                recent_bets.append(log["total_bet"])
-            if len(recent_bets) == MEMORY_WINDOW:
-                break
+    # ✅ 从玩家索引读取此前 MEMORY_WINDOW 个非零投注局
+    recent_bets = [log["total_bet"] for log in get_recent_player_logs(player_id, before_round=round_id)]
 
     if not recent_bets:
         return 0.0
@@ -93,6 +139,94 @@ def generate_memory_profit(player_id: str, round_id: int) -> float:
     avg_bet = sum(recent_bets) / len(recent_bets)
     return net_profit / avg_bet if not isclose(avg_bet, 0.0) else 0.0
 
+def _build_memory_state(memory_list, recent_bets, last_round):
+    attitude = 0.0
+    for i, m in enumerate(memory_list):
+        attitude += m * MEMORY_DECAY_WEIGHTS[i]
+
+    shifted_attitude = 0.0
+    for i, m in enumerate(memory_list[:MEMORY_WINDOW - 1]):
+        shifted_attitude += m * MEMORY_DECAY_WEIGHTS[i + 1]
+
+    avg_bet = sum(recent_bets) / len(recent_bets) if recent_bets else 0.0
+    return {
+        "attitude": attitude,
+        "shifted_attitude": shifted_attitude,
+        "avg_bet": avg_bet,
+        "last_round": last_round
+    }
+
+def set_memory_decay_alpha(alpha: float):
+    """
+    重设记忆衰减参数 α（参数扫描用）：原地重算衰减权重并清空态势缓存。
+    """
+    MEMORY_DECAY_WEIGHTS[:] = [math.exp(-alpha * i) for i in range(MEMORY_WINDOW)]
+    memory_attitude_cache.clear()
+    pending_memory_attitude.clear()
+
+def reset_memory_attitude_cache():
+    """清空记忆态势缓存（与 db_logger.reset_logs 配合使用）"""
+    memory_attitude_cache.clear()
+    pending_memory_attitude.clear()
+
+def set_pending_memory_attitude(pending: Dict[str, Any], expand: Callable[[str, Any], Dict]):
+    """
+    登记延迟展开的记忆态势（恢复时不逐条解码）。expand(player_id, 快照行) 返回该玩家的态势字典。
+    """
+    global _expand_pending_memory
+    pending_memory_attitude.clear()
+    pending_memory_attitude.update(pending)
+    _expand_pending_memory = expand
+
+def expand_memory_attitude(player_id: Optional[str] = None):
+    """展开延迟载入的记忆态势：指定玩家；player_id 为 None 时全部展开（遍历缓存前调用）"""
+    player_ids = list(pending_memory_attitude) if player_id is None else [player_id]
+    for pid in player_ids:
+        rows = pending_memory_attitude.pop(pid, None)
+        if rows is not None:
+            memory_attitude_cache[pid] = _expand_pending_memory(pid, rows)
+
+def update_memory_attitude(player_id: str) -> Dict:
+    """
+    结算后刷新玩家的记忆态势缓存（每局每位下注玩家调用一次）。
+    """
+    recent_logs = get_recent_player_logs(player_id)
+    state = _build_memory_state(
+        [log["memory_profit"] for log in recent_logs if "memory_profit" in log],
+        [log["total_bet"] for log in recent_logs],
+        recent_logs[-1]["round_id"] if recent_logs else None
+    )
+    if pending_memory_attitude:
+        pending_memory_attitude.pop(player_id, None)
+    memory_attitude_cache[player_id] = state
+    return state
+
+def get_memory_state(player_id: str, round_id: int) -> Dict:
+    """
+    读取玩家在 round_id 局开局前的记忆态势状态。
+    - 缓存命中且未过期时 O(1) 返回
+    - 缓存缺失时按索引补算并写入缓存；查询历史局时直接计算、不写缓存
+    """
+    if pending_player_index:
+        expand_player_index(player_id)
+    if pending_memory_attitude:
+        expand_memory_attitude(player_id)
+    recent = player_recent_log.get(player_id)
+    newest_round = recent[-1]["round_id"] if recent else None
+
+    cached = memory_attitude_cache.get(player_id)
+    if newest_round is None or newest_round < round_id:
+        if cached is not None and cached["last_round"] == newest_round:
+            return cached
+        return update_memory_attitude(player_id)
+
+    recent_logs = get_recent_player_logs(player_id, before_round=round_id)
+    return _build_memory_state(
+        [log["memory_profit"] for log in recent_logs if "memory_profit" in log],
+        [log["total_bet"] for log in recent_logs],
+        recent_logs[-1]["round_id"] if recent_logs else None
+    )
+
 def calculate_memory_attitude(player_id: str, round_id: int) -> float:
     """
     根据历史记忆记录与指数衰减权重，生成当前的“记忆态势值”。
@@ -100,21 +234,6 @@ def calculate_memory_attitude(player_id: str, round_id: int) -> float:
     公式：Attitude = Σ(memory_profit_i × exp(-α * i))
     - i 越小越靠近当前，越大越久远
     - 仅统计有投注的 MEMORY_WINDOW 条历史记录
+    - 结果由 memory_attitude_cache 缓存，结算时刷新
     """
-    # 严格回溯最近 MEMORY_WINDOW 条有投注的历史记录（按时间顺序）
-    memory_list = []
-    for log in reversed(player_log):
-        if log["player_id"] == player_id and log["round_id"] < round_id and log["total_bet"] > 0:
-            if "memory_profit" in log:
-                memory_list.append(log["memory_profit"])
-            if len(memory_list) == MEMORY_WINDOW:
-                break
-    memory_list.reverse()  # i = 0 表示最新（当前局），越大越久远
-
-    # 加权求和
-    attitude = 0.0
-    for i, m in enumerate(memory_list):
-        weight = math.exp(-MEMORY_DECAY_ALPHA * i)
-        attitude += m * weight
-
-    return attitude
+    return get_memory_state(player_id, round_id)["attitude"]
@@ -0,0 +1,188 @@
+# param_sweep.py
+
+"""
+策略参数扫描模块（多进程蒙特卡洛）：
+- 输入参数网格（TARGET_RTP / STD_THRESHOLD / CONFIDENCE_LEVEL / MEMORY_DECAY_ALPHA / 水池水位线）
+- 每个 参数组合 × 随机种子 作为一个独立任务，分发到进程池运行无界面模拟
+- 汇总水池轨迹、RTP 分布、策略命中率，合并为一张 pandas 表
+
+同一组种子在所有参数组合间共用（公共随机数），结果完全由 base_seed 决定，可复现。
+
+命令行用法：
+    python param_sweep.py --rounds 2000 --seeds 4 --grid '{"std_threshold": [0.1, 0.15], "memory_decay_alpha": [0.05, 0.1]}'
+"""
+
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+import numpy as np
+import pandas as pd
+from config import CONFIDENCE_LEVEL, MEMORY_DECAY_ALPHA
+from platform_pool import PlatformPool
+from metrics_engine import set_memory_decay_alpha
+from headless_runner import run_simulation
+
+# 可扫描的参数
+SWEEP_PARAMS = ("target_rtp", "std_threshold", "confidence_level", "memory_decay_alpha", "rtp_thresholds")
+
+# 水池轨迹降采样后的最大点数
+TRAJECTORY_POINTS = 200
+
+
+def expand_grid(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """将 {参数: [取值...]} 展开为参数组合列表（笛卡尔积）"""
+    unknown = set(grid) - set(SWEEP_PARAMS)
+    if unknown:
+        raise ValueError(f"不支持的扫描参数：{sorted(unknown)}")
+    keys = list(grid.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def derive_seeds(base_seed: int, count: int) -> List[int]:
+    """由 base_seed 派生 count 个互相独立的随机种子"""
+    children = np.random.SeedSequence(base_seed).spawn(count)
+    return [int(child.generate_state(1)[0]) for child in children]
+
+
+def _parse_thresholds(thresholds) -> List[tuple]:
+    # JSON 无法表示 inf，允许 "inf" / "-inf" 字符串
+    return [(float(rtp), float(low), float(high)) for rtp, low, high in thresholds]
+
+
+def run_sweep_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    单个扫描任务（在工作进程中执行）：按参数配置运行一次无界面模拟，返回一行汇总结果。
+    """
+    params = job["params"]
+
+    # 记忆衰减参数为模块级预计算权重，每个任务都显式重设，避免受同进程上一个任务影响
+    set_memory_decay_alpha(params.get("memory_decay_alpha", MEMORY_DECAY_ALPHA))
+
+    pool = PlatformPool()
+    if "rtp_thresholds" in params:
+        pool.rtp_thresholds = _parse_thresholds(params["rtp_thresholds"])
+
+    strategy_params = {k: params[k] for k in ("target_rtp", "std_threshold") if k in params}
+    report = run_simulation(
+        job["rounds"],
+        job["num_players"],
+        job["seed"],
+        state_options={
+            "platform_pool": pool,
+            "confidence_level": params.get("confidence_level", CONFIDENCE_LEVEL),
+            "strategy_params": strategy_params,
+        }
+    )
+
+    trajectory = np.asarray(report["pool_trajectory"], dtype=np.float64)
+    step = max(1, len(trajectory) // TRAJECTORY_POINTS)
+
+    row = {"job_id": job["job_id"], "seed": job["seed"]}
+    for key in SWEEP_PARAMS:
+        value = params.get(key)
+        row[key] = json.dumps(value) if key == "rtp_thresholds" and value is not None else value
+    row.update({
+        "rounds": report["rounds"],
+        "players": report["players"],
+        "elapsed_sec": report["elapsed_sec"],
+        "rounds_per_sec": report["rounds_per_sec"],
+        "final_pool_value": report["final_pool_value"],
+        "pool_min": float(trajectory.min()) if trajectory.size else 0.0,
+        "pool_max": float(trajectory.max()) if trajectory.size else 0.0,
+        "pool_mean": float(trajectory.mean()) if trajectory.size else 0.0,
+        "pool_trajectory": trajectory[::step].tolist(),
+        "platform_rtp": report["platform_rtp"],
+        "confidence_hit_rate": report["confidence_hit_rate"],
+    })
+    for stat, value in report["player_rtp"].items():
+        row[f"player_rtp_{stat}"] = value
+    rounds = max(1, report["rounds"])
+    for areas, count in report["structure_hits"].items():
+        row[f"hit_{list(areas)}"] = count / rounds
+    return row
+
+
+def build_jobs(grid: Dict[str, List[Any]], *, rounds: int, num_players: int, seeds: List[int]) -> List[Dict[str, Any]]:
+    jobs = []
+    for params in expand_grid(grid):
+        for seed in seeds:
+            jobs.append({
+                "job_id": len(jobs),
+                "params": params,
+                "seed": seed,
+                "rounds": rounds,
+                "num_players": num_players,
+            })
+    return jobs
+
+
+def run_sweep(
+    grid: Dict[str, List[Any]],
+    *,
+    rounds: int = 1000,
+    num_players: int = 200,
+    num_seeds: int = 4,
+    base_seed: int = 0,
+    seeds: Optional[List[int]] = None,
+    max_workers: Optional[int] = None
+) -> pd.DataFrame:
+    """
+    在进程池中运行参数扫描，返回每个（参数组合 × 种子）一行的汇总表。
+    - seeds：显式指定种子列表；缺省时由 base_seed 派生 num_seeds 个
+    - max_workers：进程数，缺省为 CPU 核数；为 1 时在当前进程串行执行（便于调试）
+    """
+    if seeds is None:
+        seeds = derive_seeds(base_seed, num_seeds)
+    jobs = build_jobs(grid, rounds=rounds, num_players=num_players, seeds=seeds)
+
+    workers = max_workers or os.cpu_count() or 1
+    if workers == 1:
+        rows = [run_sweep_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            rows = list(executor.map(run_sweep_job, jobs))
+
+    return pd.DataFrame(rows).sort_values("job_id").reset_index(drop=True)
+
+
+def summarize_sweep(df: pd.DataFrame) -> pd.DataFrame:
+    """按参数组合聚合多种子结果（均值），便于对比"""
+    keys = [k for k in SWEEP_PARAMS if k in df.columns and df[k].notna().any()]
+    metrics = ["final_pool_value", "pool_min", "platform_rtp", "confidence_hit_rate", "player_rtp_mean", "player_rtp_std"]
+    if not keys:
+        return df[metrics].mean().to_frame().T
+    return df.groupby(keys, dropna=False)[metrics].mean().reset_index()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多进程策略参数扫描")
+    parser.add_argument("--grid", type=str, required=True, help="参数网格 JSON，如 '{\"std_threshold\": [0.1, 0.15]}'")
+    parser.add_argument("--rounds", type=int, default=1000, help="每个任务模拟局数")
+    parser.add_argument("--players", type=int, default=200, help="玩家人数")
+    parser.add_argument("--seeds", type=int, default=4, help="每个参数组合的种子数")
+    parser.add_argument("--base-seed", type=int, default=0, help="派生种子的基础种子")
+    parser.add_argument("--workers", type=int, default=None, help="进程数（默认 CPU 核数）")
+    parser.add_argument("--output", type=str, default=None, help="结果输出路径（.csv / .parquet）")
+    args = parser.parse_args(argv)
+
+    df = run_sweep(
+        json.loads(args.grid),
+        rounds=args.rounds,
+        num_players=args.players,
+        num_seeds=args.seeds,
+        base_seed=args.base_seed,
+        max_workers=args.workers
+    )
+    if args.output:
+        if args.output.endswith(".parquet"):
+            df.to_parquet(args.output, index=False)
+        else:
+            df.to_csv(args.output, index=False)
+    print(summarize_sweep(df).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,15 +4,68 @@
 平台水池管理模块：
 - 记录平台盈亏累积值（抽水后下注金额流入，中奖金额流出）
 - 根据水位线调整目标 RTP（实现动态放水 / 回收策略）
+- 历史记录为定长环形数组：最近的入出账明细 + 逐局汇总（入池、出池、抽水、局末水位），内存占用恒定
 """
 
-from typing import List, Tuple
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+
+class RingArray:
+    """
+    定长列式环形缓冲：每列一个 NumPy 数组，写满后覆盖最旧记录。
+    """
+
+    def __init__(self, capacity: int, columns: Dict[str, type]):
+        self.capacity = capacity
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in columns.items()}
+        self.next_index = 0  # 下一条写入位置
+        self.size = 0
+
+    def append(self, **values):
+        for name, value in values.items():
+            self.columns[name][self.next_index] = value
+        self.next_index = (self.next_index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def tail(self, n: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """取最近 n 条（按时间顺序，最旧在前）；n 为 None 时取全部"""
+        n = self.size if n is None else max(0, min(n, self.size))
+        idx = (self.next_index - n + np.arange(n)) % self.capacity
+        return {name: col[idx] for name, col in self.columns.items()}
+
+    def clear(self):
+        self.next_index = 0
+        self.size = 0
+
 
 class PlatformPool:
-    def __init__(self, initial_value: float = 5_000_000, tax_rate: float = 1.0):
+    def __init__(
+        self,
+        initial_value: float = 5_000_000,
+        tax_rate: float = 1.0,
+        *,
+        delta_history_size: int = 1024,
+        round_history_size: int = 10_000
+    ):
         self.pool_value = initial_value
         self.tax_rate = tax_rate / 100.0  # 1% => 0.01
-        self.history = []
+
+        # 最近入出账明细：direction 1 = 入池，-1 = 出池
+        self.deltas = RingArray(delta_history_size, {"direction": np.int8, "amount": np.float64})
+        # 逐局汇总
+        self.round_history = RingArray(round_history_size, {
+            "round_id": np.int64,
+            "inflow": np.float64,
+            "outflow": np.float64,
+            "tax": np.float64,
+            "pool_value": np.float64,
+        })
+        # 尚未归档到逐局汇总的入出账累计（逐笔调用 inflow / outflow 时使用）
+        self._pending_in = 0.0
+        self._pending_out = 0.0
+        self._pending_tax = 0.0
 
         # 水位线：按从高水位到低排序
         self.rtp_thresholds: List[Tuple[float, float, float]] = [
@@ -29,12 +82,34 @@ class PlatformPool:
         """下注入池（抽水后）"""
         taxed = bet_amount * (1 - self.tax_rate)
         self.pool_value += taxed
-        self.history.append(("in", taxed))
+        self._pending_in += taxed
+        self._pending_tax += bet_amount - taxed
+        self.deltas.append(direction=1, amount=taxed)
 
     def outflow(self, payout_amount: float):
         """派奖出池"""
         self.pool_value -= payout_amount
-        self.history.append(("out", payout_amount))
+        self._pending_out += payout_amount
+        self.deltas.append(direction=-1, amount=payout_amount)
+
+    def close_round(self, round_id: int):
+        """将逐笔 inflow / outflow 的累计归档为一条逐局汇总"""
+        self.round_history.append(
+            round_id=round_id,
+            inflow=self._pending_in,
+            outflow=self._pending_out,
+            tax=self._pending_tax,
+            pool_value=self.pool_value
+        )
+        self._pending_in = self._pending_out = self._pending_tax = 0.0
+
+    def settle_round(self, total_in: float, total_out: float, round_id: int = 0):
+        """
+        整局批量结算：一次完成入池（抽水后）、出池与逐局归档，替代每位玩家各一次 inflow / outflow。
+        """
+        self.inflow(total_in)
+        self.outflow(total_out)
+        self.close_round(round_id)
 
     def get_current_rtp_target(self) -> float:
         """根据当前水位线返回 RTP 目标值"""
@@ -47,4 +122,52 @@ class PlatformPool:
         return self.pool_value
 
     def get_latest_deltas(self, n: int = 10):
-        return self.history[-n:]
+        """最近 n 笔入出账，格式同旧版：[("in" | "out", amount), ...]"""
+        recent = self.deltas.tail(n)
+        return [
+            ("in" if direction > 0 else "out", float(amount))
+            for direction, amount in zip(recent["direction"].tolist(), recent["amount"].tolist())
+        ]
+
+    def get_round_history(self, n: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """最近 n 局的逐局汇总（列式数组，最旧在前）"""
+        return self.round_history.tail(n)
+
+
+class LockedPlatformPool(PlatformPool):
+    """
+    多桌共享水池：所有读写在同一把锁内完成，settle_round 的入池、出池与归档为原子操作。
+    各桌 round_id 独立，逐局汇总中的 round_id 仅作标识。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.RLock()
+
+    def inflow(self, bet_amount: float):
+        with self.lock:
+            super().inflow(bet_amount)
+
+    def outflow(self, payout_amount: float):
+        with self.lock:
+            super().outflow(payout_amount)
+
+    def close_round(self, round_id: int):
+        with self.lock:
+            super().close_round(round_id)
+
+    def settle_round(self, total_in: float, total_out: float, round_id: int = 0):
+        with self.lock:
+            super().settle_round(total_in, total_out, round_id)
+
+    def get_current_rtp_target(self) -> float:
+        with self.lock:
+            return super().get_current_rtp_target()
+
+    def get_latest_deltas(self, n: int = 10):
+        with self.lock:
+            return super().get_latest_deltas(n)
+
+    def get_round_history(self, n: Optional[int] = None) -> Dict[str, np.ndarray]:
+        with self.lock:
+            return super().get_round_history(n)
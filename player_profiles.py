@@ -1,4 +1,5 @@
 import random
+from typing import Dict, List, Optional
 import numpy as np
 
 class Player:
@@ -46,10 +47,235 @@ class Player:
         self.is_active = False
 
 
+# --- 列式玩家群体 ---
+# 标签类别编码顺序与 Player 中各映射表的键顺序一致，权重与 Player.__init__ 一致
+AMOUNT_CLASSES = list(Player.AMOUNT_SCALE_MAP)
+AREA_STYLES = list(Player.AREA_RANGE_MAP)
+FREQ_CLASSES = list(Player.BET_FREQUENCY)
+REBET_CLASSES = list(Player.REBET_PROBABILITY)
+TAG_WEIGHTS = {
+    "amount_class": [1, 2, 10],
+    "area_style": [1, 6, 1],
+    "freq_class": [3, 3, 1],
+    "rebet_class": [5, 3, 2],
+}
+
+# 编码 → 映射参数的查找表
+AMOUNT_SCALES = np.array([Player.AMOUNT_SCALE_MAP[c] for c in AMOUNT_CLASSES], dtype=np.float64)
+AREA_RANGES = np.array([Player.AREA_RANGE_MAP[c] for c in AREA_STYLES], dtype=np.int64)
+FREQ_VALUES = np.array([Player.BET_FREQUENCY[c] for c in FREQ_CLASSES], dtype=np.int64)
+REBET_VALUES = np.array([Player.REBET_PROBABILITY[c] for c in REBET_CLASSES], dtype=np.float64)
+
+# 充值额度参数（按金额档位）：对数正态 mean / sigma、截断下限 / 上限、取整单位
+RECHARGE_PARAMS = np.array([
+    [4, 0.5, 100, 5000, 100],  # 大R
+    [3, 0.4, 30, 100, 10],     # 中R
+    [2, 0.3, 0, 30, 5],        # 小R
+], dtype=np.float64)
+
+POPULATION_COLUMNS = {
+    "amount_class": np.int8,
+    "area_style": np.int8,
+    "freq_class": np.int8,
+    "rebet_class": np.int8,
+    "recharge_amount": np.int32,
+    "consecutive_missed": np.int32,
+    "is_active": np.bool_,
+}
+
+
+class PlayerView:
+    """
+    PlayerPopulation 中单个玩家的轻量视图（__slots__），属性与 Player 一致，
+    便于逐玩家代码（sim_players[pid].recharge_amount / .is_active = ...）无需改动。
+    """
+    __slots__ = ("population", "row")
+
+    def __init__(self, population, row):
+        self.population = population
+        self.row = row
+
+    @property
+    def uid(self):
+        return self.population.uid(self.row)
+
+    @property
+    def bet_amount_class(self):
+        return AMOUNT_CLASSES[self.population.amount_class[self.row]]
+
+    @property
+    def bet_area_style(self):
+        return AREA_STYLES[self.population.area_style[self.row]]
+
+    @property
+    def bet_freq_class(self):
+        return FREQ_CLASSES[self.population.freq_class[self.row]]
+
+    @property
+    def rebet_prob_class(self):
+        return REBET_CLASSES[self.population.rebet_class[self.row]]
+
+    @property
+    def amount_scale(self):
+        return Player.AMOUNT_SCALE_MAP[self.bet_amount_class]
+
+    @property
+    def area_range(self):
+        return Player.AREA_RANGE_MAP[self.bet_area_style]
+
+    @property
+    def bet_freq_value(self):
+        return Player.BET_FREQUENCY[self.bet_freq_class]
+
+    @property
+    def rebet_prob(self):
+        return Player.REBET_PROBABILITY[self.rebet_prob_class]
+
+    @property
+    def recharge_amount(self):
+        return int(self.population.recharge_amount[self.row])
+
+    @property
+    def consecutive_missed(self):
+        return int(self.population.consecutive_missed[self.row])
+
+    @consecutive_missed.setter
+    def consecutive_missed(self, value):
+        self.population.consecutive_missed[self.row] = value
+
+    @property
+    def is_active(self):
+        return bool(self.population.is_active[self.row])
+
+    @is_active.setter
+    def is_active(self, value):
+        self.population.is_active[self.row] = value
+
+
+class PlayerPopulation:
+    """
+    列式模拟玩家群体：标签类别编码、充值额度与参与状态各存一列 NumPy 数组（每人约 15 字节）。
+    - build()：几次向量化抽样生成 N 名玩家，标签与充值额度的分布与 Player 逐个构造一致
+    - 顺序 ID（prefix + 序号）按需生成，不为每位玩家常驻字符串；自定义 ID 时另存 ID 列表
+    - 兼容 Dict[str, Player] 的读取方式（players[pid]、in、keys/values/items），元素为 PlayerView
+    - save() / load()：.npz 人群文件，含参与状态，可跨进程复用同一人群
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], prefix: str = "player_", uids: Optional[List[str]] = None):
+        self.size = len(columns["amount_class"])
+        for name, dtype in POPULATION_COLUMNS.items():
+            setattr(self, name, np.asarray(columns[name], dtype=dtype))
+        self.prefix = prefix
+        self.uids = list(uids) if uids is not None else None
+        self._rows = {pid: row for row, pid in enumerate(self.uids)} if self.uids is not None else None
+
+    @classmethod
+    def build(cls, num_players: int, prefix: str = "player_", rng=None) -> "PlayerPopulation":
+        """
+        rng：numpy.random.Generator；缺省使用 numpy 全局随机状态（与 np.random.seed 配合可复现）
+        """
+        if rng is None:
+            rng = np.random
+        columns = {}
+        for name, weights in TAG_WEIGHTS.items():
+            p = np.asarray(weights, dtype=np.float64)
+            columns[name] = rng.choice(len(p), size=num_players, p=p / p.sum()).astype(np.int8)
+
+        # ✅ 充值额度：按档位取参数，一次对数正态抽样后截断并按单位取整
+        mean, sigma, low, high, unit = RECHARGE_PARAMS[columns["amount_class"]].T
+        values = np.clip(rng.lognormal(mean, sigma).astype(np.int64), low, high)
+        columns["recharge_amount"] = (values // unit * unit).astype(np.int32)
+
+        columns["consecutive_missed"] = np.zeros(num_players, dtype=np.int32)
+        columns["is_active"] = np.zeros(num_players, dtype=bool)
+        return cls(columns, prefix)
+
+    # --- 持久化 ---
+    def save(self, path: str):
+        arrays = {name: getattr(self, name) for name in POPULATION_COLUMNS}
+        arrays["prefix"] = np.array(self.prefix)
+        if self.uids is not None:
+            arrays["uids"] = np.array(self.uids)
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "PlayerPopulation":
+        with np.load(path, allow_pickle=False) as data:
+            columns = {name: data[name] for name in POPULATION_COLUMNS}
+            uids = data["uids"].tolist() if "uids" in data.files else None
+            return cls(columns, str(data["prefix"]), uids)
+
+    # --- ID ↔ 行号 ---
+    def uid(self, row: int) -> str:
+        return self.uids[row] if self.uids is not None else f"{self.prefix}{row + 1}"
+
+    def uid_list(self, rows) -> List[str]:
+        if self.uids is not None:
+            return [self.uids[r] for r in rows]
+        prefix = self.prefix
+        return [f"{prefix}{r + 1}" for r in rows]
+
+    def row_of(self, player_id) -> Optional[int]:
+        if self._rows is not None:
+            return self._rows.get(player_id)
+        if not isinstance(player_id, str) or not player_id.startswith(self.prefix):
+            return None
+        tail = player_id[len(self.prefix):]
+        if not tail.isdigit() or tail.startswith("0"):
+            return None
+        row = int(tail) - 1
+        return row if row < self.size else None
+
+    def rows(self, player_ids) -> np.ndarray:
+        return np.fromiter((self.row_of(pid) for pid in player_ids), dtype=np.int64)
+
+    # --- 向量化取列 ---
+    def amount_scales(self, rows) -> np.ndarray:
+        return AMOUNT_SCALES[self.amount_class[rows]]
+
+    def area_ranges(self, rows) -> np.ndarray:
+        """(len(rows), 2)：每位玩家的选区数下限 / 上限"""
+        return AREA_RANGES[self.area_style[rows]]
+
+    # --- 字典兼容接口 ---
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, player_id):
+        return self.row_of(player_id) is not None
+
+    def __iter__(self):
+        return iter(self.uid_list(range(self.size)))
+
+    def __getitem__(self, player_id) -> PlayerView:
+        row = self.row_of(player_id)
+        if row is None:
+            raise KeyError(player_id)
+        return PlayerView(self, row)
+
+    def get(self, player_id, default=None):
+        row = self.row_of(player_id)
+        return default if row is None else PlayerView(self, row)
+
+    def keys(self):
+        return self.uid_list(range(self.size))
+
+    def views(self, rows) -> List[PlayerView]:
+        return [PlayerView(self, row) for row in rows]
+
+    def values(self):
+        return self.views(range(self.size))
+
+    def items(self):
+        return list(zip(self.keys(), self.values()))
+
+
 class PlayerStats:
     """
     控奖用的玩家 RTP 数据结构，跟下注行为无关。
     """
+    __slots__ = ("total_bet", "total_return")
+
     def __init__(self):
         self.total_bet = 0
         self.total_return = 0
@@ -64,12 +290,180 @@ class PlayerStats:
         return self.total_return / self.total_bet
 
 
-def initialize_players(num_players=200):
+class PlayerStatsView:
+    """
+    PlayerStatsStore 中单个玩家的轻量视图（__slots__），接口与 PlayerStats 一致，
+    便于逐玩家代码（stat_players[pid].update / .rtp()）无需改动。
+    """
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    @property
+    def total_bet(self):
+        return float(self._store.total_bet[self._row])
+
+    @total_bet.setter
+    def total_bet(self, value):
+        self._store.total_bet[self._row] = value
+
+    @property
+    def total_return(self):
+        return float(self._store.total_return[self._row])
+
+    @total_return.setter
+    def total_return(self, value):
+        self._store.total_return[self._row] = value
+
+    def update(self, bet_amount, payout_amount):
+        self._store.total_bet[self._row] += bet_amount
+        self._store.total_return[self._row] += payout_amount
+
+    def rtp(self):
+        total_bet = self._store.total_bet[self._row]
+        if total_bet == 0:
+            return 1.0
+        return float(self._store.total_return[self._row] / total_bet)
+
+
+class PlayerStatsStore:
+    """
+    列式玩家 RTP 数据仓：total_bet / total_return 存于连续 NumPy 数组，
+    player_id → 行号 映射稳定（只增不减）。
+
+    - 兼容 Dict[str, PlayerStats] 的读取方式（store[pid]、in、keys/values/items）
+    - rtp() / gather() / bulk_update() 为向量化接口
+    - snapshot() / rollback() 用于 what-if 模拟后廉价恢复
+    """
+
+    def __init__(self, player_ids=(), capacity: int = 1024):
+        # 去重并保持顺序，一次性建立行号映射
+        self.player_ids = list(dict.fromkeys(player_ids))
+        self._rows = {pid: row for row, pid in enumerate(self.player_ids)}
+        capacity = max(capacity, len(self.player_ids), 1)
+        self.total_bet = np.zeros(capacity, dtype=np.float64)
+        self.total_return = np.zeros(capacity, dtype=np.float64)
+
+    # --- 行管理 ---
+    def add_player(self, player_id: str) -> int:
+        row = self._rows.get(player_id)
+        if row is not None:
+            return row
+        row = len(self.player_ids)
+        if row >= len(self.total_bet):
+            self._grow(len(self.total_bet) * 2)
+        self._rows[player_id] = row
+        self.player_ids.append(player_id)
+        return row
+
+    def _grow(self, capacity: int):
+        for name in ("total_bet", "total_return"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=np.float64)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def rows(self, player_ids) -> np.ndarray:
+        return np.fromiter((self._rows[pid] for pid in player_ids), dtype=np.int64)
+
+    # --- 字典兼容接口 ---
+    def __len__(self):
+        return len(self.player_ids)
+
+    def __contains__(self, player_id):
+        return player_id in self._rows
+
+    def __iter__(self):
+        return iter(self.player_ids)
+
+    def __getitem__(self, player_id) -> PlayerStatsView:
+        return PlayerStatsView(self, self._rows[player_id])
+
+    def get(self, player_id, default=None):
+        row = self._rows.get(player_id)
+        return default if row is None else PlayerStatsView(self, row)
+
+    def keys(self):
+        return list(self.player_ids)
+
+    def values(self):
+        return [PlayerStatsView(self, row) for row in range(len(self.player_ids))]
+
+    def items(self):
+        return [(pid, PlayerStatsView(self, row)) for row, pid in enumerate(self.player_ids)]
+
+    # --- 向量化接口 ---
+    def gather(self, player_ids):
+        """按玩家顺序取出 (total_bet, total_return) 数组"""
+        rows = self.rows(player_ids)
+        return self.total_bet[rows], self.total_return[rows]
+
+    def rtp(self, player_ids=None) -> np.ndarray:
+        """向量化 RTP；未投注玩家为 1.0（与 PlayerStats.rtp 一致）"""
+        if player_ids is None:
+            bets = self.total_bet[:len(self.player_ids)]
+            returns = self.total_return[:len(self.player_ids)]
+        else:
+            bets, returns = self.gather(player_ids)
+        return np.where(bets == 0, 1.0, returns / np.where(bets == 0, 1.0, bets))
+
+    def update(self, player_id, bet_amount, payout_amount):
+        row = self._rows[player_id]
+        self.total_bet[row] += bet_amount
+        self.total_return[row] += payout_amount
+
+    def bulk_update(self, player_ids, bet_amounts, payout_amounts):
+        """批量累加（同一玩家出现多次时正确累加；未登记的玩家自动登记）"""
+        rows = np.fromiter((self.add_player(pid) for pid in player_ids), dtype=np.int64)
+        np.add.at(self.total_bet, rows, np.asarray(bet_amounts, dtype=np.float64))
+        np.add.at(self.total_return, rows, np.asarray(payout_amounts, dtype=np.float64))
+
+    # --- 快照 / 回滚 ---
+    def snapshot(self):
+        size = len(self.player_ids)
+        return size, self.total_bet[:size].copy(), self.total_return[:size].copy()
+
+    def rollback(self, snapshot):
+        size, total_bet, total_return = snapshot
+        for pid in self.player_ids[size:]:
+            del self._rows[pid]
+        del self.player_ids[size:]
+        self.total_bet[:] = 0.0
+        self.total_return[:] = 0.0
+        self.total_bet[:size] = total_bet
+        self.total_return[:size] = total_return
+
+
+def gather_player_stats(players, player_ids):
+    """
+    按玩家顺序取出累计投注 / 返奖数组；兼容 PlayerStatsStore 与 Dict[str, PlayerStats]。
+    """
+    if isinstance(players, PlayerStatsStore):
+        return players.gather(player_ids)
+    return (
+        np.array([players[pid].total_bet for pid in player_ids], dtype=np.float64),
+        np.array([players[pid].total_return for pid in player_ids], dtype=np.float64),
+    )
+
+
+def register_players(stat_players, player_ids):
+    """
+    为未登记的玩家（如导入局中出现的新 UID）补建零起点 RTP 统计；兼容 PlayerStatsStore 与 Dict[str, PlayerStats]。
+    """
+    for pid in player_ids:
+        if pid not in stat_players:
+            if isinstance(stat_players, PlayerStatsStore):
+                stat_players.add_player(pid)
+            else:
+                stat_players[pid] = PlayerStats()
+
+
+def initialize_players(num_players=200, prefix="player_", *, rng=None):
     """
-    生成模拟投注用玩家列表，带虚拟标签与状态，方便下注模拟调用。
+    生成模拟投注用玩家群体（PlayerPopulation），带虚拟标签与状态，方便下注模拟调用。
+    prefix：玩家 ID 前缀（多桌共用全局日志索引时用于区分各桌玩家）
+    rng：numpy.random.Generator；缺省使用 numpy 全局随机状态
     """
-    players = {}
-    for i in range(1, num_players + 1):
-        p = Player(uid=f'player_{i}')
-        players[p.uid] = p
-    return players
+    return PlayerPopulation.build(num_players, prefix, rng)
@@ -0,0 +1,176 @@
+# player_table.py
+
+"""
+玩家下注明细表（渲染数据层，不依赖 Streamlit）：
+- 每位玩家的结构盈亏 / RTP 矩阵由（玩家 × 8）下注矩阵与结构派奖矩阵一次矩阵乘法得到
+- 按玩家缓存下注键与高亮样式：下注未变的玩家直接复用，只为新增或变化的玩家重新计算样式
+- 整表以下注哈希 + 玩家 RTP 为键缓存，页面重跑而数据未变时直接返回上次结果
+- view()：在缓存的列式数据上做 UID 搜索、Top-K 排序与分页，只把当前页交给页面渲染
+
+高亮规则（与原逐行实现一致）：
+- 绿色：该玩家盈利最大的结构（并列全部高亮）
+- 红色：该玩家盈利最小的结构
+- 黄色：该玩家 RTP 最接近 1 的结构
+"""
+
+from typing import Dict, Mapping, Optional, Tuple
+import numpy as np
+import pandas as pd
+from config import TARGET_RTP
+from player_profiles import gather_player_stats
+from structure_matrix import NUM_STRUCTURES, STRUCTURE_HIT_MASK, pack_bets, structure_payouts
+
+STRUCTURE_COLUMNS = [f"结构{i}" for i in range(1, NUM_STRUCTURES + 1)]
+COLUMNS = ["序号", "UID", "总投注", "当前RTP", "充值额度"] + STRUCTURE_COLUMNS
+NUMERIC_COLUMNS = ["序号", "总投注", "充值额度"] + STRUCTURE_COLUMNS
+
+PROFIT_STYLE = "background-color: #d4edda"
+LOSS_STYLE = "background-color: #f8d7da"
+RTP_STYLE = "background-color: #fff3cd"
+
+# Top-K 排序方式：名称 → 排序键（均为降序）
+SORT_KEYS = {
+    "bet": "总投注",
+    "rtp_deviation": f"RTP 偏离（|RTP - {TARGET_RTP}|）",
+    "recharge": "充值额度",
+}
+
+
+def bets_key(bets: Dict[int, float]) -> Tuple:
+    return tuple(sorted(bets.items()))
+
+
+def compute_structure_matrix(bet_matrix: np.ndarray):
+    """
+    输入 (玩家数, 8) 下注矩阵，返回：
+    - structure_bets：各结构命中区域的下注额 (玩家数, 结构数)（表格“结构i”列）
+    - profit：各结构下玩家盈亏 (玩家数, 结构数)
+    - rtp_gap：各结构下玩家 RTP 与 1 的距离 (玩家数, 结构数)
+    """
+    totals = bet_matrix.sum(axis=1)
+    payouts = structure_payouts(bet_matrix)
+    profit = payouts - totals[:, None]
+    safe_totals = np.where(totals > 0, totals, 1.0)
+    rtp = np.where((totals > 0)[:, None], payouts / safe_totals[:, None], 0.0)
+    return bet_matrix @ STRUCTURE_HIT_MASK, profit, np.abs(rtp - 1)
+
+
+def compute_style_rows(bet_matrix: np.ndarray) -> np.ndarray:
+    """向量化计算每行结构列的高亮样式，返回 (玩家数, 结构数) 的样式字符串数组"""
+    _, profit, rtp_gap = compute_structure_matrix(np.round(bet_matrix))
+    styles = np.full(profit.shape, "", dtype=object)
+    styles[profit == profit.max(axis=1, keepdims=True)] = PROFIT_STYLE
+    styles[profit == profit.min(axis=1, keepdims=True)] = LOSS_STYLE
+    styles[np.abs(rtp_gap - rtp_gap.min(axis=1, keepdims=True)) < 1e-8] = RTP_STYLE
+    return styles
+
+
+class PlayerDetailTableCache:
+    """
+    按玩家增量维护的明细表缓存。update() 返回 (DataFrame, 样式 DataFrame)。
+    """
+
+    def __init__(self):
+        self.row_keys: Dict[str, Tuple] = {}
+        self.row_styles: Dict[str, np.ndarray] = {}
+        self.table_key = None
+        self.frame: Optional[pd.DataFrame] = None
+        self.styles: Optional[pd.DataFrame] = None
+        self.restyled_rows = 0  # 最近一次 update 重新计算样式的行数
+        self.sort_values: Dict[str, np.ndarray] = {}
+
+    def update(
+        self,
+        current_bets: Dict[str, Dict[int, float]],
+        stat_players,
+        player_recharges: Mapping[str, float]
+    ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        player_ids = sorted(current_bets.keys())
+        keys = [bets_key(current_bets[pid]) for pid in player_ids]
+        prior_bets, prior_returns = gather_player_stats(stat_players, player_ids)
+        rtps = np.where(prior_bets > 0, prior_returns / np.where(prior_bets > 0, prior_bets, 1.0), 1.0)
+
+        table_key = hash((tuple(player_ids), tuple(keys), rtps.tobytes()))
+        if table_key == self.table_key:
+            self.restyled_rows = 0
+            return self.frame, self.styles
+
+        # ✅ 仅为下注有变化的玩家重新计算样式
+        changed = [pid for pid, key in zip(player_ids, keys) if self.row_keys.get(pid) != key]
+        if changed:
+            _, changed_matrix = pack_bets({pid: current_bets[pid] for pid in changed})
+            for pid, style in zip(changed, compute_style_rows(changed_matrix)):
+                self.row_styles[pid] = style
+        for pid, key in zip(player_ids, keys):
+            self.row_keys[pid] = key
+        for pid in set(self.row_keys) - set(current_bets):
+            del self.row_keys[pid], self.row_styles[pid]
+        self.restyled_rows = len(changed)
+
+        _, bet_matrix = pack_bets({pid: current_bets[pid] for pid in player_ids})
+        structure_bets, _, _ = compute_structure_matrix(bet_matrix)
+        frame = pd.DataFrame({
+            "序号": np.arange(1, len(player_ids) + 1),
+            "UID": [pid.replace('player_', '') for pid in player_ids],
+            "总投注": bet_matrix.sum(axis=1),
+            "当前RTP": [f"{r * 100:.1f}%" for r in rtps.tolist()],
+            "充值额度": [player_recharges.get(pid, 0) for pid in player_ids],
+        })
+        for i, column in enumerate(STRUCTURE_COLUMNS):
+            frame[column] = structure_bets[:, i]
+        frame[NUMERIC_COLUMNS] = frame[NUMERIC_COLUMNS].round(0).astype(int)
+
+        style_matrix = np.full((len(player_ids), len(COLUMNS)), "", dtype=object)
+        if player_ids:
+            style_matrix[:, len(COLUMNS) - NUM_STRUCTURES:] = np.vstack([self.row_styles[pid] for pid in player_ids])
+
+        self.sort_values = {
+            "bet": frame["总投注"].to_numpy(),
+            "rtp_deviation": np.abs(rtps - TARGET_RTP),
+            "recharge": frame["充值额度"].to_numpy(),
+        }
+        self.table_key = table_key
+        self.frame = frame
+        self.styles = pd.DataFrame(style_matrix, index=frame.index, columns=COLUMNS)
+        return self.frame, self.styles
+
+    def view(
+        self,
+        *,
+        search: str = "",
+        sort_by: Optional[str] = None,
+        top_k: Optional[int] = None,
+        page: int = 1,
+        page_size: int = 50
+    ) -> Dict:
+        """
+        在最近一次 update() 的结果上筛选、排序、分页：
+        - search：UID 子串匹配
+        - sort_by：SORT_KEYS 之一，降序；None 保持原顺序
+        - top_k：排序（或筛选）后只保留前 K 行
+        返回 {"frame", "styles", "total", "pages", "page"}，frame / styles 仅含当前页
+        """
+        if self.frame is None:
+            empty = pd.DataFrame(columns=COLUMNS)
+            return {"frame": empty, "styles": empty, "total": 0, "pages": 1, "page": 1}
+
+        rows = np.arange(len(self.frame))
+        if search:
+            rows = rows[self.frame["UID"].str.contains(search, regex=False).to_numpy()]
+        if sort_by is not None:
+            keys = self.sort_values[sort_by][rows]
+            rows = rows[np.argsort(-keys, kind="stable")]
+        if top_k is not None:
+            rows = rows[:top_k]
+
+        total = len(rows)
+        pages = max(1, -(-total // page_size))
+        page = min(max(1, page), pages)
+        rows = rows[(page - 1) * page_size: page * page_size]
+        return {
+            "frame": self.frame.iloc[rows],
+            "styles": self.styles.iloc[rows],
+            "total": total,
+            "pages": pages,
+            "page": page,
+        }
@@ -0,0 +1,352 @@
+# replay.py
+
+"""
+历史对局回放模块（策略回测）：
+- 逐局读取生产环境下注日志（bet_import：Excel / CSV / Parquet，后台线程预读），不走倒计时，
+  直接 结构评估（simulate_structure_metrics / 记忆态势）→ select_structure 开奖 → 结算
+- 日志带开奖列时，与生产环境实际开出的 winning_areas 逐局对比：
+  · 分歧率与结构混淆矩阵（回放选择 × 生产开奖）
+  · 两条水池轨迹：按回放开奖结算的水池 vs 按生产开奖结算的水池
+  · 玩家 RTP 漂移：同一批下注分别按两种开奖累计的玩家 RTP 之差
+- 断点续跑：每 N 局把完整回放状态（对局状态、统计累加量、玩家日志索引与记忆缓存）写入检查点，
+  中断后从检查点恢复并跳过已回放的局，可通宵回放数百万局
+
+开奖决策本身是确定性的（select_structure 不含随机），同一份日志 + 同一组策略参数的回放结果可复现。
+
+命令行用法：
+    python replay.py rounds.parquet --checkpoint replay.ckpt --checkpoint-every 50000
+    python replay.py rounds.parquet --checkpoint replay.ckpt --resume
+    python replay.py rounds.csv --std-threshold 0.08 --recharges recharges.csv --report-out report.json
+"""
+
+import argparse
+import csv
+import json
+import os
+import pickle
+import time
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+import numpy as np
+from bet_import import open_bet_stream, PLAYER_COLUMNS, find_column, normalize_player_id
+from config import WINNING_STRUCTURES
+from game_round_controller import GameRoundController, begin_round
+from headless_runner import create_headless_state
+from platform_pool import PlatformPool
+from player_profiles import PlayerStatsStore
+from stage_profiler import StageProfiler
+from structure_matrix import NUM_STRUCTURES, STRUCTURE_PAYOUT_MATRIX, structure_index
+import db_logger
+import metrics_engine
+
+CHECKPOINT_VERSION = 1
+RECHARGE_COLUMNS = ("recharge", "recharge_amount", "充值额度", "充值")
+
+
+class ReplayPlayer:
+    """回放玩家：下注来自日志，只需携带充值额度（记忆态势使用）"""
+
+    __slots__ = ("uid", "recharge_amount")
+
+    def __init__(self, uid: str, recharge_amount: float = 0.0):
+        self.uid = uid
+        self.recharge_amount = recharge_amount
+
+
+def load_recharges(path: str) -> Dict[str, float]:
+    """读取玩家充值额度 CSV（列：UID / player_id，充值额度 / recharge）"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = csv.reader(f)
+        header = [h.strip().lower() for h in next(rows)]
+        player_col = find_column(header, PLAYER_COLUMNS)
+        amount_col = find_column(header, RECHARGE_COLUMNS)
+        if player_col is None or amount_col is None:
+            raise ValueError(f"充值文件缺少玩家ID或充值额度列，表头：{header}")
+        return {normalize_player_id(row[player_col]): float(row[amount_col] or 0) for row in rows if row}
+
+
+class ReplayRunner:
+    """
+    回放状态 + 对比统计。run() 可多次调用（分段回放），save_checkpoint() / load_checkpoint() 断点续跑。
+    """
+
+    def __init__(
+        self,
+        *,
+        player_recharges: Optional[Mapping[str, float]] = None,
+        strategy_params: Optional[Dict] = None,
+        confidence_level: float = 0.95,
+        decision_budget_ms: Optional[float] = None,
+        initial_pool: float = 5_000_000,
+        trajectory_every: int = 100
+    ):
+        # 回放从空白状态开始：玩家在日志中首次出现时登记（零起点统计）
+        self.state = create_headless_state(
+            0,
+            platform_pool=PlatformPool(initial_pool),
+            track_rtp_history=False,
+            confidence_level=confidence_level,
+            strategy_params=strategy_params,
+            decision_budget_ms=decision_budget_ms,
+            keep_full_log=False  # 回放只维护玩家索引，不写完整日志（不改动进程全局设置）
+        )
+        self.state["sim_players"] = {
+            pid: ReplayPlayer(pid, amount) for pid, amount in (player_recharges or {}).items()
+        }
+        # 生产开奖的对照组：同一批下注按生产开奖结算
+        self.production_stats = PlayerStatsStore()
+        self.production_pool = PlatformPool(initial_pool)
+
+        self.trajectory_every = trajectory_every
+        self.rounds_done = 0
+        self.compared = 0
+        self.mismatches = 0
+        self.invalid_outcomes = 0  # 开奖列无法识别的局：照常回放，不参与生产对比
+        self.total_bet = 0.0
+        self.replay_payout = 0.0
+        self.production_payout = 0.0
+        self.confusion = np.zeros((NUM_STRUCTURES, NUM_STRUCTURES), dtype=np.int64)  # [回放, 生产]
+        self.trajectory: Dict[str, List] = {"round_id": [], "replay_pool": [], "production_pool": []}
+        self.elapsed_sec = 0.0
+
+    # --- 单局回放 ---
+    def replay_round(self, round_id: int, bets: Dict[str, Dict[int, float]], production_areas: Optional[List[int]] = None) -> Dict:
+        state = self.state
+        state["round_id"] = round_id
+        begin_round(state, bets)
+
+        controller = GameRoundController(state)
+        state["partial_bets"] = {}
+        controller.start_bet_book()
+        controller.evaluate_structures(final=True)
+        controller.finalize_outcome()
+
+        payout_table = state["structure_result_cache"]["payout_table"]
+        chosen = structure_index(state["final_outcome"]["winning_areas"])
+        self.total_bet += payout_table["total_bet"]
+        self.replay_payout += float(payout_table["payout"][chosen])
+
+        if production_areas is not None and not production_areas:
+            # 开奖列无法识别（bet_import.INVALID_WINNING_AREAS）
+            self.invalid_outcomes += 1
+            production_areas = None
+        if production_areas is not None:
+            # ✅ 结算前取下注簿中的玩家下注矩阵，一次矩阵乘法得到生产开奖下每位玩家的派奖
+            actual = structure_index(production_areas)
+            book = state["bet_book"]
+            n = len(book.player_ids)
+            player_payouts = book.bet_matrix[:n] @ STRUCTURE_PAYOUT_MATRIX[:, actual]
+            self.production_stats.bulk_update(book.player_ids, book.bet_totals[:n], player_payouts)
+            self.production_pool.settle_round(payout_table["total_bet"], float(payout_table["payout"][actual]), round_id)
+            self.production_payout += float(payout_table["payout"][actual])
+            self.confusion[chosen, actual] += 1
+            self.compared += 1
+            self.mismatches += int(chosen != actual)
+
+        controller.settle()
+        state["running"] = False
+        state["bet_book"] = None
+
+        self.rounds_done += 1
+        if self.rounds_done % self.trajectory_every == 0:
+            self.trajectory["round_id"].append(round_id)
+            self.trajectory["replay_pool"].append(state["platform_pool"].get_pool_value())
+            self.trajectory["production_pool"].append(self.production_pool.get_pool_value() if self.compared else None)
+        return state["final_outcome"]
+
+    def run(
+        self,
+        rounds: Iterable[Tuple],
+        *,
+        max_rounds: Optional[int] = None,
+        checkpoint_path: Optional[str] = None,
+        checkpoint_every: int = 50_000,
+        progress_every: int = 0
+    ) -> Dict[str, Any]:
+        """
+        回放 rounds（bet_import 产出的 (round_id, bets[, winning_areas])）。
+        rounds 总是从文件开头开始：已回放的 rounds_done 局会被跳过（断点续跑）。
+        rounds 带 close()（如 PrefetchingRoundReader）时，结束（含 max_rounds 提前停止、异常）后关闭。
+        """
+        source = rounds
+        rounds = islice(rounds, self.rounds_done, None if max_rounds is None else max_rounds)
+        start = time.perf_counter()
+        try:
+            for item in rounds:
+                round_id, bets = item[0], item[1]
+                self.replay_round(round_id, bets, item[2] if len(item) > 2 else None)
+                if checkpoint_path and self.rounds_done % checkpoint_every == 0:
+                    self.elapsed_sec += time.perf_counter() - start
+                    start = time.perf_counter()
+                    self.save_checkpoint(checkpoint_path)
+                if progress_every and self.rounds_done % progress_every == 0:
+                    print(f"已回放 {self.rounds_done:,} 局，分歧率 {self.divergence_rate() * 100:.2f}%", flush=True)
+        finally:
+            self.elapsed_sec += time.perf_counter() - start
+            if hasattr(source, "close"):
+                source.close()
+        if checkpoint_path:
+            self.save_checkpoint(checkpoint_path)
+        return self.report()
+
+    # --- 统计 ---
+    def divergence_rate(self) -> float:
+        return self.mismatches / self.compared if self.compared else 0.0
+
+    def player_rtp_drift(self, top: int = 10) -> Dict[str, Any]:
+        """玩家 RTP 漂移：回放开奖下的累计 RTP − 生产开奖下的累计 RTP（仅统计对照组中有投注的玩家）"""
+        size = len(self.production_stats)
+        player_ids = [pid for pid, bet in zip(self.production_stats.player_ids, self.production_stats.total_bet[:size]) if bet > 0]
+        if not player_ids:
+            return {"players": 0, "mean": 0.0, "std": 0.0, "p5": 0.0, "p95": 0.0, "max_abs": 0.0, "top": []}
+        drift = self.state["stat_players"].rtp(player_ids) - self.production_stats.rtp(player_ids)
+        order = np.argsort(-np.abs(drift))[:top]
+        return {
+            "players": len(player_ids),
+            "mean": float(drift.mean()),
+            "std": float(drift.std()),
+            "p5": float(np.percentile(drift, 5)),
+            "p95": float(np.percentile(drift, 95)),
+            "max_abs": float(np.abs(drift).max()),
+            "top": [(player_ids[i], float(drift[i])) for i in order],
+        }
+
+    def report(self) -> Dict[str, Any]:
+        structures = [s["areas"] for s in WINNING_STRUCTURES]
+        return {
+            "rounds": self.rounds_done,
+            "elapsed_sec": self.elapsed_sec,
+            "rounds_per_sec": self.rounds_done / self.elapsed_sec if self.elapsed_sec > 0 else 0.0,
+            "compared_rounds": self.compared,
+            "mismatches": self.mismatches,
+            "invalid_outcome_rounds": self.invalid_outcomes,
+            "divergence_rate": self.divergence_rate(),
+            "total_bet": self.total_bet,
+            "replay_rtp": self.replay_payout / self.total_bet if self.total_bet > 0 else 0.0,
+            "production_rtp": self.production_payout / self.total_bet if self.compared and self.total_bet > 0 else None,
+            "replay_pool_value": self.state["platform_pool"].get_pool_value(),
+            "production_pool_value": self.production_pool.get_pool_value() if self.compared else None,
+            "replay_hits": dict(zip(map(str, structures), self.confusion.sum(axis=1).tolist())),
+            "production_hits": dict(zip(map(str, structures), self.confusion.sum(axis=0).tolist())),
+            "confusion": self.confusion.tolist(),
+            "player_rtp_drift": self.player_rtp_drift(),
+            "pool_trajectory": self.trajectory,
+        }
+
+    # --- 检查点 ---
+    def save_checkpoint(self, path: str):
+        """原子写入检查点（先写临时文件再替换），写入中途中断不会损坏上一个检查点"""
+        db_logger.expand_player_index()
+        metrics_engine.expand_memory_attitude()
+        payload = {
+            "version": CHECKPOINT_VERSION,
+            "runner": self,
+            # 记忆态势依赖的全局索引与缓存
+            "player_recent_log": db_logger.player_recent_log,
+            "player_latest_log": db_logger.player_latest_log,
+            "memory_attitude_cache": metrics_engine.memory_attitude_cache,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load_checkpoint(path: str) -> "ReplayRunner":
+        """读取检查点并恢复全局玩家日志索引与记忆缓存"""
+        with open(path, "rb") as f:
+            payload = pickle.load(f)
+        if payload.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"检查点版本不兼容：{payload.get('version')}")
+        db_logger.reset_logs()
+        db_logger.player_recent_log.update(payload["player_recent_log"])
+        db_logger.player_latest_log.update(payload["player_latest_log"])
+        metrics_engine.reset_memory_attitude_cache()
+        metrics_engine.memory_attitude_cache.update(payload["memory_attitude_cache"])
+        return payload["runner"]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["state"] = {k: v for k, v in self.state.items() if k not in ("bet_book", "profiler")}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.state.setdefault("bet_book", None)
+        self.state.setdefault("profiler", StageProfiler(enabled=False))
+        self.state.setdefault("keep_full_log", False)  # 旧检查点没有该键
+        self.__dict__.setdefault("invalid_outcomes", 0)
+
+
+def format_replay_report(report: Dict[str, Any]) -> str:
+    lines = [
+        f"回放局数：{report['rounds']:,}，耗时 {report['elapsed_sec']:.2f}s，吞吐 {report['rounds_per_sec']:,.1f} 局/秒",
+        f"总投注：{report['total_bet']:,.0f}，回放平台RTP：{report['replay_rtp'] * 100:.2f}%，回放水池：{report['replay_pool_value']:,.0f}",
+    ]
+    if report["compared_rounds"]:
+        drift = report["player_rtp_drift"]
+        lines += [
+            f"对比局数：{report['compared_rounds']:,}，开奖分歧 {report['mismatches']:,} 局（{report['divergence_rate'] * 100:.2f}%）",
+            f"生产平台RTP：{report['production_rtp'] * 100:.2f}%，生产水池：{report['production_pool_value']:,.0f}，"
+            f"水池差：{report['replay_pool_value'] - report['production_pool_value']:+,.0f}",
+            f"玩家RTP漂移（{drift['players']:,} 人，回放 − 生产）：均值 {drift['mean']:+.4f}，STD {drift['std']:.4f}，"
+            f"P5 {drift['p5']:+.4f}，P95 {drift['p95']:+.4f}，最大 {drift['max_abs']:.4f}",
+            "漂移最大的玩家：" + "，".join(f"{pid}={d:+.3f}" for pid, d in drift["top"][:5]),
+        ]
+    else:
+        lines.append("日志无开奖列，未做生产对比")
+    if report["invalid_outcome_rounds"]:
+        lines.append(f"开奖列无法识别（非法区域组合）：{report['invalid_outcome_rounds']:,} 局，已回放但未参与对比")
+    lines.append("回放开出次数：" + "，".join(f"{k}={v}" for k, v in report["replay_hits"].items()))
+    if report["compared_rounds"]:
+        lines.append("生产开出次数：" + "，".join(f"{k}={v}" for k, v in report["production_hits"].items()))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="历史对局回放与开奖对比")
+    parser.add_argument("path", help="下注日志（.xlsx / .csv / .parquet，按局号排序，可带开奖列）")
+    parser.add_argument("--max-rounds", type=int, default=None, help="最多回放局数（含已回放的局）")
+    parser.add_argument("--checkpoint", type=str, default=None, help="检查点文件路径")
+    parser.add_argument("--checkpoint-every", type=int, default=50_000, help="每 N 局写一次检查点")
+    parser.add_argument("--resume", action="store_true", help="从 --checkpoint 恢复后继续回放")
+    parser.add_argument("--recharges", type=str, default=None, help="玩家充值额度 CSV（记忆态势使用）")
+    parser.add_argument("--confidence", type=float, default=0.95, help="置信度")
+    parser.add_argument("--std-threshold", type=float, default=None, help="覆盖 STD 基准（策略回测）")
+    parser.add_argument("--target-rtp", type=float, default=None, help="覆盖目标 RTP（策略回测）")
+    parser.add_argument("--decision-budget-ms", type=float, default=None, help="开奖限时决策预算（毫秒）")
+    parser.add_argument("--trajectory-every", type=int, default=100, help="水池轨迹采样间隔（局）")
+    parser.add_argument("--progress-every", type=int, default=0, help="每 N 局打印进度（0 为不打印）")
+    parser.add_argument("--report-out", type=str, default=None, help="报告 JSON 输出路径")
+    args = parser.parse_args(argv)
+
+    if args.resume and args.checkpoint and os.path.exists(args.checkpoint):
+        runner = ReplayRunner.load_checkpoint(args.checkpoint)
+        print(f"从检查点恢复：已回放 {runner.rounds_done:,} 局")
+    else:
+        db_logger.reset_logs()
+        metrics_engine.reset_memory_attitude_cache()
+        strategy_params = {k: v for k, v in (("std_threshold", args.std_threshold), ("target_rtp", args.target_rtp)) if v is not None}
+        runner = ReplayRunner(
+            player_recharges=load_recharges(args.recharges) if args.recharges else None,
+            strategy_params=strategy_params,
+            confidence_level=args.confidence,
+            decision_budget_ms=args.decision_budget_ms,
+            trajectory_every=args.trajectory_every
+        )
+
+    report = runner.run(
+        open_bet_stream(args.path, buffer_size=64, with_outcome=True),
+        max_rounds=args.max_rounds,
+        checkpoint_path=args.checkpoint,
+        checkpoint_every=args.checkpoint_every,
+        progress_every=args.progress_every
+    )
+    print(format_replay_report(report))
+    if args.report_out:
+        with open(args.report_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
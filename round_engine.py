@@ -0,0 +1,221 @@
+# round_engine.py
+
+"""
+后台对局引擎：
+- 独立工作线程独占对局状态（普通 dict，键与 session_state 一致），按倍速节奏推进 controller.tick()
+- 每次推进后发布一份不可变快照（MappingProxyType，下注与结构结果均为拷贝），页面只读取最新快照渲染
+- 页面对引擎的操作（开新局、强控、倍速、置信度、自动开局、导入下注）通过命令队列传递，由工作线程执行
+
+推进节奏与页面渲染解耦：玩家明细表渲染再慢也不会拖慢开奖，结构评估也不会阻塞页面。
+"""
+
+import queue
+import threading
+import time
+from types import MappingProxyType
+from typing import Any, Dict, Optional
+from game_round_controller import GameRoundController, begin_round
+from player_profiles import PlayerStats
+
+# 移交给引擎的对局状态键（与 state_manager.initialize_session_state 对应）
+ENGINE_STATE_KEYS = (
+    "sim_players", "stat_players", "rtp_history", "round_id", "time_to_next_round", "countdown_bet",
+    "countdown_result", "current_bets", "running", "final_outcome", "forced_outcome", "structure_result_cache",
+    "partial_bets", "bet_book", "bet_schedule", "imported_round", "activity_tracker", "has_started", "platform_pool", "profiler", "decision_budget_ms",
+    "anytime_evaluator", "decision_info", "target_rtp", "confidence_level", "debug_speed", "auto_simulate",
+    "snapshot_manager",
+)
+
+# 快照中拷贝的标量键
+SNAPSHOT_KEYS = (
+    "round_id", "time_to_next_round", "countdown_bet", "countdown_result", "running",
+    "final_outcome", "forced_outcome", "decision_info", "confidence_level", "debug_speed", "auto_simulate",
+    "decision_budget_ms",
+)
+
+
+def build_snapshot(state: Dict[str, Any], version: int) -> MappingProxyType:
+    """
+    由引擎状态生成只读快照。可变容器一律拷贝，快照发布后与引擎状态再无共享。
+    stat_players / player_recharges 仅包含本局下注玩家。
+    """
+    current_bets = {pid: dict(bets) for pid, bets in state["current_bets"].items()}
+    cache = state.get("structure_result_cache")
+    if cache is not None:
+        cache = dict(cache, all_structures=[dict(r) for r in cache["all_structures"]])
+
+    stat_players, sim_players = state["stat_players"], state["sim_players"]
+    player_stats = {}
+    for pid in current_bets:
+        stats = stat_players.get(pid)
+        if stats is not None:
+            copied = PlayerStats()
+            copied.update(stats.total_bet, stats.total_return)
+            player_stats[pid] = copied
+
+    pool = state["platform_pool"]
+    snapshot = {key: state.get(key) for key in SNAPSHOT_KEYS}
+    snapshot.update({
+        "version": version,
+        "published_at": time.time(),
+        "current_bets": current_bets,
+        "structure_result_cache": cache,
+        "stat_players": player_stats,
+        "player_recharges": {pid: sim_players[pid].recharge_amount for pid in current_bets if pid in sim_players},
+        "pool_value": pool.get_pool_value(),
+        "rtp_target": pool.get_current_rtp_target(),
+    })
+    for key in ("final_outcome", "forced_outcome", "decision_info"):
+        if snapshot[key] is not None:
+            snapshot[key] = dict(snapshot[key])
+    return MappingProxyType(snapshot)
+
+
+class RoundEngineWorker:
+    def __init__(self, state: Dict[str, Any], *, speed: float = 1.0):
+        self.state = state
+        self.state.setdefault("debug_speed", speed)
+        self.state.setdefault("auto_simulate", False)
+        self.state.setdefault("has_started", False)
+        self.commands: "queue.Queue" = queue.Queue()
+        self.version = 0
+        self._snapshot = build_snapshot(state, self.version)
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.tick_latencies_ms = []  # 最近的 tick 耗时（毫秒），仅保留最近 256 条
+        self.error: Optional[BaseException] = None
+
+    # --- 生命周期 ---
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="round-engine", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> Optional[Dict[str, Any]]:
+        """
+        停止工作线程，返回引擎状态（交还调用方）。
+        timeout 内线程仍未退出（本拍尚未结束）时返回 None：状态仍由工作线程持有，不能交还；
+        停止信号保持有效，线程在本拍结束后退出，调用方稍后再次 stop() 即可取回状态。
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                return None
+        return self.state
+
+    @property
+    def alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # --- 页面侧接口（任意线程调用） ---
+    def latest_snapshot(self) -> MappingProxyType:
+        return self._snapshot
+
+    def submit(self, command: str, **kwargs):
+        self.commands.put((command, kwargs))
+        self._wake.set()
+
+    def new_round(self):
+        self.submit("new_round")
+
+    def import_round(self, imported_bets: Dict[str, Dict[int, float]]):
+        self.submit("import_round", bets=imported_bets)
+
+    def set_forced_outcome(self, outcome: Optional[Dict]):
+        self.submit("set", key="forced_outcome", value=outcome)
+
+    def set_speed(self, speed: float):
+        self.submit("set", key="debug_speed", value=speed)
+
+    def set_confidence(self, confidence_level: float):
+        self.submit("set", key="confidence_level", value=confidence_level)
+
+    def set_auto(self, enabled: bool):
+        self.submit("set", key="auto_simulate", value=enabled)
+
+    def set_decision_budget(self, budget_ms: float):
+        self.submit("set", key="decision_budget_ms", value=budget_ms)
+
+    # --- 工作线程 ---
+    def _apply_command(self, command: str, kwargs: Dict[str, Any]):
+        if command == "new_round":
+            if self.state["has_started"]:
+                self.state["round_id"] += 1
+            else:
+                self.state["has_started"] = True
+            begin_round(self.state)
+        elif command == "import_round":
+            self.state["round_id"] += 1
+            begin_round(self.state, kwargs["bets"])
+        elif command == "set":
+            self.state[kwargs["key"]] = kwargs["value"]
+        else:
+            raise ValueError(f"未知引擎命令：{command}")
+
+    def _drain_commands(self) -> list:
+        """执行队列中的全部命令，返回已执行的命令名"""
+        applied = []
+        while True:
+            try:
+                command, kwargs = self.commands.get_nowait()
+            except queue.Empty:
+                return applied
+            self._apply_command(command, kwargs)
+            applied.append(command)
+
+    def _step(self):
+        """推进一拍：运行中则 tick，否则在自动模式下开新局（与 app.py 同步模式的节奏一致）"""
+        if self.state["running"]:
+            start = time.perf_counter()
+            GameRoundController(self.state).tick()
+            self.tick_latencies_ms.append((time.perf_counter() - start) * 1000)
+            del self.tick_latencies_ms[:-256]
+            return True
+        if self.state.get("auto_simulate"):
+            self._apply_command("new_round", {})
+            return True
+        return False
+
+    def advance(self) -> bool:
+        """
+        由外部调度器驱动的一拍（多桌服务使用）：先处理命令，本拍未开新局则推进一步；有变化时发布快照。
+        """
+        applied = self._drain_commands()
+        changed = bool(applied)
+        if "new_round" not in applied and "import_round" not in applied:
+            changed = self._step() or changed
+        if changed:
+            self._publish()
+        return changed
+
+    def _publish(self):
+        self.version += 1
+        # ✅ 整体替换引用，读者拿到的要么是旧快照要么是新快照
+        self._snapshot = build_snapshot(self.state, self.version)
+
+    def _run(self):
+        next_tick = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                self._wake.clear()
+                applied = self._drain_commands()
+                changed = bool(applied)
+                now = time.monotonic()
+                if "new_round" in applied or "import_round" in applied:
+                    # ✅ 新局先发布初始状态，下一拍再开始推进（同 app.py 的 _trigger_manual）
+                    next_tick = now + 1.0 / max(self.state["debug_speed"], 1e-3)
+                elif now >= next_tick:
+                    changed = self._step() or changed
+                    next_tick = now + 1.0 / max(self.state["debug_speed"], 1e-3)
+                if changed:
+                    self._publish()
+                self._wake.wait(max(0.0, next_tick - time.monotonic()))
+        except BaseException as exc:  # 记录异常供页面展示，线程退出
+            self.error = exc
+            self._publish()
+            raise
@@ -8,12 +8,11 @@
 """
 
 from typing import Dict, Any, List
-from config import PAYOUT_RATES, WINNING_STRUCTURES, STD_THRESHOLD, CONFIDENCE_LEVEL, MINIMUM_BET_THRESHOLD, MEMORY_WINDOW, MEMORY_DECAY_ALPHA
-from player_profiles import PlayerStats
-from metrics_engine import calculate_weighted_std, compute_dynamic_std_confidence_interval, calculate_memory_attitude
-from copy import deepcopy
-from db_logger import player_log
-import math
+import numpy as np
+from config import WINNING_STRUCTURES, STD_THRESHOLD, CONFIDENCE_LEVEL, MINIMUM_BET_THRESHOLD, TARGET_RTP
+from player_profiles import PlayerStats, gather_player_stats
+from metrics_engine import calculate_weighted_std_matrix, compute_dynamic_std_confidence_interval, get_memory_state, MEMORY_DECAY_WEIGHTS
+from structure_matrix import pack_bets, structure_payouts
 
 
 
@@ -36,44 +35,68 @@ def simulate_structure_metrics(
     current_bets: Dict[str, Dict[int, float]],
     *,
     confidence_level: float = CONFIDENCE_LEVEL,
-    base_std: float = STD_THRESHOLD
+    base_std: float = STD_THRESHOLD,
+    target_rtp: float = TARGET_RTP
 ):
     """
     输入：玩家状态 + 当前下注
     输出：每个结构的标准差、权重、命中情况等结构级分析数据
+
+    下注打包为（玩家 × 区域）矩阵，结构打包为（区域 × 结构）派奖矩阵，
+    所有结构的模拟返奖与加权 STD 在少量矩阵运算内完成。
     """
-    eligible_players = [
-        current_players[pid] for pid, bets in current_bets.items()
-        if sum(bets.values()) >= MINIMUM_BET_THRESHOLD
-    ]
+    player_ids, bet_matrix = pack_bets(current_bets)
+    bet_totals = np.array([sum(current_bets[pid].values()) for pid in player_ids], dtype=np.float64)
+    eligible_mask = bet_totals >= MINIMUM_BET_THRESHOLD
+    sample_size = int(eligible_mask.sum())
     rtp_std_low, rtp_std_high = compute_dynamic_std_confidence_interval(
-        base_std, confidence_level, len(eligible_players)
+        base_std, confidence_level, sample_size
+    )
+
+    # ✅ 模拟结算：一次矩阵乘法得到 (玩家 × 结构) 派奖，无需逐结构 deepcopy 玩家
+    prior_bets, prior_returns = gather_player_stats(current_players, player_ids)
+    simulated_bets = prior_bets + bet_totals
+    simulated_returns = prior_returns[:, None] + structure_payouts(bet_matrix)
+
+    # 仅保留本局投注达标的玩家，再交给加权 STD 计算
+    filtered_ids = [pid for pid, ok in zip(player_ids, eligible_mask) if ok]
+    filtered_bets = simulated_bets[eligible_mask]
+    std_values, variances, rtp, std_eligible, total_weight = calculate_weighted_std_matrix(
+        filtered_bets, simulated_returns[eligible_mask], target_rtp
     )
+    detail_ids = [pid for pid, ok in zip(filtered_ids, std_eligible) if ok]
+    detail_bets = filtered_bets[std_eligible].tolist()
+    detail_returns = simulated_returns[eligible_mask][std_eligible]
+    detail_rtp = rtp[std_eligible]
 
     results = []
     std_analysis_data = []
 
-    for structure in deepcopy(WINNING_STRUCTURES):
-        winning_areas = structure["areas"]
+    for s, structure in enumerate(WINNING_STRUCTURES):
+        winning_areas = list(structure["areas"])
         weight = structure["weight"]
-        simulated_attitudes = []
-        simulated_players = deepcopy(current_players)
-
-        # 模拟结算
-        for player_id, bets in current_bets.items():
-            payout = sum(
-                amount * PAYOUT_RATES[area]
-                for area, amount in bets.items()
-                if area in winning_areas
-            )
-            simulated_players[player_id].update(sum(bets.values()), payout)
-
-        filtered_players = {
-            pid: simulated_players[pid]
-            for pid, bets in current_bets.items()
-            if sum(bets.values()) >= MINIMUM_BET_THRESHOLD
-        }
-        std_value, std_details = calculate_weighted_std(filtered_players, return_details=True)
+        std_value = float(std_values[s])
+
+        if total_weight == 0:
+            std_value = 0
+            std_details = {"players": [], "target_rtp": target_rtp, "weighted_variance": 0}
+        else:
+            returns_s = detail_returns[:, s].tolist()
+            rtp_s = detail_rtp[:, s].tolist()
+            std_details = {
+                "players": [
+                    {
+                        "id": pid,
+                        "bet": bet,
+                        "return": ret,
+                        "rtp": r,
+                        "weight": bet / total_weight
+                    }
+                    for pid, bet, ret, r in zip(detail_ids, detail_bets, returns_s, rtp_s)
+                ],
+                "target_rtp": target_rtp,
+                "weighted_variance": float(variances[s])
+            }
 
         results.append({
             "winning_areas": winning_areas,
@@ -83,12 +106,12 @@ def simulate_structure_metrics(
         })
 
         std_analysis_data.append({
-            "winning_areas": winning_areas,
+            "winning_areas": list(winning_areas),
             "std": std_value,
             "details": std_details
         })
 
-    return results, std_analysis_data, (rtp_std_low, rtp_std_high), len(eligible_players)
+    return results, std_analysis_data, (rtp_std_low, rtp_std_high), sample_size
 
 def simulate_structure_memory_effect(
     current_players: Dict[str, PlayerStats],
@@ -98,106 +121,112 @@ def simulate_structure_memory_effect(
 ) -> List[Dict]:
     """
     对每个结构模拟其对充值玩家的“态势缓冲”效果（记忆态势值的振幅增量）。
+
+    历史记忆部分取自 memory_attitude_cache（结算时刷新），
+    每个结构只需计算新一局的单项增量：simulated = Δ_s · exp(0) + shifted_attitude。
     """
+    # ✅ 筛选：当前局有下注 + 有充值
+    affected_players = [
+        pid for pid in current_players
+        if pid in current_bets
+        and sum(current_bets[pid].values()) != 0
+        and player_recharges.get(pid, 0.0) > 0
+    ]
+
     results = []
+    if not affected_players:
+        for structure in WINNING_STRUCTURES:
+            results.append({
+                "winning_areas": list(structure["areas"]),
+                "weight": structure["weight"],
+                "memory_effect": 0.0,
+                "affected_players": []
+            })
+        return results
+
+    memory_states = [get_memory_state(pid, round_id) for pid in affected_players]
+    avg_bets = np.array([m["avg_bet"] for m in memory_states], dtype=np.float64)
+    shifted = np.array([m["shifted_attitude"] for m in memory_states], dtype=np.float64)
+
+    # ✅ 模拟每个结构下每位玩家的净收益 → 记忆盈利单项增量
+    _, bet_matrix = pack_bets({pid: current_bets[pid] for pid in affected_players})
+    bet_totals = np.array([sum(current_bets[pid].values()) for pid in affected_players], dtype=np.float64)
+    net_profit_simulated = structure_payouts(bet_matrix) - bet_totals[:, None]
+    safe_avg = np.where(avg_bets > 0, avg_bets, 1.0)
+    simulated_memory_profit = np.where((avg_bets > 0)[:, None], net_profit_simulated / safe_avg[:, None], 0.0)
+    simulated_attitudes = simulated_memory_profit * MEMORY_DECAY_WEIGHTS[0] + shifted[:, None]
+
+    # ✅ 按充值额加权，计算每个结构的记忆标准差效果
+    weights = np.array([player_recharges.get(pid, 0.0) for pid in affected_players], dtype=np.float64)
+    total_weight = weights.sum()
+    weighted_mean = (weights[:, None] * simulated_attitudes).sum(axis=0) / total_weight
+    weighted_variance = (weights[:, None] * (simulated_attitudes - weighted_mean) ** 2).sum(axis=0) / total_weight
+    memory_effects = np.sqrt(weighted_variance)
+
+    for s, structure in enumerate(WINNING_STRUCTURES):
+        results.append({
+            "winning_areas": list(structure["areas"]),
+            "weight": structure["weight"],
+            "memory_effect": float(memory_effects[s]),
+            "affected_players": list(affected_players)
+        })
 
-    for structure in deepcopy(WINNING_STRUCTURES):
-        winning_areas = structure["areas"]
-        weight = structure["weight"]
+    return results
 
-        simulated_attitudes = []
-        affected_players = []
-
-        memory_effect = 0.0   # ✅ 请在这里补上这行，防止结构无玩家时未赋值
-
-        for pid, stats in current_players.items():
-            # ✅ 该玩家必须在当前局有下注
-            if pid not in current_bets or sum(current_bets[pid].values()) == 0:
-                continue
-
-            # ✅ 条件筛选：充值 + 当前态势值极端
-            recharge = player_recharges.get(pid, 0.0)
-            current_attitude = calculate_memory_attitude(pid, round_id)
-
-            if recharge <= 0:
-            # or (-0.2 < current_attitude < 0.2):
-                continue
-            
-            # ✅ 获取当前记忆态势值
-            current_attitude = calculate_memory_attitude(pid, round_id)
-
-            # ✅ 模拟该结构下该玩家是否中奖
-            area_bets = current_bets[pid]
-            bet_total = sum(area_bets.values())
-            payout_simulated = sum(
-                amount * PAYOUT_RATES[area]
-                for area, amount in area_bets.items()
-                if area in winning_areas
-            )
-            net_profit_simulated = payout_simulated - bet_total
-
-            # ✅ 获取历史 MEMORY_WINDOW 条真实投注记忆
-            recent_memory = []
-            for log in reversed(player_log):
-                if log["player_id"] == pid and log["round_id"] < round_id and log["total_bet"] > 0:
-                    if "memory_profit" in log:
-                        recent_memory.append(log["memory_profit"])
-                    if len(recent_memory) == MEMORY_WINDOW:
-                        break
-            recent_memory.reverse()  # 最新在前
-
-            # ✅ 同时收集 recent_memory 和 recent_bets，用于计算平均投注
-            recent_memory = []
-            recent_bets = []
-            for log in reversed(player_log):
-                if log["player_id"] == pid and log["round_id"] < round_id and log["total_bet"] > 0:
-                    if "memory_profit" in log:
-                        recent_memory.append(log["memory_profit"])
-                    recent_bets.append(log["total_bet"])
-                    if len(recent_bets) == MEMORY_WINDOW:
-                        break
-                    
-            # ✅ 计算平均投注额（基于参与局）
-            recent_memory.reverse()
-            recent_bets.reverse()
-            if recent_bets:
-                avg_bet = sum(recent_bets) / len(recent_bets)
-                simulated_memory_profit = net_profit_simulated / avg_bet if avg_bet > 0 else 0.0
-            else:
-                simulated_memory_profit = 0.0
-
-            # ✅ 构造模拟后的记忆列表
-            combined_memory = [simulated_memory_profit] + recent_memory
-
-            # ✅ 按指数衰减生成模拟态势值
-            simulated_attitude = 0.0
-            for i, mem in enumerate(combined_memory[:MEMORY_WINDOW]):
-                weight_decay = math.exp(-MEMORY_DECAY_ALPHA * i)
-                simulated_attitude += mem * weight_decay
-
-            # ✅ 收集模拟态势值
-            simulated_attitudes.append(simulated_attitude)
-            affected_players.append(pid)
-
-        # ✅ 所有玩家处理完成后，计算结构的记忆标准差效果
-        weights = [player_recharges.get(pid, 0.0) for pid in affected_players]
-        total_weight = sum(weights)
-        
-        if total_weight > 0:
-            weighted_mean = sum(w * x for w, x in zip(weights, simulated_attitudes)) / total_weight
-            weighted_variance = sum(w * (x - weighted_mean) ** 2 for w, x in zip(weights, simulated_attitudes)) / total_weight
-            memory_effect = weighted_variance ** 0.5
-        else:
-            memory_effect = 0.0
+def merge_memory_effects(results: List[Dict], memory_effects: List[Dict]):
+    """按 winning_areas 将 memory_effect 合并进结构指标（原地修改 results）"""
+    for struct in results:
+        match = next((m for m in memory_effects if m["winning_areas"] == struct["winning_areas"]), None)
+        if match:
+            struct["memory_effect"] = match["memory_effect"]
 
+# --- 基于下注簿的增量版本（下注阶段每秒评估使用） ---
+def simulate_structure_metrics_from_book(
+    bet_book,
+    *,
+    confidence_level: float = CONFIDENCE_LEVEL,
+    base_std: float = STD_THRESHOLD
+):
+    """
+    与 simulate_structure_metrics 输出同结构，但直接读取 BetBook 中增量维护的累加量，
+    评估成本与玩家数无关。逐玩家 STD 明细不在此生成（按需调用 bet_book.std_details）。
+    """
+    sample_size = bet_book.sample_size
+    rtp_std_low, rtp_std_high = compute_dynamic_std_confidence_interval(
+        base_std, confidence_level, sample_size
+    )
+    std_values, variances = bet_book.structure_stds()
 
+    results = []
+    std_analysis_data = []
+    for s, structure in enumerate(WINNING_STRUCTURES):
+        std_value = float(std_values[s])
         results.append({
-            "winning_areas": winning_areas,
-            "weight": weight,
-            "memory_effect": memory_effect,
-            "affected_players": affected_players
+            "winning_areas": list(structure["areas"]),
+            "std": std_value,
+            "weight": structure["weight"],
+            "within_confidence": rtp_std_low <= std_value <= rtp_std_high
+        })
+        std_analysis_data.append({
+            "winning_areas": list(structure["areas"]),
+            "std": std_value,
+            "details": {"target_rtp": bet_book.target_rtp, "weighted_variance": float(variances[s])}
         })
 
+    return results, std_analysis_data, (rtp_std_low, rtp_std_high), sample_size
 
-
-    return results
+def simulate_structure_memory_effect_from_book(bet_book) -> List[Dict]:
+    """
+    与 simulate_structure_memory_effect 输出同结构，直接读取 BetBook 中的记忆态势累加量。
+    """
+    memory_effects = bet_book.memory_effects()
+    affected_players = bet_book.memory_players()
+    return [
+        {
+            "winning_areas": list(structure["areas"]),
+            "weight": structure["weight"],
+            "memory_effect": float(memory_effects[s]),
+            "affected_players": list(affected_players)
+        }
+        for s, structure in enumerate(WINNING_STRUCTURES)
+    ]
@@ -0,0 +1,174 @@
+# stage_profiler.py
+
+"""
+对局阶段性能剖析模块：
+- 为 GameRoundController 的各阶段（initialize_bets / tick_betting_phase / evaluate_structures /
+  finalize_outcome / settle）记录墙钟耗时、CPU 耗时、玩家数与净存活内存块
+- 净存活内存块为阶段前后 sys.getallocatedblocks() 之差（分配减释放，可为负），不是分配次数；
+  取它而不用 tracemalloc，是为了不拖慢被计时的阶段
+- 每个阶段保留最近 N 条样本（滚动窗口），另有累计计数，用于侧边栏面板展示与导出
+- 可导出为 Prometheus 文本格式，或写入本地文件（.json 为样本明细，其余为 Prometheus 文本）
+
+关闭时不做任何包装：控制器只在 profiler.enabled 为真时才替换实例方法，热路径零额外开销。
+阶段可以嵌套（如 tick_betting_phase 内部调用 evaluate_structures），父阶段耗时包含子阶段。
+"""
+
+import json
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from typing import Dict, List, Optional
+import numpy as np
+
+# 控制器中被剖析的阶段（方法名）
+CONTROLLER_STAGES = ("initialize_bets", "tick_betting_phase", "evaluate_structures", "finalize_outcome", "settle")
+
+
+class StageProfiler:
+    def __init__(self, enabled: bool = False, history_size: int = 512):
+        self.enabled = enabled
+        self.history_size = history_size
+        # 阶段 → 最近样本 deque（最旧在前）
+        self.samples: Dict[str, deque] = {}
+        # 阶段 → 累计量（Prometheus counter）
+        self.totals: Dict[str, Dict[str, float]] = {}
+
+    # --- 采集 ---
+    def record(self, stage: str, wall_sec: float, cpu_sec: float, alloc_blocks: int, state: Optional[Dict] = None):
+        sample = {
+            "round_id": state.get("round_id") if state is not None else None,
+            "wall_ms": wall_sec * 1000,
+            "cpu_ms": cpu_sec * 1000,
+            "alloc_blocks": alloc_blocks,
+            "bettors": len(state.get("current_bets") or {}) if state is not None else 0,
+            "pending": len(state.get("partial_bets") or {}) if state is not None else 0,
+            "timestamp": time.time(),
+        }
+        if stage not in self.samples:
+            # 先建累计量再建样本窗口：读取方以 samples 为准遍历
+            self.totals[stage] = {"count": 0, "wall_sec": 0.0, "cpu_sec": 0.0}
+            self.samples[stage] = deque(maxlen=self.history_size)
+        self.samples[stage].append(sample)
+        totals = self.totals[stage]
+        totals["count"] += 1
+        totals["wall_sec"] += wall_sec
+        totals["cpu_sec"] += cpu_sec
+
+    @contextmanager
+    def _measure(self, stage: str, state: Optional[Dict]):
+        blocks = sys.getallocatedblocks()
+        cpu = time.thread_time()
+        wall = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(
+                stage,
+                time.perf_counter() - wall,
+                time.thread_time() - cpu,
+                sys.getallocatedblocks() - blocks,
+                state
+            )
+
+    def stage(self, name: str, state: Optional[Dict] = None):
+        """
+        上下文管理器形式的剖析点（用于控制器以外的阶段，如 UI 渲染）。
+        关闭时返回空上下文。
+        """
+        if not self.enabled:
+            return nullcontext()
+        return self._measure(name, state)
+
+    def instrument(self, controller, stages=CONTROLLER_STAGES):
+        """
+        以实例属性包装控制器的阶段方法。内部互相调用（self.evaluate_structures()）同样会经过包装。
+        """
+        for name in stages:
+            method = getattr(controller, name)
+            setattr(controller, name, self._wrap(name, method, controller.state))
+        return controller
+
+    def _wrap(self, name: str, method, state: Dict):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            with self._measure(name, state):
+                return method(*args, **kwargs)
+        return wrapper
+
+    def reset(self):
+        self.samples.clear()
+        self.totals.clear()
+
+    # --- 汇总与导出 ---
+    def summary(self) -> List[Dict]:
+        """各阶段滚动窗口统计：样本数、均值 / p50 / p99 / 最大墙钟耗时、平均 CPU 耗时与净存活块"""
+        rows = []
+        for stage, samples in list(self.samples.items()):
+            samples = list(samples)  # 后台引擎线程可能同时写入，先取副本
+            wall = np.array([s["wall_ms"] for s in samples])
+            cpu = np.array([s["cpu_ms"] for s in samples])
+            alloc = np.array([s["alloc_blocks"] for s in samples])
+            rows.append({
+                "stage": stage,
+                "count": self.totals[stage]["count"],
+                "window": len(samples),
+                "wall_mean_ms": float(wall.mean()),
+                "wall_p50_ms": float(np.percentile(wall, 50)),
+                "wall_p99_ms": float(np.percentile(wall, 99)),
+                "wall_max_ms": float(wall.max()),
+                "cpu_mean_ms": float(cpu.mean()),
+                "alloc_blocks_mean": float(alloc.mean()),
+                "bettors_last": samples[-1]["bettors"],
+            })
+        return rows
+
+    def to_prometheus(self, prefix: str = "game_round_stage") -> str:
+        """Prometheus 文本格式：滚动窗口分位数（summary）+ 累计计数与耗时（counter）"""
+        lines = [
+            f"# HELP {prefix}_wall_seconds Wall-clock time per controller stage (rolling window).",
+            f"# TYPE {prefix}_wall_seconds summary",
+        ]
+        sample_lists = [(stage, list(samples)) for stage, samples in list(self.samples.items())]
+        for stage, samples in sample_lists:
+            wall = np.array([s["wall_ms"] for s in samples]) / 1000
+            for q in (0.5, 0.9, 0.99):
+                lines.append(f'{prefix}_wall_seconds{{stage="{stage}",quantile="{q}"}} {np.quantile(wall, q):.9f}')
+            lines.append(f'{prefix}_wall_seconds_sum{{stage="{stage}"}} {self.totals[stage]["wall_sec"]:.9f}')
+            lines.append(f'{prefix}_wall_seconds_count{{stage="{stage}"}} {self.totals[stage]["count"]}')
+
+        lines += [
+            f"# HELP {prefix}_cpu_seconds_total CPU time per controller stage.",
+            f"# TYPE {prefix}_cpu_seconds_total counter",
+        ]
+        for stage, totals in list(self.totals.items()):
+            lines.append(f'{prefix}_cpu_seconds_total{{stage="{stage}"}} {totals["cpu_sec"]:.9f}')
+
+        lines += [
+            f"# HELP {prefix}_alloc_blocks Net change in live memory blocks during the latest call (allocations minus frees, may be negative).",
+            f"# TYPE {prefix}_alloc_blocks gauge",
+        ]
+        for stage, samples in sample_lists:
+            lines.append(f'{prefix}_alloc_blocks{{stage="{stage}"}} {samples[-1]["alloc_blocks"]}')
+
+        lines += [
+            f"# HELP {prefix}_bettors Bettors in the round at the latest call.",
+            f"# TYPE {prefix}_bettors gauge",
+        ]
+        for stage, samples in sample_lists:
+            lines.append(f'{prefix}_bettors{{stage="{stage}"}} {samples[-1]["bettors"]}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: str):
+        """写入本地文件：.json 为汇总 + 样本明细，其余扩展名为 Prometheus 文本（可供 node_exporter textfile 采集）"""
+        if path.endswith(".json"):
+            payload = {
+                "summary": self.summary(),
+                "samples": {stage: list(samples) for stage, samples in self.samples.items()},
+            }
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, indent=2)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
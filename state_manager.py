@@ -1,15 +1,22 @@
 import streamlit as st
+import os
 import random
-from player_profiles import initialize_players, PlayerStats
+import threading
+import uuid
+from player_profiles import initialize_players, PlayerStatsStore
 from platform_pool import PlatformPool
-from config import ROUND_TOTAL_DURATION, BETTING_DURATION, WAITING_DURATION
+from stage_profiler import StageProfiler
+from config import ROUND_TOTAL_DURATION, BETTING_DURATION, WAITING_DURATION, SNAPSHOT_DIR, SNAPSHOT_FULL_EVERY, APP_LOG_MAX_ROUNDS
+import db_logger
 
 # ✅ 控奖系统核心 Session 状态初始化函数
 def initialize_session_state():
+    # ✅ 页面长时间运行：内存日志只保留最近 APP_LOG_MAX_ROUNDS 局
+    db_logger.set_memory_log_window(APP_LOG_MAX_ROUNDS)
     if "sim_players" not in st.session_state:
         st.session_state.sim_players = initialize_players()
     if "stat_players" not in st.session_state:
-        st.session_state.stat_players = {pid: PlayerStats() for pid in st.session_state.sim_players.keys()}
+        st.session_state.stat_players = PlayerStatsStore(st.session_state.sim_players.keys())
     if "rtp_history" not in st.session_state:
         st.session_state.rtp_history = {}
     if "round_id" not in st.session_state:
@@ -34,10 +41,78 @@ def initialize_session_state():
         st.session_state.structure_result_cache = None
     if "partial_bets" not in st.session_state:
         st.session_state.partial_bets = {}
+    if "bet_book" not in st.session_state:
+        st.session_state.bet_book = None
+    if "imported_round" not in st.session_state:
+        st.session_state.imported_round = False  # 当前局是否为导入的回放局
+    if "activity_tracker" not in st.session_state:
+        st.session_state.activity_tracker = None  # 玩家参与状态（betting_input.ActivityTracker），首次生成下注时创建
+    if "bet_importer" not in st.session_state:
+        st.session_state.bet_importer = None  # 下注文件逐局读取器（bet_import.PrefetchingRoundReader）
     if "has_started" not in st.session_state:
         st.session_state.has_started = False
     if "platform_pool" not in st.session_state:
         st.session_state.platform_pool = PlatformPool()
+    if "decision_budget_ms" not in st.session_state:
+        st.session_state.decision_budget_ms = 0.0  # 开奖限时决策预算（毫秒），0 为常规决策
+    if "anytime_evaluator" not in st.session_state:
+        st.session_state.anytime_evaluator = None
+    if "decision_info" not in st.session_state:
+        st.session_state.decision_info = None
+    if "engine" not in st.session_state:
+        st.session_state.engine = None  # 后台对局引擎（round_engine.RoundEngineWorker），None 为页面同步推进
+    if "profiler" not in st.session_state:
+        st.session_state.profiler = StageProfiler(enabled=False)
+    if "snapshot_manager" not in st.session_state:
+        st.session_state.snapshot_manager = None  # 局边界状态快照（state_snapshot.SnapshotManager），SNAPSHOT_DIR 设置时启用
+        st.session_state.snapshot_notice = None
+        # ✅ 玩家日志索引、记忆态势缓存与内存日志为进程共享：只有进程内唯一在线的会话启用快照，
+        # 否则恢复会清掉其他会话正在使用的全局状态，写出的快照也会混入其他会话的玩家
+        if SNAPSHOT_DIR and _claim_exclusive_session():
+            from state_snapshot import SnapshotManager, has_snapshot, restore_snapshot
+            # ✅ 快照目录的键写在页面 URL 的 ?snapshot= 中，刷新页面 / 重启进程后仍指向同一目录
+            directory = os.path.join(SNAPSHOT_DIR, _snapshot_session_key())
+            # ✅ 新会话（刷新页面 / 进程重启）先从快照恢复，再继续写快照；
+            # 全局随机状态为进程共享，不随单个会话的快照回退
+            if has_snapshot(directory):
+                restore_snapshot(directory, st.session_state, restore_global_rng=False)
+            st.session_state.snapshot_manager = SnapshotManager(directory, full_every=SNAPSHOT_FULL_EVERY)
+        elif SNAPSHOT_DIR:
+            st.session_state.snapshot_notice = "其他页面会话在线，本会话不恢复、不写状态快照（日志索引等为进程共享）"
+
+
+_session_lock = threading.Lock()
+
+
+@st.cache_resource
+def _page_sessions() -> set:
+    """进程内登记过的页面会话 id（所有会话共享）"""
+    return set()
+
+
+# ✅ 登记本会话；进程内没有其他在线会话时返回 True（裸跑 / 测试环境无运行时，视为唯一会话）
+def _claim_exclusive_session() -> bool:
+    from streamlit import runtime
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    if ctx is None or not runtime.exists():
+        return True
+    instance = runtime.get_instance()
+    sessions = _page_sessions()
+    with _session_lock:
+        sessions.difference_update([sid for sid in sessions if not instance.is_active_session(sid)])
+        others = sessions - {ctx.session_id}
+        sessions.add(ctx.session_id)
+    return not others
+
+
+# ✅ 快照会话键：优先沿用 URL 中的键，缺失或不合法时新建并写回 URL
+def _snapshot_session_key() -> str:
+    key = st.query_params.get("snapshot", "")
+    if not (len(key) == 32 and all(c in "0123456789abcdef" for c in key)):
+        key = uuid.uuid4().hex
+        st.query_params["snapshot"] = key
+    return key
 
 # ✅ 策略参数维护函数：分离 UI 和 session 初始化，便于日后统一管理
 def ensure_param_defaults():
@@ -0,0 +1,900 @@
+# state_snapshot.py
+
+"""
+对局状态快照（崩溃恢复）：
+- 局边界（结算完成后）抓取整个引擎状态：模拟玩家、玩家统计、RTP 历史、水池、下注随机数状态、参与状态，
+  以及模块级的玩家日志索引、记忆态势缓存与内存日志（round_log / player_log）
+- 存储格式：快照目录下每个快照一个 .npz（列式数组 + JSON 元数据），manifest.json 记录快照链与日志分段
+- 全量快照之间写增量快照：数组列只写与上一快照不同的行与新增行，玩家级数据只写上一快照以来的结算流水
+- 内存日志只追加，单独写为日志分段（log_*.npz）；每次全量快照时已有分段合并为一个，分段数不随对局时长增长
+- 对局线程每局只收集本局结算记录的引用，抓取时只拷贝数组；玩家级数据的展开、编码与写盘都在后台线程，
+  由写入线程维护的索引镜像生成全量快照；后台写入未完成时跳过本局快照，流水累积到下一次
+- restore_snapshot()：载入最近的全量快照并依次应用其后的增量，原地恢复到状态字典（或 session_state）；
+  玩家日志索引与记忆态势只建 玩家 → 快照行 的索引，首次访问某玩家时才解码。
+  恢复耗时随玩家数与快照链长增长：2 万玩家、60 局（记录 RTP 历史）时仅全量约 0.2~0.3s，
+  每多一个增量约 +40ms（默认 full_every=10，最坏约 0.5~0.6s）
+
+日志记录、下注字典写入后不再修改（快照只浅拷贝容器）。日志后端为 SQLite / Parquet 时日志已由后端持久化，快照不再重复写出。
+恢复后的状态停在最近一次快照的局结算之后：round_id 为已结算的局，下一局由调用方照常开局。
+
+命令行用法（查看快照目录并计时恢复）：
+    python state_snapshot.py snapshots/
+"""
+
+import argparse
+import json
+import math
+import os
+import pickle
+import queue
+import random
+import threading
+import time
+from collections import deque
+from itertools import chain
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from config import MEMORY_WINDOW
+from betting_input import ActivityTracker
+from player_profiles import POPULATION_COLUMNS, PlayerPopulation, PlayerStatsStore
+from platform_pool import PlatformPool, RingArray
+from structure_matrix import AREAS
+import db_logger
+import metrics_engine
+from log_storage import MemoryLogBackend
+
+SNAPSHOT_FORMAT = 2
+MANIFEST_NAME = "manifest.json"
+
+# 恢复时重置的单局临时状态（快照停在局结算之后）
+TRANSIENT_DEFAULTS = {
+    "current_bets": {},
+    "partial_bets": {},
+    "bet_book": None,
+    "bet_schedule": None,
+    "structure_result_cache": None,
+    "forced_outcome": None,
+    "decision_info": None,
+    "anytime_evaluator": None,
+    "imported_round": False,
+    "running": False,
+}
+# 元数据中保存的标量状态键
+META_KEYS = ("round_id", "has_started", "target_rtp", "confidence_level", "decision_budget_ms", "debug_speed", "auto_simulate")
+
+RECORD_FIELDS = ("total_bet", "payout", "net_profit", "memory_profit")
+_RECORD_SCALARS = itemgetter("round_id", *RECORD_FIELDS)
+_RECORD_SCALAR_COLUMNS = [0] + list(range(1 + len(AREAS), 1 + len(AREAS) + len(RECORD_FIELDS)))
+_RECORD_AREA_BETS = itemgetter("area_bets")
+MEMORY_FIELDS = ("attitude", "shifted_attitude", "avg_bet")
+# 记忆态势行：三个字段 + last_round（None 在 float 数组中即为 NaN）
+_MEMORY_VALUES = itemgetter(*MEMORY_FIELDS, "last_round")
+
+
+# --- 编码工具 ---
+_NEWLINE = np.frombuffer(b"\n", dtype=np.uint8)
+
+
+def _encode_strings(values: List[str]) -> np.ndarray:
+    return np.frombuffer("\n".join(values).encode("utf-8"), dtype=np.uint8)
+
+
+def _decode_strings(data: np.ndarray) -> List[str]:
+    text = data.tobytes().decode("utf-8")
+    return text.split("\n") if text else []
+
+
+def _encode_json(value) -> np.ndarray:
+    return np.frombuffer(json.dumps(value, default=_json_default, ensure_ascii=False).encode("utf-8"), dtype=np.uint8)
+
+
+def _decode_json(data: np.ndarray):
+    return json.loads(data.tobytes().decode("utf-8"))
+
+
+def _json_default(value):
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    if isinstance(value, (set, tuple)):
+        return list(value)
+    raise TypeError(f"无法写入快照元数据：{type(value).__name__}")
+
+
+def _encode_bets(bets_list: List[Dict[int, float]]) -> np.ndarray:
+    """[{area: amount}] → (n, 8) 矩阵，未下注的区域为 NaN（与下注 0 区分）"""
+    matrix = np.full((len(bets_list), len(AREAS)), np.nan)
+    counts = np.fromiter(map(len, bets_list), dtype=np.int64, count=len(bets_list))
+    total = int(counts.sum())
+    if total:
+        rows = np.repeat(np.arange(len(bets_list)), counts)
+        areas = np.fromiter(chain.from_iterable(bets_list), dtype=np.int64, count=total)
+        matrix[rows, areas - 1] = np.fromiter(chain.from_iterable(map(dict.values, bets_list)), dtype=np.float64, count=total)
+    return matrix
+
+
+# 下注区域位掩码 → 区域元组（解码时按行掩码取区域，只对已下注的金额建字典）
+_MASK_AREAS = [tuple(area for bit, area in enumerate(AREAS) if mask >> bit & 1) for mask in range(1 << len(AREAS))]
+_AREA_BITS = 1 << np.arange(len(AREAS))
+
+
+def _decode_bets(matrix: np.ndarray) -> List[Dict[int, float]]:
+    present = ~np.isnan(matrix)
+    ends = np.cumsum(present.sum(axis=1)).tolist()
+    amounts = matrix[present].tolist()
+    areas = [_MASK_AREAS[mask] for mask in (present @ _AREA_BITS).tolist()]
+    return [dict(zip(row_areas, amounts[end - len(row_areas):end])) for row_areas, end in zip(areas, ends)]
+
+
+def _encode_records(records: List[Dict]) -> np.ndarray:
+    """
+    玩家日志记录（db_logger.log_player_detail 格式）→ (n, 13) 矩阵：
+    round_id、区域 1~8 下注（未下注为 NaN）、total_bet、payout、net_profit、memory_profit
+    """
+    matrix = np.empty((len(records), 1 + len(AREAS) + len(RECORD_FIELDS)))
+    matrix[:, _RECORD_SCALAR_COLUMNS] = np.fromiter(
+        chain.from_iterable(map(_RECORD_SCALARS, records)), dtype=np.float64, count=len(records) * len(_RECORD_SCALAR_COLUMNS)
+    ).reshape(len(records), len(_RECORD_SCALAR_COLUMNS))
+    matrix[:, 1:1 + len(AREAS)] = _encode_bets(list(map(_RECORD_AREA_BETS, records)))
+    return matrix
+
+
+def _decode_records(matrix: np.ndarray, player_ids: List[str]) -> List[Dict]:
+    total_bets, payouts, net_profits, memory_profits = matrix[:, 1 + len(AREAS):].T.tolist() or ([], [], [], [])
+    return [
+        {
+            "round_id": round_id,
+            "player_id": pid,
+            "area_bets": area_bets,
+            "total_bet": total_bet,
+            "payout": payout,
+            "net_profit": net_profit,
+            "memory_profit": memory_profit,
+        }
+        for pid, round_id, area_bets, total_bet, payout, net_profit, memory_profit in zip(
+            player_ids, matrix[:, 0].astype(np.int64).tolist(), _decode_bets(matrix[:, 1:1 + len(AREAS)]),
+            total_bets, payouts, net_profits, memory_profits
+        )
+    ]
+
+
+def _diff_column(previous: Optional[np.ndarray], current: np.ndarray, name: str, arrays: Dict[str, np.ndarray]):
+    """增量列：与上一快照相比变化的行（@idx / @val）与新增的行（@tail）；长度缩短或无基准时写整列"""
+    if previous is None or len(current) < len(previous) or previous.dtype != current.dtype:
+        arrays[name] = current
+        return
+    n = len(previous)
+    changed = np.flatnonzero(previous != current[:n])
+    if changed.size:
+        arrays[f"{name}@idx"] = changed
+        arrays[f"{name}@val"] = current[changed]
+    if len(current) > n:
+        arrays[f"{name}@tail"] = current[n:]
+
+
+def _apply_column(base: Optional[np.ndarray], name: str, data) -> Optional[np.ndarray]:
+    if name in data:
+        return data[name].copy()
+    if base is None:
+        return None
+    if f"{name}@idx" in data:
+        base[data[f"{name}@idx"]] = data[f"{name}@val"]
+    if f"{name}@tail" in data:
+        base = np.concatenate([base, data[f"{name}@tail"]])
+    return base
+
+
+# --- 状态抓取（对局线程） ---
+def _pool_arrays(pool) -> Dict[str, np.ndarray]:
+    arrays = {}
+    for ring_name, ring in (("deltas", pool.deltas), ("rounds", pool.round_history)):
+        for column, values in ring.columns.items():
+            arrays[f"pool/{ring_name}/{column}"] = values.copy()
+    return arrays
+
+
+def _pool_meta(pool) -> Dict[str, Any]:
+    return {
+        "pool_value": pool.pool_value,
+        "tax_rate": pool.tax_rate,
+        "pending": [pool._pending_in, pool._pending_out, pool._pending_tax],
+        "rings": {
+            "deltas": [pool.deltas.next_index, pool.deltas.size],
+            "rounds": [pool.round_history.next_index, pool.round_history.size],
+        },
+    }
+
+
+def _seed_indexes(state) -> Dict[str, Any]:
+    """玩家级索引的完整副本（仅首次抓取时执行一次，之后由逐局流水增量维护写入线程的镜像）"""
+    rtp_history = state.get("rtp_history")
+    return {
+        "recent": {pid: tuple(records) for pid, records in db_logger.player_recent_log.items()},
+        "latest": dict(db_logger.player_latest_log),
+        "pending": dict(db_logger.pending_player_index),  # 恢复后尚未展开的玩家，由写入线程解码
+        "memory": dict(metrics_engine.memory_attitude_cache),
+        "pending_memory": dict(metrics_engine.pending_memory_attitude),
+        "rtp": {pid: list(values) for pid, values in rtp_history.items()} if rtp_history is not None else None,
+    }
+
+
+class SnapshotManager:
+    """
+    局边界快照写入器。放入 state["snapshot_manager"] 后，GameRoundController.settle() 每局结算完调用 on_round_settled()。
+    - every：每隔多少局抓取一次（其间的变更累积到下一次）
+    - full_every：每隔多少次快照写一次全量（其余为增量）；链越长写入越省、恢复越慢（恢复需依次读入链上每个快照）
+    - keep_chains：保留的快照链数（每条链 = 一个全量 + 其后的增量）；日志分段在每次全量时合并为一个
+    - compress：是否压缩 .npz（默认不压缩，写入最快；2 万玩家时目录约 150~200MB，磁盘紧张时开启）
+
+    对局线程每局只把本局结算记录、记忆态势与 RTP 的引用追加到流水，抓取时只拷贝数组；
+    写入线程按流水维护玩家级索引的镜像，全量快照由镜像编码。
+    """
+
+    def __init__(self, directory: str, *, every: int = 1, full_every: int = 10, keep_chains: int = 2, compress: bool = False):
+        self.directory = directory
+        self.every = max(1, every)
+        self.full_every = max(1, full_every)
+        self.keep_chains = max(1, keep_chains)
+        self.compress = compress
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = read_manifest(directory) or {"format": SNAPSHOT_FORMAT, "chain": [], "log_segments": [], "log_lengths": None}
+
+        # 对局线程维护：上一快照以来的结算流水、玩家统计与日志已写出的长度
+        self._rounds_seen = 0
+        self._uncaptured_rounds = 0
+        self._settled_round: Optional[int] = None
+        self._snapshots_since_full = 0
+        self._journal: List[Tuple] = []
+        self._seeded = False
+        self._stats_size = 0
+        self._log_lengths: Optional[Tuple[int, int]] = None
+        self._force_full = True
+
+        # 写入线程维护：上一快照的数组（计算增量用）与玩家级索引镜像
+        self._base_arrays: Dict[str, np.ndarray] = {}
+        self._recent: Dict[str, deque] = {}
+        self._latest: Dict[str, Dict] = {}
+        self._memory: Dict[str, Dict] = {}
+        self._rtp: Optional[Dict[str, List[float]]] = None
+        self._broken = False
+        self._queue: "queue.Queue" = queue.Queue(maxsize=2)
+        self._thread = threading.Thread(target=self._write_loop, name="state-snapshot", daemon=True)
+        self._thread.start()
+
+        self.written = 0
+        self.skipped = 0
+        self.error: Optional[BaseException] = None
+        self.last_capture_ms = 0.0
+        self.last_write_ms = 0.0
+        self.last_bytes = 0
+
+    # --- 对局线程 ---
+    def on_round_settled(self, state):
+        """每局结算后调用：本局结算记录的引用追加到流水，到期时抓取快照并交给写入线程"""
+        if self._seeded:
+            bets = state["current_bets"]
+            rtp_history = state.get("rtp_history")
+            self._journal.append((
+                list(bets),
+                list(map(db_logger.player_latest_log.__getitem__, bets)),
+                list(map(metrics_engine.memory_attitude_cache.__getitem__, bets)),
+                [rtp_history[pid][-1] for pid in bets] if rtp_history is not None else None,
+            ))
+        self._settled_round = state["round_id"]
+        self._rounds_seen += 1
+        self._uncaptured_rounds += 1
+        if self._rounds_seen % self.every:
+            return
+        if self._queue.full():
+            self.skipped += 1
+            return
+        self.snapshot(state)
+
+    def snapshot(self, state, *, full: Optional[bool] = None):
+        """立即抓取一次快照（full=None 时按 full_every 决定全量 / 增量）"""
+        start = time.perf_counter()
+        if full is None:
+            full = self._force_full or self._snapshots_since_full >= self.full_every - 1
+        # 停止前补抓时局号已推进到下一局，快照记录的是最近一次结算的局号
+        round_id = state["round_id"] if self._settled_round is None else self._settled_round
+        capture = self._capture(state, full)
+        capture["meta"]["round_id"] = round_id
+        if not self._seeded:
+            capture["seed"] = _seed_indexes(state)
+            self._seeded = True
+        capture["journal"], self._journal = self._journal, []
+        self._snapshots_since_full = 0 if full else self._snapshots_since_full + 1
+        self._force_full = False
+        self._uncaptured_rounds = 0
+        self.last_capture_ms = (time.perf_counter() - start) * 1000
+        self._queue.put(capture)
+
+    def _capture(self, state, full: bool) -> Dict[str, Any]:
+        """对局线程只做数组拷贝与容器浅拷贝，编码全部留给写入线程"""
+        sim_players, stat_players = state["sim_players"], state["stat_players"]
+        arrays: Dict[str, np.ndarray] = {}
+        meta: Dict[str, Any] = {key: state.get(key) for key in META_KEYS}
+        meta.update({
+            "kind": "full" if full else "delta",
+            "created_at": time.time(),
+            "strategy_params": state.get("strategy_params"),
+            "final_outcome": state.get("final_outcome"),
+            "pool": _pool_meta(state["platform_pool"]),
+            "track_rtp_history": state.get("rtp_history") is not None,
+            "tracker": None,
+        })
+        bet_rng = state.get("bet_rng")
+        if isinstance(bet_rng, np.random.Generator):
+            meta["bet_rng"] = bet_rng.bit_generator.state
+        # 进程级随机状态（策略中的随机选择与 numpy 全局抽样），单引擎进程恢复后可原样续跑
+        meta["global_rng"] = {"random": random.getstate(), "numpy": np.random.get_state(legacy=False)}
+        capture = {"meta": meta, "arrays": arrays, "strings": {}, "objects": {}}
+
+        # 模拟玩家与玩家统计：列式结构写数组，其余整体 pickle
+        if isinstance(sim_players, PlayerPopulation):
+            for name in POPULATION_COLUMNS:
+                arrays[f"players/{name}"] = getattr(sim_players, name).copy()
+            meta["players_prefix"] = sim_players.prefix
+            if full and sim_players.uids is not None:
+                capture["strings"]["players/uids"] = list(sim_players.uids)
+        else:
+            capture["objects"]["sim_players"] = pickle.dumps(sim_players, protocol=pickle.HIGHEST_PROTOCOL)
+        if isinstance(stat_players, PlayerStatsStore):
+            size = len(stat_players)
+            arrays["stats/total_bet"] = stat_players.total_bet[:size].copy()
+            arrays["stats/total_return"] = stat_players.total_return[:size].copy()
+            start = 0 if full else self._stats_size
+            capture["strings"]["stats/player_ids"] = stat_players.player_ids[start:size]
+            meta["stats_offset"] = start
+            self._stats_size = size
+        else:
+            capture["objects"]["stat_players"] = pickle.dumps(stat_players, protocol=pickle.HIGHEST_PROTOCOL)
+        arrays.update(_pool_arrays(state["platform_pool"]))
+
+        # 参与状态：列式人群的 tracker 按行维护 wake_at / order，直接拷贝
+        tracker = state.get("activity_tracker")
+        if tracker is not None and tracker.wake_at is not None and isinstance(sim_players, PlayerPopulation):
+            arrays["tracker/wake_at"] = tracker.wake_at.copy()
+            arrays["tracker/order"] = tracker.order.copy()
+            meta["tracker"] = {"steps": tracker.steps, "known_players": tracker.known_players, "sequence": tracker.sequence}
+        capture["log"] = self._capture_logs(full)
+        return capture
+
+    def _capture_logs(self, full: bool) -> Optional[Dict[str, Any]]:
+        """内存日志的追加部分；日志被清空过（长度缩短）或日志分段与当前内存不一致时整体重写"""
+        backend = db_logger.log_backend
+        if not isinstance(backend, MemoryLogBackend) or backend.max_rounds is not None:
+            return None  # 持久化后端自行落盘；限定窗口的内存日志会从头部截断，不按追加分段写出
+        lengths = (len(backend.player_log), len(backend.round_log))
+        previous = self._log_lengths
+        if previous is None and full and self.manifest.get("log_lengths") == list(lengths):
+            previous = lengths  # 由本目录恢复而来，续写日志分段
+        restart = previous is None or lengths[0] < previous[0] or lengths[1] < previous[1]
+        start = (0, 0) if restart else previous
+        self._log_lengths = lengths
+        if not restart and lengths == previous:
+            return {"restart": False, "players": [], "rounds": [], "lengths": lengths}
+        return {
+            "restart": restart,
+            "players": backend.player_log[start[0]:lengths[0]],
+            "rounds": backend.round_log[start[1]:lengths[1]],
+            "lengths": lengths,
+        }
+
+    def flush(self, state=None, timeout: Optional[float] = None):
+        """等待已抓取的快照全部写完；传入 state 时先补抓尚未写入快照的已结算局（停止前调用）"""
+        if state is not None and self._uncaptured_rounds:
+            self.snapshot(state)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def close(self, state=None, timeout: Optional[float] = None):
+        self.flush(state, timeout)
+
+    # --- 写入线程 ---
+    def _write_loop(self):
+        while True:
+            capture = self._queue.get()
+            try:
+                # 镜像总是更新（即使本次增量因快照链断开而不写出），下一个全量据此编码
+                self._apply_journal(capture)
+                if capture["meta"]["kind"] == "delta" and self._broken:
+                    continue  # 快照链已断，等待下一个全量
+                start = time.perf_counter()
+                self._write(capture)
+                self.last_write_ms = (time.perf_counter() - start) * 1000
+                self.written += 1
+                self._broken = False
+            except Exception as exc:  # 写入失败：丢弃后续增量，下一次抓取改为全量并重写日志
+                self.error = exc
+                self._broken = True
+                self._force_full = True
+                self._log_lengths = None
+            finally:
+                self._queue.task_done()
+
+    def _apply_journal(self, capture: Dict[str, Any]):
+        """按 db_logger.log_player_detail 的规则把流水应用到镜像"""
+        seed = capture.get("seed")
+        if seed is not None:
+            self._recent = {pid: deque(records, maxlen=MEMORY_WINDOW + 1) for pid, records in seed["recent"].items()}
+            self._latest, self._memory, self._rtp = seed["latest"], seed["memory"], seed["rtp"]
+            for pid, rows in seed["pending"].items():
+                recent, latest = _expand_player(pid, rows)
+                if recent:
+                    self._recent[pid] = recent
+                if latest is not None:
+                    self._latest[pid] = latest
+            for pid, rows in seed["pending_memory"].items():
+                self._memory[pid] = _expand_memory(pid, rows)
+        recent, latest = self._recent, self._latest
+        for pids, records, memory, rtps in capture["journal"]:
+            latest.update(zip(pids, records))
+            for pid, record in zip(pids, records):
+                if record["total_bet"] > 0:
+                    records_of = recent.get(pid)
+                    if records_of is None:
+                        records_of = recent[pid] = deque(maxlen=MEMORY_WINDOW + 1)
+                    records_of.append(record)
+            self._memory.update(zip(pids, memory))
+            if rtps is not None and self._rtp is not None:
+                for pid, value in zip(pids, rtps):
+                    self._rtp.setdefault(pid, []).append(value)
+
+    def _write(self, capture: Dict[str, Any]):
+        meta = capture["meta"]
+        full = meta["kind"] == "full"
+        arrays: Dict[str, np.ndarray] = {}
+        new_base = {}
+        for name, values in capture["arrays"].items():
+            if full:
+                arrays[name] = values
+            else:
+                _diff_column(self._base_arrays.get(name), values, name, arrays)
+            new_base[name] = values
+        for name, values in capture["strings"].items():
+            arrays[name] = _encode_strings(values)
+        for name, data in capture["objects"].items():
+            arrays[f"pickle/{name}"] = np.frombuffer(data, dtype=np.uint8)
+
+        if full:
+            # 全量：由镜像写出全部玩家的近期投注、（与近期投注末条不同的）最新记录、记忆态势与 RTP 历史
+            recent = list(self._recent.items())
+            arrays["recent/pids"] = _encode_strings([pid for pid, _ in recent])
+            arrays["recent/counts"] = np.fromiter((len(records) for _, records in recent), dtype=np.int64, count=len(recent))
+            arrays["recent/records"] = _encode_records([r for _, records in recent for r in records])
+            latest = [
+                (pid, record) for pid, record in self._latest.items()
+                if not (pid in self._recent and self._recent[pid][-1] is record)
+            ]
+            arrays["latest/pids"] = _encode_strings([pid for pid, _ in latest])
+            arrays["latest/records"] = _encode_records([record for _, record in latest])
+            memory = list(self._memory.items())
+            rtp = list(self._rtp.items()) if self._rtp is not None else []
+        else:
+            # 增量：上一快照以来的结算流水（恢复时按 log_player_detail 的规则重放）
+            journal = capture["journal"]
+            arrays["journal/pids"] = _encode_strings([pid for pids, _, _, _ in journal for pid in pids])
+            arrays["journal/records"] = _encode_records([r for _, records, _, _ in journal for r in records])
+            memory = [(pid, m) for pids, _, entries, _ in journal for pid, m in zip(pids, entries)]
+            rtp = [(pid, (value,)) for pids, _, _, rtps in journal if rtps is not None for pid, value in zip(pids, rtps)]
+
+        arrays["memory/pids"] = _encode_strings([pid for pid, _ in memory])
+        # 记忆态势 (n, 4)：attitude、shifted_attitude、avg_bet、last_round（无投注历史为 NaN）
+        arrays["memory/values"] = np.array(
+            [_MEMORY_VALUES(m) for _, m in memory], dtype=np.float64
+        ).reshape(len(memory), len(MEMORY_FIELDS) + 1)
+        arrays["rtp/pids"] = _encode_strings([pid for pid, _ in rtp])
+        arrays["rtp/counts"] = np.fromiter((len(values) for _, values in rtp), dtype=np.int64, count=len(rtp))
+        arrays["rtp/values"] = np.fromiter((v for _, values in rtp for v in values), dtype=np.float64)
+
+        arrays["meta"] = _encode_json(meta)
+        name = f"{meta['kind']}_{meta['round_id']:08d}_{int(meta['created_at'] * 1000)}.npz"
+        self.last_bytes = _save_npz(os.path.join(self.directory, name), arrays, self.compress)
+
+        manifest = dict(self.manifest)
+        entry = {"file": name, "kind": meta["kind"], "round_id": meta["round_id"], "bytes": self.last_bytes, "created_at": meta["created_at"]}
+        manifest["chain"] = ([] if full else list(manifest["chain"])) + [entry]
+        manifest["chains"] = self._pruned_chains(manifest, full)
+        log = capture["log"]
+        if log is not None:
+            manifest["log_segments"] = self._write_log_segments(log, full)
+            manifest["log_lengths"] = list(log["lengths"])
+        else:
+            manifest["log_segments"], manifest["log_lengths"] = [], None
+        _write_manifest(self.directory, manifest)
+        # 不再被引用的日志分段（已合并或日志已重写）在新 manifest 落盘后删除
+        for segment in set(self.manifest.get("log_segments", [])) - set(manifest["log_segments"]):
+            _remove(os.path.join(self.directory, segment))
+        self.manifest = manifest
+        self._base_arrays = new_base
+
+    def _write_log_segments(self, log: Dict[str, Any], full: bool) -> List[str]:
+        """写出本次追加的日志；全量快照时与已有分段合并为一个分段，分段数不随对局时长增长"""
+        segments = [] if log["restart"] else list(self.manifest["log_segments"])
+        parts = [_log_arrays(log)] if (log["players"] or log["rounds"] or log["restart"]) else []
+        if full and len(segments) + len(parts) > 1:
+            loaded = []
+            for segment in segments:
+                with np.load(os.path.join(self.directory, segment), allow_pickle=False) as data:
+                    loaded.append({key: data[key] for key in data.files})
+            parts = [_concat_log_arrays(loaded + parts)]
+            segments = []
+        if parts:
+            name = f"log_{log['lengths'][0]:010d}_{log['lengths'][1]:08d}_{int(time.time() * 1000)}.npz"
+            _save_npz(os.path.join(self.directory, name), parts[0], self.compress)
+            segments.append(name)
+        return segments
+
+    def _pruned_chains(self, manifest: Dict[str, Any], full: bool) -> List[List[str]]:
+        """全量快照开启新链；超出 keep_chains 的旧链文件删除"""
+        chains = [list(c) for c in manifest.get("chains", [])]
+        if full or not chains:
+            chains.append([])
+        chains[-1].append(manifest["chain"][-1]["file"])
+        for chain in chains[:-self.keep_chains]:
+            for file in chain:
+                _remove(os.path.join(self.directory, file))
+        return chains[-self.keep_chains:]
+
+
+def _log_arrays(log: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    arrays: Dict[str, np.ndarray] = {}
+    players, rounds = log["players"], log["rounds"]
+    arrays["player/pids"] = _encode_strings([r["player_id"] for r in players])
+    arrays["player/records"] = _encode_records(players)
+
+    arrays["round/round_id"] = np.fromiter((r["round_id"] for r in rounds), dtype=np.int64, count=len(rounds))
+    arrays["round/area_totals"] = _encode_bets([r["area_total_bets"] for r in rounds])
+    arrays["round/winning"] = np.array(
+        [[area in r["winning_areas"] for area in AREAS] for r in rounds], dtype=bool
+    ).reshape(len(rounds), len(AREAS))
+    for field in ("total_bet", "total_payout", "platform_profit"):
+        arrays[f"round/{field}"] = np.fromiter((r[field] for r in rounds), dtype=np.float64, count=len(rounds))
+    # 整局下注（内存后端 keep_player_bets=True 时才有），未保留的对局记为 -1
+    arrays["round/bet_counts"] = np.fromiter((len(r["player_bets"]) if "player_bets" in r else -1 for r in rounds), dtype=np.int64, count=len(rounds))
+    arrays["round/bet_pids"] = _encode_strings([pid for r in rounds for pid in r.get("player_bets", ())])
+    arrays["round/bet_matrix"] = _encode_bets([b for r in rounds for b in r.get("player_bets", {}).values()])
+    return arrays
+
+
+def _concat_log_arrays(parts: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """按写入顺序拼接日志分段（字符串列以换行衔接）"""
+    merged = {}
+    for key in parts[0]:
+        if key.endswith("pids"):
+            pieces = []
+            for part in parts:
+                if part[key].size:
+                    pieces.extend([_NEWLINE, part[key]] if pieces else [part[key]])
+            merged[key] = np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.uint8)
+        else:
+            merged[key] = np.concatenate([part[key] for part in parts])
+    return merged
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _save_npz(path: str, arrays: Dict[str, np.ndarray], compress: bool) -> int:
+    """原子写入（先写临时文件再替换）"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        (np.savez_compressed if compress else np.savez)(f, **arrays)
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def _write_manifest(directory: str, manifest: Dict[str, Any]):
+    path = os.path.join(directory, MANIFEST_NAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def read_manifest(directory: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"快照格式不兼容：{manifest.get('format')}")
+    return manifest
+
+
+def has_snapshot(directory: Optional[str]) -> bool:
+    if not directory:
+        return False
+    manifest = read_manifest(directory)
+    return bool(manifest and manifest["chain"])
+
+
+# --- 恢复 ---
+def restore_snapshot(directory: str, state, *, restore_global_rng: bool = True) -> Dict[str, Any]:
+    """
+    将快照目录中最近的状态恢复到 state（普通 dict 或 session_state，原地写入），并恢复全局日志索引与记忆缓存。
+    state 中已有的水池对象原地更新（保留 LockedPlatformPool 等类型）。返回恢复信息。
+    restore_global_rng：同时恢复 random / numpy 全局随机状态（多桌共用进程时应关闭）
+    """
+    start = time.perf_counter()
+    manifest = read_manifest(directory)
+    if not manifest or not manifest["chain"]:
+        raise FileNotFoundError(f"快照目录中没有可用快照：{directory}")
+
+    columns: Dict[str, np.ndarray] = {}
+    stats_ids: List[str] = []
+    # 玩家级数据不逐行解码：每个快照只建 玩家 → 行号 的索引（C 层 dict(zip)），玩家首次被访问时才解码
+    # （见 db_logger.pending_player_index / metrics_engine.pending_memory_attitude）
+    player_rows: List[Dict[str, Any]] = []  # 最近全量及其后各增量的记录行索引，按快照顺序
+    pending: Dict[str, Any] = {}
+    memory_rows: List[Tuple[np.ndarray, Dict[str, int]]] = []
+    pending_memory: Dict[str, Any] = {}
+    rtp_parts: List[Tuple[List[str], np.ndarray, np.ndarray]] = []
+    objects: Dict[str, bytes] = {}
+    uids = None
+    for entry in manifest["chain"]:
+        with np.load(os.path.join(directory, entry["file"]), allow_pickle=False) as data:
+            meta = _decode_json(data["meta"])
+            names = {key.split("@")[0] for key in data.files if key.startswith(("players/", "stats/total", "pool/", "tracker/"))}
+            for name in names:
+                if name == "players/uids":
+                    uids = _decode_strings(data[name])
+                else:
+                    columns[name] = _apply_column(columns.get(name), name, data)
+            if "stats/player_ids" in data.files:
+                del stats_ids[meta["stats_offset"]:]
+                stats_ids.extend(_decode_strings(data["stats/player_ids"]))
+            for key in data.files:
+                if key.startswith("pickle/"):
+                    objects[key[len("pickle/"):]] = data[key].tobytes()
+
+            if "recent/pids" in data.files:
+                # 全量：每位玩家的近期投注为一段连续行，另存的最新记录（零投注局等）只更新最新记录
+                recent_pids, latest_pids = _decode_strings(data["recent/pids"]), _decode_strings(data["latest/pids"])
+                counts = data["recent/counts"]
+                ends = np.cumsum(counts)
+                player_rows = [{
+                    "recent": (data["recent/records"], _row_index(recent_pids), (ends - counts).tolist(), ends.tolist()),
+                    "latest": (data["latest/records"], _row_index(latest_pids)),
+                }]
+                pending = dict.fromkeys(recent_pids, player_rows)
+                pending.update(dict.fromkeys(latest_pids, player_rows))
+            else:
+                # 增量：结算流水逐行追加到对应玩家，展开时按 log_player_detail 的规则重放
+                journal_pids = _decode_strings(data["journal/pids"])
+                player_rows.append({"journal": (data["journal/records"], _row_index(journal_pids, unique=False))})
+                pending.update(dict.fromkeys(journal_pids, player_rows))
+
+            memory_pids = _decode_strings(data["memory/pids"])
+            memory_rows.append((data["memory/values"], _row_index(memory_pids)))
+            pending_memory.update(dict.fromkeys(memory_pids, memory_rows))
+
+            rtp_parts.append((_decode_strings(data["rtp/pids"]), data["rtp/counts"], data["rtp/values"]))
+
+    # RTP 历史由对局线程直接追加，恢复时一次合并（不做延迟展开）
+    rtp_history = _merge_rtp_history(rtp_parts)
+
+    # 模拟玩家 / 玩家统计
+    if "sim_players" in objects:
+        sim_players = pickle.loads(objects["sim_players"])
+    else:
+        sim_players = PlayerPopulation(
+            {name: columns[f"players/{name}"] for name in POPULATION_COLUMNS}, meta["players_prefix"], uids
+        )
+    if "stat_players" in objects:
+        stat_players = pickle.loads(objects["stat_players"])
+    else:
+        stat_players = PlayerStatsStore(stats_ids)
+        stat_players.total_bet[:len(stats_ids)] = columns["stats/total_bet"]
+        stat_players.total_return[:len(stats_ids)] = columns["stats/total_return"]
+
+    # 水池：原地更新
+    pool = state.get("platform_pool")
+    if pool is None:
+        pool = PlatformPool()
+    pool_meta = meta["pool"]
+    pool.pool_value = pool_meta["pool_value"]
+    pool.tax_rate = pool_meta["tax_rate"]
+    pool._pending_in, pool._pending_out, pool._pending_tax = pool_meta["pending"]
+    for ring_name, attr in (("deltas", "deltas"), ("rounds", "round_history")):
+        prefix = f"pool/{ring_name}/"
+        ring_columns = {name[len(prefix):]: values for name, values in columns.items() if name.startswith(prefix)}
+        ring = RingArray(len(next(iter(ring_columns.values()))), {})
+        ring.columns = ring_columns
+        ring.next_index, ring.size = pool_meta["rings"][ring_name]
+        setattr(pool, attr, ring)
+
+    # 参与状态
+    tracker = None
+    if meta["tracker"] is not None and isinstance(sim_players, PlayerPopulation):
+        tracker = ActivityTracker.from_rows(sim_players, columns["tracker/wake_at"], columns["tracker/order"], **meta["tracker"])
+
+    # 模块级日志索引与记忆缓存
+    db_logger.player_recent_log.clear()
+    db_logger.player_latest_log.clear()
+    db_logger.set_pending_player_index(pending, _expand_player)
+    metrics_engine.memory_attitude_cache.clear()
+    metrics_engine.set_pending_memory_attitude(pending_memory, _expand_memory)
+    log_records = _restore_logs(directory, manifest)
+
+    for key in META_KEYS:
+        if meta.get(key) is not None:
+            state[key] = meta[key]
+    state["strategy_params"] = meta.get("strategy_params") or {}
+    state.update(TRANSIENT_DEFAULTS)
+    state["sim_players"] = sim_players
+    state["stat_players"] = stat_players
+    state["platform_pool"] = pool
+    state["activity_tracker"] = tracker
+    state["rtp_history"] = rtp_history if meta["track_rtp_history"] else None
+    state["final_outcome"] = meta.get("final_outcome")
+    state["has_started"] = True
+    state["time_to_next_round"] = 0
+    if "bet_rng" in meta:
+        bet_rng = state.get("bet_rng")
+        if not isinstance(bet_rng, np.random.Generator):
+            bet_rng = state["bet_rng"] = np.random.default_rng()
+        bet_rng.bit_generator.state = meta["bet_rng"]
+    if restore_global_rng and "global_rng" in meta:
+        version, internal, gauss = meta["global_rng"]["random"]
+        random.setstate((version, tuple(internal), gauss))
+        numpy_state = meta["global_rng"]["numpy"]
+        numpy_state["state"]["key"] = np.array(numpy_state["state"]["key"], dtype=np.uint32)
+        np.random.set_state(numpy_state)
+
+    return {
+        "round_id": meta["round_id"],
+        "files": [entry["file"] for entry in manifest["chain"]],
+        "players": len(sim_players),
+        "log_records": log_records,
+        "elapsed_ms": (time.perf_counter() - start) * 1000,
+    }
+
+
+def _merge_rtp_history(parts: List[Tuple[List[str], np.ndarray, np.ndarray]]) -> Dict[str, List[float]]:
+    """
+    按快照顺序合并各快照的 RTP 段 (玩家, 段长, 值)：首个全量按段切片，
+    其后增量的各行按玩家稳定排序分组后每位玩家追加一次，不逐行操作字典
+    """
+    if not parts:
+        return {}
+    pids, counts, values = parts[0]
+    values, ends = values.tolist(), np.cumsum(counts).tolist()
+    history = {pid: values[end - count:end] for pid, end, count in zip(pids, ends, counts.tolist())}
+    if len(parts) == 1:
+        return history
+
+    row_pids = list(chain.from_iterable(pids for pids, _, _ in parts[1:]))
+    players = list(dict.fromkeys(row_pids))
+    codes = dict(zip(players, range(len(players))))
+    value_codes = np.repeat(
+        np.fromiter(map(codes.__getitem__, row_pids), dtype=np.int64, count=len(row_pids)),
+        np.concatenate([counts for _, counts, _ in parts[1:]])
+    )
+    grouped = np.concatenate([values for _, _, values in parts[1:]])[np.argsort(value_codes, kind="stable")].tolist()
+    start = 0
+    for pid, end in zip(players, np.cumsum(np.bincount(value_codes, minlength=len(players))).tolist()):
+        previous = history.get(pid)
+        if previous is None:
+            history[pid] = grouped[start:end]
+        else:
+            previous.extend(grouped[start:end])
+        start = end
+    return history
+
+
+def _row_index(player_ids: List[str], unique: bool = True) -> Dict[str, Any]:
+    """玩家 → 行号。unique=False 时同一玩家可出现多行（一次快照累积了多局流水），重复的玩家记为行号列表"""
+    rows = dict(zip(player_ids, range(len(player_ids))))
+    if unique or len(rows) == len(player_ids):
+        return rows
+    rows = {}
+    for row, pid in enumerate(player_ids):
+        rows.setdefault(pid, []).append(row)
+    return rows
+
+
+def _expand_player(player_id: str, player_rows: List[Dict[str, Any]]) -> Tuple[deque, Optional[Dict]]:
+    """解码玩家在各快照中的记录行并按 log_player_detail 的规则重放：每条成为最新记录，有投注的进入近期投注"""
+    segments = []
+    for rows in player_rows:
+        if "journal" in rows:
+            matrix, index = rows["journal"]
+            row = index.get(player_id)
+            if row is not None:
+                segments.extend((matrix, r, r + 1, False) for r in (row if isinstance(row, list) else (row,)))
+            continue
+        matrix, index, starts, ends = rows["recent"]
+        row = index.get(player_id)
+        if row is not None:
+            segments.append((matrix, starts[row], ends[row], False))
+        matrix, index = rows["latest"]
+        row = index.get(player_id)
+        if row is not None:
+            segments.append((matrix, row, row + 1, True))
+
+    recent, latest = deque(maxlen=MEMORY_WINDOW + 1), None
+    for matrix, lo, hi, latest_only in segments:
+        for record in _decode_records(matrix[lo:hi], [player_id] * (hi - lo)):
+            latest = record
+            if not latest_only and record["total_bet"] > 0:
+                recent.append(record)
+    return recent, latest
+
+
+def _expand_memory(player_id: str, memory_rows: List[Tuple[np.ndarray, Dict[str, int]]]) -> Dict:
+    """取玩家在最近一个快照中的记忆态势行"""
+    for values, index in reversed(memory_rows):
+        row = index.get(player_id)
+        if row is not None:
+            attitude, shifted_attitude, avg_bet, last_round = values[row].tolist()
+            return {
+                "attitude": attitude,
+                "shifted_attitude": shifted_attitude,
+                "avg_bet": avg_bet,
+                "last_round": None if math.isnan(last_round) else int(last_round),
+            }
+    raise KeyError(player_id)
+
+
+def _restore_logs(directory: str, manifest: Dict[str, Any]) -> int:
+    """由日志分段重建内存日志（当前后端为内存后端时）；返回恢复的玩家日志条数"""
+    backend = db_logger.log_backend
+    if not isinstance(backend, MemoryLogBackend) or manifest.get("log_lengths") is None:
+        return 0
+    backend.reset()
+    for segment in manifest["log_segments"]:
+        with np.load(os.path.join(directory, segment), allow_pickle=False) as data:
+            backend.player_log.extend(_decode_records(data["player/records"], _decode_strings(data["player/pids"])))
+
+            bet_ids = iter(_decode_strings(data["round/bet_pids"]))
+            bets = iter(_decode_bets(data["round/bet_matrix"]))
+            area_totals = _decode_bets(data["round/area_totals"])
+            winning = data["round/winning"].tolist()
+            columns = [data[f"round/{field}"].tolist() for field in ("total_bet", "total_payout", "platform_profit")]
+            for round_id, count, totals, mask, total_bet, total_payout, profit in zip(
+                data["round/round_id"].tolist(), data["round/bet_counts"].tolist(), area_totals, winning, *columns
+            ):
+                record = {
+                    "round_id": round_id,
+                    "area_total_bets": totals,
+                    "winning_areas": [area for area, hit in zip(AREAS, mask) if hit],
+                    "total_bet": total_bet,
+                    "total_payout": total_payout,
+                    "platform_profit": profit,
+                }
+                if count >= 0:
+                    record["player_bets"] = {next(bet_ids): next(bets) for _ in range(count)}
+                backend.round_log.append(record)
+    return len(backend.player_log)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="对局状态快照查看与恢复计时")
+    parser.add_argument("directory", help="快照目录")
+    args = parser.parse_args(argv)
+
+    from headless_runner import create_headless_state
+    manifest = read_manifest(args.directory)
+    if not manifest or not manifest["chain"]:
+        raise SystemExit(f"快照目录中没有可用快照：{args.directory}")
+    for entry in manifest["chain"]:
+        print(f"{entry['kind']:<5} 第 {entry['round_id']} 局  {entry['bytes'] / 1024:,.1f} KB  {entry['file']}")
+    print(f"日志分段：{len(manifest['log_segments'])} 个")
+
+    info = restore_snapshot(args.directory, create_headless_state(0))
+    print(f"恢复到第 {info['round_id']} 局结算后：玩家 {info['players']:,} 人，日志 {info['log_records']:,} 条，耗时 {info['elapsed_ms']:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,8 +9,8 @@
 🗃️ evaluator.py 模块已废弃，功能已完整拆分入 metrics_engine / scoring_engine / strategy
 """
 
-from typing import List, Dict, Tuple
-from config import PAYOUT_RATES
+from typing import List, Dict, Optional, Tuple
+from structure_matrix import build_structure_payout_table, compute_area_totals, structure_index
 
 # --- [主函数] 根据结构指标结果选择最终开奖结果 ---
 def select_structure(
@@ -18,8 +18,13 @@ def select_structure(
     current_bets: Dict[str, Dict[int, float]],
     *,
     std_bounds: Tuple[float, float],
-    base_std: float
+    base_std: float,
+    payout_table: Optional[Dict] = None
 ) -> Dict:
+    """
+    payout_table：本局结构派奖表（structure_matrix.build_structure_payout_table），
+    缺省时由 current_bets 现算。
+    """
     rtp_std_low, rtp_std_high = std_bounds
 
     # --- 情况一：有结构落入置信区间内 ---
@@ -32,17 +37,13 @@ def select_structure(
         return ranked[0]
     
     # --- 情况二：没有结构落入置信区间 ---
+    if payout_table is None:
+        payout_table = build_structure_payout_table(compute_area_totals(current_bets))
+
     acceptable = []
 
     for r in results:
-        payout = sum(
-            amount * PAYOUT_RATES[area]
-            for pid, bets in current_bets.items()
-            for area, amount in bets.items()
-            if area in r["winning_areas"]
-        )
-        total_bet = sum(sum(bets.values()) for bets in current_bets.values())
-        rtp = payout / total_bet if total_bet > 0 else 0
+        rtp = payout_table["rtp"][structure_index(r["winning_areas"])]
 
         if rtp <= 2:  # ✅ 仍保留平台最多亏一倍的限制
             acceptable.append(r)
@@ -0,0 +1,116 @@
+# structure_matrix.py
+
+"""
+结构矩阵模块：
+- 将玩家下注打包为（玩家 × 8 区域）矩阵
+- 将开奖结构打包为（区域 × 结构）命中矩阵，并按 PAYOUT_RATES 缩放
+- 一次矩阵乘法即可得到每个玩家在每个结构下的派奖额，避免逐结构 deepcopy 与 Python 循环
+- 结构以位掩码表示（第 i 位 = 区域 i+1 命中），命中判断为一次位运算
+- 每局由区域总额向量计算一次“结构派奖表”，供策略选择、结算、UI 共用
+"""
+
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+from config import PAYOUT_RATES, WINNING_STRUCTURES
+
+# 区域编号（1~8），矩阵列下标 = 区域编号 - 1
+AREAS: List[int] = sorted(PAYOUT_RATES.keys())
+AREA_INDEX: Dict[int, int] = {area: i for i, area in enumerate(AREAS)}
+NUM_AREAS = len(AREAS)
+NUM_STRUCTURES = len(WINNING_STRUCTURES)
+
+# 区域 × 结构 命中掩码（0/1）
+STRUCTURE_HIT_MASK = np.zeros((NUM_AREAS, NUM_STRUCTURES), dtype=np.float64)
+for _s, _structure in enumerate(WINNING_STRUCTURES):
+    for _area in _structure["areas"]:
+        STRUCTURE_HIT_MASK[AREA_INDEX[_area], _s] = 1.0
+
+# 区域 × 结构 派奖矩阵：命中掩码按赔率缩放
+PAYOUT_VECTOR = np.array([PAYOUT_RATES[a] for a in AREAS], dtype=np.float64)
+STRUCTURE_PAYOUT_MATRIX = STRUCTURE_HIT_MASK * PAYOUT_VECTOR[:, None]
+
+
+def areas_to_mask(areas: Iterable[int]) -> int:
+    """区域列表 → 位掩码"""
+    mask = 0
+    for area in areas:
+        mask |= 1 << AREA_INDEX[area]
+    return mask
+
+
+# 结构位掩码，以及 掩码 → 结构下标 的反查表
+STRUCTURE_MASKS: List[int] = [areas_to_mask(s["areas"]) for s in WINNING_STRUCTURES]
+MASK_TO_STRUCTURE: Dict[int, int] = {mask: i for i, mask in enumerate(STRUCTURE_MASKS)}
+
+
+def structure_index(winning_areas: Iterable[int]) -> int:
+    """由开奖区域查找结构下标"""
+    return MASK_TO_STRUCTURE[areas_to_mask(winning_areas)]
+
+
+def is_area_hit(mask: int, area: int) -> bool:
+    """位掩码命中判断"""
+    return bool((mask >> AREA_INDEX[area]) & 1)
+
+
+def calculate_payout(area_bets: Dict[int, float], mask: int) -> float:
+    """单个玩家在给定结构掩码下的派奖额"""
+    return sum(
+        amount * PAYOUT_RATES[area]
+        for area, amount in area_bets.items()
+        if (mask >> AREA_INDEX[area]) & 1
+    )
+
+
+def compute_area_totals(current_bets: Dict[str, Dict[int, float]]) -> np.ndarray:
+    """汇总 8 个区域的下注总额"""
+    area_totals = np.zeros(NUM_AREAS, dtype=np.float64)
+    for bets in current_bets.values():
+        for area, amount in bets.items():
+            area_totals[AREA_INDEX[area]] += amount
+    return area_totals
+
+
+def build_structure_payout_table(area_totals: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    结构派奖表：区域总额向量 · (区域 × 结构) 派奖矩阵。
+    返回：
+    - area_totals：各区域下注总额 (8,)
+    - total_bet：全场下注总额
+    - related_bet：各结构命中区域的下注总额 (结构数,)
+    - payout：各结构的派奖总额 (结构数,)
+    - profit：各结构下平台盈亏 = total_bet - payout
+    - rtp：各结构下全场 RTP（total_bet 为 0 时为 0）
+    """
+    area_totals = np.asarray(area_totals, dtype=np.float64)
+    total_bet = float(area_totals.sum())
+    payout = area_totals @ STRUCTURE_PAYOUT_MATRIX
+    return {
+        "area_totals": area_totals,
+        "total_bet": total_bet,
+        "related_bet": area_totals @ STRUCTURE_HIT_MASK,
+        "payout": payout,
+        "profit": total_bet - payout,
+        "rtp": payout / total_bet if total_bet > 0 else np.zeros(NUM_STRUCTURES),
+    }
+
+
+def pack_bets(current_bets: Dict[str, Dict[int, float]]) -> Tuple[List[str], np.ndarray]:
+    """
+    将 {player_id: {area: amount}} 打包为下注矩阵。
+    返回：(玩家ID列表（保持 current_bets 顺序）, shape=(玩家数, 8) 的下注矩阵)
+    """
+    player_ids = list(current_bets.keys())
+    bet_matrix = np.zeros((len(player_ids), NUM_AREAS), dtype=np.float64)
+    for row, pid in enumerate(player_ids):
+        for area, amount in current_bets[pid].items():
+            bet_matrix[row, AREA_INDEX[area]] = amount
+    return player_ids, bet_matrix
+
+
+def structure_payouts(bet_matrix: np.ndarray) -> np.ndarray:
+    """
+    计算每个玩家在每个结构下的派奖额。
+    输入 (玩家数, 8) 下注矩阵，输出 (玩家数, 结构数) 派奖矩阵。
+    """
+    return bet_matrix @ STRUCTURE_PAYOUT_MATRIX
@@ -0,0 +1,258 @@
+# table_manager.py
+
+"""
+多桌对局服务：
+- 单进程内托管任意多张桌子，每桌一个独立的对局状态（自有玩家、统计、下注簿、下注生成器），
+  全部桌子共享同一个线程安全水池（LockedPlatformPool）
+- 实时模式：单个 asyncio 事件循环按倍速节奏驱动所有桌子（每桌一个协程，错峰启动），
+  每桌即一个 RoundEngineWorker（由事件循环调用 advance()），发布快照供 Streamlit 以观战者身份接入
+- 批量模式：不计倒计时，轮转（或多线程）连续跑完整局，统计总吞吐
+- 统计全服局/秒与每桌 tick 延迟分位数
+
+各桌玩家 ID 带桌号前缀（t{桌号}_player_{i}），全局日志索引与记忆态势缓存按玩家 ID 区分，可直接共用。
+多桌运行时日志后端需为内存后端（SQLite 连接不可跨线程共享）。
+
+命令行用法：
+    python table_manager.py --tables 100 --players 200 --rounds 50
+    python table_manager.py --tables 300 --realtime 30 --speed 1
+"""
+
+import argparse
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import numpy as np
+from platform_pool import LockedPlatformPool
+from round_engine import RoundEngineWorker
+from headless_runner import create_headless_state, play_round
+
+
+class GameTable:
+    """单张桌子：对局引擎 + 延迟与局数统计"""
+
+    def __init__(self, table_id: int, state: Dict, latency_window: int = 1024):
+        self.table_id = table_id
+        self.engine = RoundEngineWorker(state)
+        self.engine.state["auto_simulate"] = True
+        self.tick_latencies_ms = deque(maxlen=latency_window)
+        self.rounds_played = 0
+        self.error: Optional[BaseException] = None
+
+    @property
+    def state(self) -> Dict:
+        return self.engine.state
+
+    def latest_snapshot(self):
+        return self.engine.latest_snapshot()
+
+    def advance(self):
+        """实时模式的一拍"""
+        round_id = self.state["round_id"]
+        start = time.perf_counter()
+        self.engine.advance()
+        self.tick_latencies_ms.append((time.perf_counter() - start) * 1000)
+        if self.state["round_id"] != round_id:
+            self.rounds_played += 1
+
+    def play_round(self):
+        """批量模式：无倒计时完成一整局"""
+        start = time.perf_counter()
+        play_round(self.state)
+        self.state["round_id"] += 1
+        self.tick_latencies_ms.append((time.perf_counter() - start) * 1000)
+        self.rounds_played += 1
+
+
+class TableManager:
+    def __init__(
+        self,
+        *,
+        platform_pool: Optional[LockedPlatformPool] = None,
+        players_per_table: int = 200,
+        seed: Optional[int] = None,
+        state_options: Optional[Dict] = None
+    ):
+        self.platform_pool = platform_pool if platform_pool is not None else LockedPlatformPool()
+        self.players_per_table = players_per_table
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.state_options = dict(state_options or {})
+        self.tables: Dict[int, GameTable] = {}
+        self.speed = 1.0
+        self.started_at: Optional[float] = None
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop: Optional[asyncio.Event] = None
+
+    # --- 桌子管理 ---
+    def add_table(self, num_players: Optional[int] = None) -> GameTable:
+        table_id = len(self.tables) + 1
+        bet_seed = int(self.seed_sequence.spawn(1)[0].generate_state(1)[0])
+        state = create_headless_state(
+            num_players or self.players_per_table,
+            platform_pool=self.platform_pool,
+            bet_seed=bet_seed,
+            player_prefix=f"t{table_id}_player_",
+            **{"keep_full_log": False, **self.state_options}  # ✅ 各桌默认不保留完整日志（只作用于本桌状态，不影响其它会话）
+        )
+        table = GameTable(table_id, state)
+        self.tables[table_id] = table
+        return table
+
+    def add_tables(self, count: int) -> List[GameTable]:
+        return [self.add_table() for _ in range(count)]
+
+    def table(self, table_id: int) -> GameTable:
+        return self.tables[table_id]
+
+    # --- 批量模式 ---
+    def run_rounds(self, rounds_per_table: int, *, workers: int = 1) -> Dict:
+        """
+        每桌连续完成 rounds_per_table 局。workers>1 时按桌分组多线程运行（受 GIL 限制，主要用于验证共享水池的并发正确性）。
+        """
+        self.started_at = time.perf_counter()
+        tables = list(self.tables.values())
+        if workers <= 1:
+            for _ in range(rounds_per_table):
+                for table in tables:
+                    table.play_round()
+        else:
+            def run_group(group):
+                for _ in range(rounds_per_table):
+                    for table in group:
+                        table.play_round()
+
+            groups = [tables[i::workers] for i in range(workers)]
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for future in [pool.submit(run_group, g) for g in groups if g]:
+                    future.result()
+        return self.stats()
+
+    # --- 实时模式 ---
+    async def _run_table(self, table: GameTable, offset: float):
+        await asyncio.sleep(offset)
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while not self._stop.is_set():
+            try:
+                table.advance()
+            except Exception as exc:  # 单桌异常不影响其它桌
+                table.error = exc
+                return
+            next_tick += 1.0 / self.speed
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+
+    async def run_realtime(self, duration: Optional[float] = None, speed: float = 1.0):
+        """按倍速实时推进全部桌子；duration 秒后停止（None 为直到 stop()）"""
+        self.speed = speed
+        self._stop = asyncio.Event()
+        self.started_at = time.perf_counter()
+        interval = 1.0 / speed
+        n = max(len(self.tables), 1)
+        tasks = [
+            asyncio.create_task(self._run_table(table, interval * i / n))  # ✅ 错峰：各桌 tick 均匀分布在一拍内
+            for i, table in enumerate(self.tables.values())
+        ]
+        if duration is not None:
+            await asyncio.sleep(duration)
+            self._stop.set()
+        await asyncio.gather(*tasks)
+
+    def start(self, speed: float = 1.0):
+        """在后台线程中运行实时模式（Streamlit 观战使用）"""
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_until_complete,
+            args=(self.run_realtime(None, speed),),
+            name="table-manager",
+            daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        if self._loop is not None and self._stop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # --- 统计 ---
+    def stats(self) -> Dict:
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        total_rounds = sum(t.rounds_played for t in self.tables.values())
+        per_table = []
+        for table in self.tables.values():
+            latencies = np.array(list(table.tick_latencies_ms))
+            per_table.append({
+                "table_id": table.table_id,
+                "round_id": table.state["round_id"],
+                "rounds": table.rounds_played,
+                "tick_p50_ms": float(np.percentile(latencies, 50)) if latencies.size else 0.0,
+                "tick_p99_ms": float(np.percentile(latencies, 99)) if latencies.size else 0.0,
+                "error": repr(table.error) if table.error else None,
+            })
+        all_latencies = np.concatenate([np.array(list(t.tick_latencies_ms)) for t in self.tables.values()] or [np.zeros(0)])
+        return {
+            "tables": len(self.tables),
+            "elapsed_sec": elapsed,
+            "total_rounds": total_rounds,
+            "rounds_per_sec": total_rounds / elapsed if elapsed > 0 else 0.0,
+            "tick_p50_ms": float(np.percentile(all_latencies, 50)) if all_latencies.size else 0.0,
+            "tick_p99_ms": float(np.percentile(all_latencies, 99)) if all_latencies.size else 0.0,
+            "pool_value": self.platform_pool.get_pool_value(),
+            "rtp_target": self.platform_pool.get_current_rtp_target(),
+            "per_table": per_table,
+        }
+
+
+def format_stats(stats: Dict) -> str:
+    lines = [
+        f"桌数：{stats['tables']}，总局数：{stats['total_rounds']:,}，耗时 {stats['elapsed_sec']:.2f}s，"
+        f"全服吞吐：{stats['rounds_per_sec']:,.1f} 局/秒",
+        f"每桌延迟：P50 {stats['tick_p50_ms']:.3f}ms，P99 {stats['tick_p99_ms']:.3f}ms",
+        f"共享水池：{stats['pool_value']:,.0f}，当前目标RTP：{stats['rtp_target'] * 100:.1f}%",
+    ]
+    slowest = sorted(stats["per_table"], key=lambda t: t["tick_p99_ms"], reverse=True)[:5]
+    lines.append("P99 最慢的桌：" + "，".join(f"#{t['table_id']}={t['tick_p99_ms']:.2f}ms" for t in slowest))
+    errors = [t for t in stats["per_table"] if t["error"]]
+    if errors:
+        lines.append("异常桌：" + "，".join(f"#{t['table_id']} {t['error']}" for t in errors))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多桌对局服务")
+    parser.add_argument("--tables", type=int, default=100, help="桌数")
+    parser.add_argument("--players", type=int, default=200, help="每桌玩家数")
+    parser.add_argument("--rounds", type=int, default=20, help="批量模式下每桌局数")
+    parser.add_argument("--workers", type=int, default=1, help="批量模式线程数")
+    parser.add_argument("--realtime", type=float, default=None, help="实时模式运行秒数（指定后忽略 --rounds）")
+    parser.add_argument("--speed", type=float, default=1.0, help="实时模式倍速")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    args = parser.parse_args(argv)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+        np.random.seed(args.seed)
+    manager = TableManager(players_per_table=args.players, seed=args.seed)
+    manager.add_tables(args.tables)
+    if args.realtime is not None:
+        asyncio.run(manager.run_realtime(args.realtime, args.speed))
+        stats = manager.stats()
+    else:
+        stats = manager.run_rounds(args.rounds, workers=args.workers)
+    print(format_stats(stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
 import streamlit as st
-from config import ROUND_TOTAL_DURATION, BETTING_DURATION, WAITING_DURATION
+from bet_import import open_bet_stream
+from game_round_controller import begin_round
+from round_engine import RoundEngineWorker, ENGINE_STATE_KEYS
+from table_manager import TableManager
 
 def handle_new_round():
     """
@@ -9,14 +12,7 @@ def handle_new_round():
         st.session_state.round_id += 1
     else:
         st.session_state.has_started = True  # 首次点击不 +1，标记为已开始
-    st.session_state.time_to_next_round = ROUND_TOTAL_DURATION
-    st.session_state.countdown_bet = BETTING_DURATION
-    st.session_state.countdown_result = WAITING_DURATION
-    st.session_state.current_bets = {}
-    st.session_state.final_outcome = None
-    st.session_state.forced_outcome = None
-    st.session_state.structure_result_cache = None
-    st.session_state.running = True
+    begin_round(st.session_state)
 
     # ✅ 将当前控件参数快照记录为当前局所用值
     st.session_state._active_rtp = st.session_state.target_rtp
@@ -27,15 +23,87 @@ def handle_imported_round(imported_bets):
     处理点击“导入下一局”按钮，加载外部下注数据，重置状态。
     """
     st.session_state.round_id += 1
-    st.session_state.time_to_next_round = ROUND_TOTAL_DURATION
-    st.session_state.countdown_bet = BETTING_DURATION
-    st.session_state.countdown_result = WAITING_DURATION
-    st.session_state.current_bets = imported_bets
-    st.session_state.final_outcome = None
-    st.session_state.forced_outcome = None
-    st.session_state.structure_result_cache = None
-    st.session_state.running = True
+    begin_round(st.session_state, imported_bets)
 
     # ✅ 同样记录参数快照
     st.session_state._active_rtp = st.session_state.target_rtp
     st.session_state._active_confidence = st.session_state.confidence_level
+
+def handle_import_next(uploaded_file, engine=None):
+    """
+    处理点击“读取下一局下注数据”：从上传文件的逐局读取器取出下一局并开局（后台引擎模式下转交引擎）。
+    读取器按文件缓存在 session_state 中，后台线程预读后续局；换文件或 restart_import() 后重新打开。
+    返回是否成功导入一局。
+    """
+    file_key = (uploaded_file.name, uploaded_file.size, getattr(uploaded_file, "file_id", None))
+    importer = st.session_state.get("bet_importer")
+    if importer is None or st.session_state.get("_bet_import_key") != file_key:
+        if importer is not None:
+            importer.close(timeout=5.0)  # 同一文件对象重读前等预读线程退出
+        uploaded_file.seek(0)
+        importer = st.session_state.bet_importer = open_bet_stream(uploaded_file, uploaded_file.name)
+        st.session_state._bet_import_key = file_key
+
+    try:
+        item = importer.next_round()
+    except Exception as exc:
+        st.session_state.import_status = f"读取失败：{exc}"
+        return False
+    if item is None:
+        st.session_state.import_status = f"文件已读完（共 {importer.rounds_read} 局），可从头重新读取"
+        return False
+
+    source_round_id, imported_bets = item
+    st.session_state.import_status = f"已导入文件第 {source_round_id} 局（{len(imported_bets)} 名玩家，第 {importer.rounds_read} 局）"
+    if engine is not None:
+        engine.import_round(imported_bets)
+    else:
+        handle_imported_round(imported_bets)
+    return True
+
+def restart_import():
+    """从头重新读取当前上传文件：关闭读取器，下一次“读取下一局”时从文件第一局开始"""
+    importer = st.session_state.get("bet_importer")
+    if importer is not None:
+        importer.close(timeout=5.0)
+    st.session_state.bet_importer = None
+    st.session_state._bet_import_key = None
+    st.session_state.import_status = "已重置读取位置，下一次从文件第一局开始"
+
+def sync_background_engine(enabled):
+    """
+    开启后台引擎：将对局状态移交给工作线程（页面此后只读快照）；
+    关闭时停止线程，并把引擎状态写回 session_state；线程未能及时退出时保留引擎，下次调用再交还。返回当前引擎或 None。
+    """
+    engine = st.session_state.get("engine")
+    if enabled and engine is None:
+        state = {key: st.session_state[key] for key in ENGINE_STATE_KEYS if key in st.session_state}
+        engine = RoundEngineWorker(state).start()
+        st.session_state.engine = engine
+    elif not enabled and engine is not None:
+        state = engine.stop()
+        if state is None:
+            # ✅ 工作线程本拍尚未结束：保留引擎（页面继续读快照），下次刷新再交还，避免两个线程同时改写状态
+            return engine
+        for key in ENGINE_STATE_KEYS:
+            if key in state and key not in ("confidence_level", "debug_speed", "auto_simulate", "decision_budget_ms"):
+                st.session_state[key] = state[key]  # 控件绑定的参数以页面为准
+        st.session_state.engine = None
+        engine = None
+    return engine
+
+def sync_engine_params(engine, snapshot):
+    """将页面控件参数（倍速、置信度、自动开局、决策预算）的变化转发给后台引擎"""
+    if st.session_state.debug_speed != snapshot["debug_speed"]:
+        engine.set_speed(st.session_state.debug_speed)
+    if st.session_state.confidence_level != snapshot["confidence_level"]:
+        engine.set_confidence(st.session_state.confidence_level)
+    if st.session_state.get("auto_simulate", False) != snapshot["auto_simulate"]:
+        engine.set_auto(st.session_state.get("auto_simulate", False))
+    if st.session_state.decision_budget_ms != snapshot["decision_budget_ms"]:
+        engine.set_decision_budget(st.session_state.decision_budget_ms)
+
+@st.cache_resource
+def get_table_manager():
+    """进程内唯一的多桌服务（所有页面会话共享），由侧边栏面板启动"""
+    return TableManager()
@@ -1,11 +1,16 @@
 import streamlit as st
 import pandas as pd
-import altair as alt
-from config import PAYOUT_RATES, ROUND_TOTAL_DURATION, BETTING_DURATION, WAITING_DURATION, ANIMATION_DURATION
+from config import ROUND_TOTAL_DURATION, BETTING_DURATION, WAITING_DURATION, ANIMATION_DURATION
+from structure_matrix import build_structure_payout_table, compute_area_totals, structure_index
+from player_table import PlayerDetailTableCache, NUMERIC_COLUMNS
 
 
 # ✅ 渲染侧边栏（包含基础信息 + 策略参数 + 倒计时 + 模拟/导入按钮）
-def render_sidebar(round_id, online_count, betting_players, countdown_bet, countdown_result, time_to_next_round, debug_speed=1.0, ci_text=None, std_bounds=None):
+def render_sidebar(round_id, online_count, betting_players, countdown_bet, countdown_result, time_to_next_round, debug_speed=1.0, ci_text=None, std_bounds=None, pool_info=None, read_only=False, on_import_restart=None):
+    """
+    read_only=True：观战多桌服务的桌子，开局 / 导入按钮不可用（对局由服务端推进）
+    on_import_restart：“从头重新读取”按钮的回调（None 时不显示该按钮）
+    """
     st.sidebar.markdown("<h4>📋 对局基础信息</h4>", unsafe_allow_html=True)
     st.sidebar.text(f"游戏名：摩天轮")
     st.sidebar.text(f"对局数ID：{round_id}")
@@ -13,16 +18,24 @@ def render_sidebar(round_id, online_count, betting_players, countdown_bet, count
     st.sidebar.text(f"参与人数：{betting_players}")
 
     st.sidebar.markdown("<h4>🎯 策略参数配置</h4>", unsafe_allow_html=True)
-    if "platform_pool" in st.session_state:
+    # ✅ pool_info=(水池值, 目标RTP)：后台引擎模式下取自快照
+    if pool_info is None and "platform_pool" in st.session_state:
         pool = st.session_state.platform_pool
-        st.sidebar.text(f"当前水池值：{int(pool.get_pool_value()):,}")
-        st.sidebar.text(f"当前目标RTP：{pool.get_current_rtp_target() * 100:.1f}%")
+        pool_info = (pool.get_pool_value(), pool.get_current_rtp_target())
+    if pool_info is not None:
+        st.sidebar.text(f"当前水池值：{int(pool_info[0]):,}")
+        st.sidebar.text(f"当前目标RTP：{pool_info[1] * 100:.1f}%")
 
     confidence = st.sidebar.slider("📐 置信度", min_value=0.80, max_value=0.999, step=0.001, format="%.3f", value=0.95, key="confidence_level")
     if std_bounds:
         low, high = std_bounds
         st.sidebar.text(f"置信区间：{low:.3f} ~ {high:.3f}")
 
+    st.sidebar.number_input("⏳ 开奖决策预算（ms，0 为不限时）", min_value=0.0, step=10.0, key="decision_budget_ms")
+    decision_info = st.session_state.get("decision_info")
+    if decision_info:
+        st.sidebar.text(f"决策保真度：{decision_info['fidelity']}（{decision_info['elapsed_ms']:.1f}ms）")
+
     st.sidebar.markdown("<h4>⏱ 当前阶段与强控窗口</h4>", unsafe_allow_html=True)
     phase_progress_info(time_to_next_round, countdown_bet, countdown_result)
 
@@ -31,16 +44,72 @@ def render_sidebar(round_id, online_count, betting_players, countdown_bet, count
 
     col1, col2 = st.sidebar.columns([5, 1])
     with col1:
-        simulate = st.button("🚀 模拟下一局下注")
+        simulate = st.button("🚀 模拟下一局下注", disabled=read_only)
     with col2:
         auto_simulate = st.checkbox("自动", key="auto_simulate", value=st.session_state.get("auto_simulate", False))    
 
-    uploaded_file = st.sidebar.file_uploader("📥 导入Excel下注文件", type=["xls", "xlsx"])
-    import_next = st.sidebar.button("📄 读取下一局下注数据")
+    uploaded_file = st.sidebar.file_uploader("📥 导入下注文件（Excel / CSV / Parquet）", type=["xlsx", "csv", "parquet"])
+    import_next = st.sidebar.button("📄 读取下一局下注数据", disabled=uploaded_file is None or read_only)
+    if on_import_restart is not None:
+        st.sidebar.button(
+            "⏮ 从头重新读取",
+            disabled=uploaded_file is None or read_only or st.session_state.get("bet_importer") is None,
+            on_click=on_import_restart
+        )
+    import_status = st.session_state.get("import_status")
+    if uploaded_file is not None and import_status:
+        st.sidebar.text(import_status)
 
     return simulate, import_next, uploaded_file, confidence, debug_speed
 
 
+# ✅ 侧边栏阶段剖析面板：开关 + 各阶段耗时统计 + Prometheus 导出
+def render_profiler_panel(profiler):
+    st.sidebar.markdown("<h4>🩺 阶段耗时监控</h4>", unsafe_allow_html=True)
+    profiler.enabled = st.sidebar.checkbox("启用阶段剖析", value=profiler.enabled, key="profiler_enabled")
+    if not profiler.enabled and not profiler.samples:
+        return
+
+    summary = profiler.summary()
+    if summary:
+        df = pd.DataFrame(summary)[["stage", "count", "wall_p50_ms", "wall_p99_ms", "cpu_mean_ms", "alloc_blocks_mean", "bettors_last"]]
+        df.columns = ["阶段", "调用", "P50(ms)", "P99(ms)", "CPU(ms)", "净存活块", "下注人数"]
+        st.sidebar.dataframe(df.round(3), hide_index=True, use_container_width=True)
+
+    col1, col2 = st.sidebar.columns(2)
+    with col1:
+        st.download_button("⬇️ Prometheus", profiler.to_prometheus(), file_name="stage_metrics.prom", mime="text/plain")
+    with col2:
+        if st.button("清空统计"):
+            profiler.reset()
+
+
+# ✅ 侧边栏多桌服务面板：启动服务 + 全服统计 + 选择观战桌号（None 为本地对局）
+def render_table_server_panel(manager):
+    st.sidebar.markdown("<h4>🗂 多桌服务</h4>", unsafe_allow_html=True)
+    if not manager.running:
+        col1, col2 = st.sidebar.columns(2)
+        with col1:
+            num_tables = st.number_input("桌数", min_value=1, max_value=1000, value=8, step=1, key="server_tables")
+        with col2:
+            speed = st.number_input("倍速", min_value=0.1, max_value=10.0, value=1.0, step=0.5, key="server_speed")
+        if st.sidebar.button("▶️ 启动多桌服务"):
+            manager.add_tables(max(0, int(num_tables) - len(manager.tables)))
+            manager.start(speed)
+            st.rerun()
+        return None
+
+    stats = manager.stats()
+    st.sidebar.text(f"桌数：{stats['tables']}，全服 {stats['rounds_per_sec']:.1f} 局/秒")
+    st.sidebar.text(f"每桌 tick：P50 {stats['tick_p50_ms']:.2f}ms，P99 {stats['tick_p99_ms']:.2f}ms")
+    options = ["本地对局"] + list(manager.tables)
+    selected = st.sidebar.selectbox(
+        "👀 观战桌号", options, key="attached_table",
+        format_func=lambda t: t if isinstance(t, str) else f"第 {t} 桌"
+    )
+    return None if isinstance(selected, str) else selected
+
+
 def phase_progress_info(time_to_next_round, countdown_bet, countdown_result):
     """
     统一处理当前阶段与进度展示逻辑，避免 render_sidebar 过长。
@@ -75,6 +144,7 @@ def render_bet_bar_chart(structure_sums, highlight_areas, forced_areas=None):
             "推荐" if x in highlight_areas else "默认")
     )
     color_map = {"强控": "crimson", "推荐": "green", "默认": "steelblue"}
+    import altair as alt  # 首次绘图时才加载
     chart = alt.Chart(df).mark_bar().encode(
         x=alt.X("区域:N", axis=alt.Axis(labelAngle=0, title=None)),
         y=alt.Y("下注总额:Q"),
@@ -106,10 +176,18 @@ def render_final_structure(outcome, forced_flag):
 
 
 # ✅ 渲染控奖结构模拟结果表格（高亮推荐 + 红框强控）
-def render_structure_table(table_df, current_bets, forced_outcome, time_to_next_round):
+def render_structure_table(table_df, current_bets, forced_outcome, time_to_next_round, payout_table=None, on_force=None, allow_force=True):
+    """
+    on_force(outcome | None)：强控回调（后台引擎模式），缺省直接写入 session_state
+    allow_force=False：只读观战，不渲染强控按钮
+    """
     if table_df.empty:
         return
 
+    # ✅ 结构派奖表：每局只算一次，缺省时按当前下注现算
+    if payout_table is None:
+        payout_table = build_structure_payout_table(compute_area_totals(current_bets))
+
     st.markdown("<h4 style='margin-top: 0.8rem; margin-bottom: 0.2rem'>🎯 控奖结构模拟结果</h4>", unsafe_allow_html=True)
     headers = ["区域", "累计投注", "预计开奖", "系统盈亏", "RTP_STD", "符合预期", "态势STD", "强制开奖"]
     header_cols = st.columns(len(headers), gap="small")
@@ -122,15 +200,10 @@ def render_structure_table(table_df, current_bets, forced_outcome, time_to_next_
         is_forced = forced_key is not None and row["winning_areas"] == forced_key
         cols = st.columns(len(headers), gap="small")
         win_areas = ",".join(map(str, row["winning_areas"]))
-        est_award = 0
-        related_bet = 0
-        total_bet = sum(sum(bets.values()) for bets in current_bets.values())
-        for bets in current_bets.values():
-            for a, v in bets.items():
-                if a in row["winning_areas"]:
-                    related_bet += v
-                    est_award += v * PAYOUT_RATES[a]
-        profit = total_bet - est_award
+        s = structure_index(row["winning_areas"])
+        related_bet = payout_table["related_bet"][s]
+        est_award = payout_table["payout"][s]
+        profit = payout_table["profit"][s]
         std = row["std"]
         memory_effect = row.get("memory_effect", 0.0)
         within = row["within_confidence"]
@@ -143,96 +216,60 @@ def render_structure_table(table_df, current_bets, forced_outcome, time_to_next_
         cols[4].markdown(f"<div style='{highlight_style}'>{std:.2f}</div>", unsafe_allow_html=True)
         cols[6].markdown(f"<div style='{highlight_style}'>{'√' if within else '×'}</div>", unsafe_allow_html=True)
         cols[5].markdown(f"<div style='{highlight_style}'>{memory_effect:.2f}</div>", unsafe_allow_html=True)
-        if time_to_next_round > ANIMATION_DURATION:
+        if not allow_force:
+            cols[7].write("—")
+        elif time_to_next_round > ANIMATION_DURATION:
             force_btn_label = "🔴 取消" if is_forced else "确认"
             if cols[7].button(force_btn_label, key=f"force_btn_{i}"):
-                st.session_state.forced_outcome = row.to_dict() if not is_forced else None
+                forced = row.to_dict() if not is_forced else None
+                if on_force is not None:
+                    on_force(forced)
+                else:
+                    st.session_state.forced_outcome = forced
                 st.rerun()
         else:
             cols[7].write("❌")
 
-# ✅ 渲染玩家下注明细表格
-def render_player_detail_table(current_bets, stat_players):
+# ✅ 渲染玩家下注明细表格（player_table 缓存：仅重算下注变化玩家的样式；筛选 / Top-K / 分页在服务端完成，只渲染当前页）
+PLAYER_VIEW_MODES = {"全部": None, "投注额 Top-K": "bet", "RTP偏离 Top-K": "rtp_deviation", "充值 Top-K": "recharge"}
+
+def render_player_detail_table(current_bets, stat_players, player_recharges=None, page_size=50):
+    """player_recharges：{pid: 充值额度}（后台引擎快照提供），缺省取 session_state.sim_players（导入局的新玩家记为 0）"""
+    if player_recharges is None:
+        sim_players = st.session_state.sim_players
+        player_recharges = {pid: sim_players[pid].recharge_amount for pid in current_bets if pid in sim_players}
     st.markdown("<h4>👤 玩家下注明细</h4>", unsafe_allow_html=True)
-    records = []
-    index = 1
-    for pid in sorted(current_bets.keys()):
-        bets = current_bets[pid]
-        total = sum(bets.values())
-        stats = stat_players[pid]
-        latest_rtp = getattr(stats, 'rtp', lambda: 0)()  # 避免异常，默认0
-        row = {
-            "序号": index,
-            "UID": pid.replace('player_', ''),
-            "总投注": total,
-            "当前RTP": f"{latest_rtp * 100:.1f}%",
-            "充值额度": st.session_state.sim_players[pid].recharge_amount
-        }
-        for a in range(1, 9):
-            row[f"结构{a}"] = bets.get(a, 0)
-        row["结构9"] = sum(bets.get(a, 0) for a in range(1, 5))
-        row["结构10"] = sum(bets.get(a, 0) for a in range(5, 9))
-        records.append(row)
-        index += 1
-
-    df = pd.DataFrame(records)
-    numeric_cols = df.select_dtypes(include=['number']).columns
-    df[numeric_cols] = df[numeric_cols].round(0).astype(int)
-
-    profit_colors, loss_colors, yellow_colors = [], [], []
-
-    for row in df.itertuples():
-        bets = {f"结构{i}": getattr(row, f"结构{i}") for i in range(1, 11)}
-        total = getattr(row, "总投注")
-
-        profit_map = {}
-        for i in range(1, 11):
-            hit_areas = (
-                [i] if i <= 8 else
-                list(range(1, 5)) if i == 9 else
-                list(range(5, 9))
-            )
-            payout = sum(bets.get(f"结构{a}", 0) * PAYOUT_RATES.get(a, 0) for a in hit_areas)
-            profit_map[f"结构{i}"] = payout - total
-
-        max_profit = max(profit_map.values())
-        min_profit = min(profit_map.values())
-
-        rtp_map = {}
-        for i in range(1, 11):
-            hit_areas = (
-                [i] if i <= 8 else
-                list(range(1, 5)) if i == 9 else
-                list(range(5, 9))
-            )
-            payout = sum(bets.get(f"结构{a}", 0) * PAYOUT_RATES.get(a, 0) for a in hit_areas)
-            rtp = payout / total if total > 0 else 0
-            rtp_map[f"结构{i}"] = abs(rtp - 1)
-
-        min_rtp_diff = min(rtp_map.values())
-
-        colors_profit = ["" for _ in df.columns]
-        colors_loss = ["" for _ in df.columns]
-        colors_yellow = ["" for _ in df.columns]
-
-        for i in range(1, 11):
-            if profit_map[f"结构{i}"] == max_profit:
-                colors_profit[df.columns.get_loc(f"结构{i}")] = "background-color: #d4edda"
-            if profit_map[f"结构{i}"] == min_profit:
-                colors_loss[df.columns.get_loc(f"结构{i}")] = "background-color: #f8d7da"
-            if abs(rtp_map[f"结构{i}"] - min_rtp_diff) < 1e-8:
-                colors_yellow[df.columns.get_loc(f"结构{i}")] = "background-color: #fff3cd"
-
-        profit_colors.append(colors_profit)
-        loss_colors.append(colors_loss)
-        yellow_colors.append(colors_yellow)
-
-    styled_df = df.style.format({col: "{:,.0f}" for col in numeric_cols})
-    styled_df = styled_df.apply(lambda _: profit_colors.pop(0), axis=1)
-    styled_df = styled_df.apply(lambda _: loss_colors.pop(0), axis=1)
-    styled_df = styled_df.apply(lambda _: yellow_colors.pop(0), axis=1)
-    
-    st.dataframe(styled_df, use_container_width=True, hide_index=True, height=930)
+
+    cache = st.session_state.get("player_table_cache")
+    if cache is None:
+        cache = st.session_state.player_table_cache = PlayerDetailTableCache()
+    cache.update(current_bets, stat_players, player_recharges)
+
+    col1, col2, col3, col4 = st.columns([3, 2, 3, 2])
+    with col1:
+        mode = st.selectbox("视图", list(PLAYER_VIEW_MODES), key="player_view_mode")
+    with col2:
+        top_k = st.number_input("K", min_value=1, max_value=10_000, value=20, step=10, key="player_view_k",
+                                disabled=PLAYER_VIEW_MODES[mode] is None)
+    with col3:
+        search = st.text_input("搜索 UID", key="player_view_search")
+    with col4:
+        page = st.number_input("页码", min_value=1, value=1, step=1, key="player_view_page")
+
+    sort_by = PLAYER_VIEW_MODES[mode]
+    view = cache.view(
+        search=search.strip(),
+        sort_by=sort_by,
+        top_k=int(top_k) if sort_by is not None else None,
+        page=int(page),
+        page_size=page_size
+    )
+
+    styles = view["styles"]
+    styled_df = view["frame"].style.format({col: "{:,.0f}" for col in NUMERIC_COLUMNS})
+    styled_df = styled_df.apply(lambda _: styles, axis=None)
+    st.dataframe(styled_df, use_container_width=True, hide_index=True)
+    st.caption(f"共 {view['total']:,} 名玩家，第 {view['page']} / {view['pages']} 页")
 
 def render_final_outcome_reason(outcome: dict, all_structures: list[dict], std_bounds: tuple[float, float]):
     """